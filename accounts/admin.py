@@ -9,7 +9,8 @@ class MembershipTierAdmin(admin.ModelAdmin):
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'role', 'membership_tier', 'is_active_member', 'is_staff')
     fieldsets = UserAdmin.fieldsets + (
-        ('Library Profile', {'fields': ('role', 'membership_tier', 'is_active_member', 'phone_number', 'address', 'profile_image')}),
+        ('Library Profile', {'fields': ('role', 'membership_tier', 'is_active_member', 'phone_number', 'address', 'profile_image', 'outstanding_balance')}),
     )
+    readonly_fields = ('outstanding_balance',)
 
 admin.site.register(User, CustomUserAdmin)
\ No newline at end of file
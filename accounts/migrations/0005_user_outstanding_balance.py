@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_user_user_username_lower_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="outstanding_balance",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
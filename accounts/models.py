@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
+from . import tiers
 
 class MembershipTier(models.Model):
     name = models.CharField(max_length=100)
@@ -12,6 +14,13 @@ class MembershipTier(models.Model):
     def __str__(self):
         return self.name
 
+class TierPolicyVersion(models.Model):
+    """Single-row version token replaced on every tier change; see accounts/tiers.py."""
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Tier policies @ {self.version}"
+
 class User(AbstractUser):
     class Role(models.TextChoices):
         ADMIN = "ADMIN", "Admin"
@@ -24,15 +33,25 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     address = models.TextField(blank=True, null=True)
     profile_image = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    # Running total of the FineTransaction ledger, maintained by circulation.fines
+    outstanding_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive prefix lookups from the circulation desk typeahead
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+            models.Index(Lower('first_name'), name='user_first_name_lower_idx'),
+            models.Index(Lower('last_name'), name='user_last_name_lower_idx'),
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if self.is_superuser:
             self.role = self.Role.ADMIN
         
         # Assign default tier to new members if not set
-        if not self.membership_tier and self.role == self.Role.MEMBER:
-            basic_tier = MembershipTier.objects.filter(name="Basic").first()
-            if basic_tier:
-                self.membership_tier = basic_tier
+        if self.membership_tier_id is None and self.role == self.Role.MEMBER:
+            # Resolved from the tier policy cache, so saving a member runs no tier query
+            self.membership_tier_id = tiers.default_tier_id()
                 
         super().save(*args, **kwargs)
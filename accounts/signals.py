@@ -0,0 +1,16 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from core import thumbnails
+from .models import MembershipTier, User
+from . import tiers
+
+# --- Avatar Thumbnails ---
+
+thumbnails.register(User, 'profile_image', ['avatar'])
+
+# --- Tier Policy Cache ---
+
+@receiver(post_save, sender=MembershipTier)
+@receiver(post_delete, sender=MembershipTier)
+def invalidate_tier_policies(sender, instance, **kwargs):
+    tiers.bump()
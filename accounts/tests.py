@@ -1,3 +1,86 @@
+from unittest import mock
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from books.models import Author, Book
+from circulation import services
+from .models import MembershipTier
+from . import tiers
 
-# Create your tests here.
+User = get_user_model()
+
+class TierPolicyCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.basic = MembershipTier.objects.create(name="Basic", max_books=1, borrow_duration_days=7, max_renewals=0)
+        self.premium = MembershipTier.objects.create(name="Premium", max_books=5, borrow_duration_days=21, max_renewals=2)
+        author = Author.objects.create(name="Test Author")
+        self.books = [
+            Book.objects.create(title=f"Book {i}", isbn=f"978000000040{i}", author=author, publication_date="2020-01-01")
+            for i in range(2)
+        ]
+
+    def tier_queries(self, queries):
+        return [query['sql'] for query in queries if 'accounts_membershiptier' in query['sql']]
+
+    def test_new_members_get_the_default_tier_without_a_query(self):
+        tiers.default_tier_id()
+        with CaptureQueriesContext(connection) as queries:
+            member = User.objects.create_user(username='member', password='password')
+        self.assertEqual(member.membership_tier_id, self.basic.pk)
+        self.assertEqual(self.tier_queries(queries), [])
+        staff = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.assertIsNone(staff.membership_tier_id)
+
+    def test_circulation_runs_no_tier_queries(self):
+        member = User.objects.create_user(username='member', password='password', membership_tier=self.premium)
+        tiers.policy(self.premium.pk)
+        with CaptureQueriesContext(connection) as queries:
+            record = services.issue_book(member, self.books[0])
+            services.renew_loan(record)
+            services.issue_books(member, [self.books[1]])
+        self.assertEqual(self.tier_queries(queries), [])
+        record.refresh_from_db()
+        self.assertEqual(record.renewal_count, 1)
+
+    def test_tier_changes_apply_at_once(self):
+        member = User.objects.create_user(username='member', password='password')
+        services.issue_book(member, self.books[0])
+        with self.assertRaises(services.CirculationError):
+            services.issue_book(member, self.books[1])
+
+        self.basic.max_books = 2
+        self.basic.save()
+        services.issue_book(member, self.books[1])
+
+    def test_changes_reach_a_process_with_its_own_cache(self):
+        other = {'cache': LocMemCache('other-process', {}), 'table': (None, {}, None)}
+
+        def in_other_process(lookup):
+            with mock.patch.object(tiers, 'cache', other['cache']), mock.patch.object(tiers, '_table', other['table']):
+                result = lookup()
+                other['table'] = tiers._table
+            return result
+
+        self.assertEqual(in_other_process(lambda: tiers.policy(self.premium.pk).max_books), 5)
+        self.premium.max_books = 9
+        self.premium.save()
+        self.assertEqual(tiers.policy(self.premium.pk).max_books, 9)
+
+        # The other process re-reads the token once its cached copy runs out
+        self.assertEqual(in_other_process(lambda: tiers.policy(self.premium.pk).max_books), 5)
+        other['cache'].clear()
+        self.assertEqual(in_other_process(lambda: tiers.policy(self.premium.pk).max_books), 9)
+
+    def test_reloads_when_another_process_bumps_the_version(self):
+        self.assertEqual(tiers.policy(self.premium.pk).max_books, 5)
+        # A queryset.update() sends no signal; the version token is what other processes see
+        MembershipTier.objects.filter(pk=self.premium.pk).update(max_books=9)
+        self.assertEqual(tiers.policy(self.premium.pk).max_books, 5)
+        cache.set(tiers.VERSION_KEY, 'elsewhere', None)
+        with self.assertNumQueries(1):
+            self.assertEqual(tiers.policy(self.premium.pk).max_books, 9)
+            self.assertEqual(tiers.policy(self.basic.pk).max_books, 1)
@@ -0,0 +1,87 @@
+"""
+In-process cache of membership tier policies.
+
+Circulation checks a member's borrow limit, renewal limit and loan period on
+every issue and renewal, and new members are given the default tier on
+save; tiers themselves change a few times a year. All tiers are loaded in
+one query into a per-process table, stamped with the version token held in
+the database (TierPolicyVersion). Each process keeps the token it last
+read in its cache for VERSION_TTL seconds, so a lookup is usually a cache
+read, not a query, and reloads the table only when the token has changed.
+
+Saving or deleting a tier replaces the token in the same transaction,
+so every process, including cron commands and workers on other hosts,
+applies the change within VERSION_TTL seconds whatever cache backend it
+runs with. The writing process drops its cached token at once and again
+after commit, so it sees its own change straight away. The receivers in
+accounts/signals.py do this for MembershipTier saves and deletes; code that
+changes tiers with queryset.update() calls bump() itself.
+"""
+import time
+from collections import namedtuple
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'tier-policy:version'
+# Seconds a process trusts the token it last read; the longest another process runs on old policies
+VERSION_TTL = 5
+DEFAULT_TIER_NAME = 'Basic'
+
+TierPolicy = namedtuple('TierPolicy', 'id name max_books borrow_duration_days max_renewals is_active')
+
+# (version, {tier_id: TierPolicy}, default tier id); replaced whole, never mutated
+_table = (None, {}, None)
+
+
+def _new_token():
+    # Never repeats, even if the row is deleted and created again
+    return time.time_ns()
+
+
+def _current_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        from .models import TierPolicyVersion
+        version = TierPolicyVersion.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+        cache.set(VERSION_KEY, version, VERSION_TTL)
+    return version
+
+
+def _load():
+    global _table
+    version = _current_version()
+    if _table[0] != version:
+        from .models import MembershipTier
+        policies = {
+            row[0]: TierPolicy(*row)
+            for row in MembershipTier.objects.values_list(*TierPolicy._fields)
+        }
+        default = min(
+            (policy.id for policy in policies.values() if policy.name == DEFAULT_TIER_NAME), default=None
+        )
+        _table = (version, policies, default)
+    return _table
+
+
+def policy(tier_id):
+    """The TierPolicy of tier `tier_id`, or None for members without a tier."""
+    if tier_id is None:
+        return None
+    return _load()[1].get(tier_id)
+
+
+def default_tier_id():
+    """The id of the tier new members are put on, or None if there is none."""
+    return _load()[2]
+
+
+def bump():
+    """Make every process reload tier policies once the current transaction commits."""
+    from .models import TierPolicyVersion
+    token = _new_token()
+    if not TierPolicyVersion.objects.filter(pk=1).update(version=token):
+        TierPolicyVersion.objects.update_or_create(pk=1, defaults={'version': token})
+    # This process reads the new token at once, and again after commit in case
+    # another thread cached the old one meanwhile
+    cache.delete(VERSION_KEY)
+    transaction.on_commit(lambda: cache.delete(VERSION_KEY))
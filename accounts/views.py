@@ -3,14 +3,15 @@ from django.contrib.auth import login
 from django.contrib.auth.views import LoginView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import TemplateView, ListView, View, UpdateView, CreateView, DetailView
-from django.db.models import Sum, Q, Value, DecimalField
-from django.db.models.functions import Coalesce
+from django.db.models import Q
 from django.contrib import messages
 from django.urls import reverse, reverse_lazy
-from decimal import Decimal
 from .forms import MemberRegistrationForm, UserProfileForm, LibrarianCreationForm
 from .models import User, MembershipTier
-from circulation.models import BorrowRecord
+from circulation.models import BorrowRecord, FineTransaction
+from circulation import counters, fines
+from analytics import trending
+from core.pagination import CursorPaginationMixin
 
 class LibrarianRequiredMixin(UserPassesTestMixin):
     def test_func(self):
@@ -49,17 +50,17 @@ class CreateMemberView(LoginRequiredMixin, LibrarianRequiredMixin, CreateView):
         messages.success(self.request, f"Member {form.instance.username} created successfully.")
         return super().form_valid(form)
 
-class MemberManagementView(LoginRequiredMixin, LibrarianRequiredMixin, ListView):
+class MemberManagementView(LoginRequiredMixin, LibrarianRequiredMixin, CursorPaginationMixin, ListView):
     model = User
     template_name = 'accounts/member_list.html'
     context_object_name = 'members'
     paginate_by = 10
+    cursor_ordering = ('username', 'pk')
+    cursor_approximate_count = True
 
     def get_queryset(self):
-        # Base queryset: exclude Admins, annotate with total fines
-        queryset = User.objects.exclude(role='ADMIN').annotate(
-            total_fines=Coalesce(Sum('borrowed_books__fine_amount'), Value(Decimal('0.00'), output_field=DecimalField()))
-        ).order_by('username')
+        # Base queryset: exclude Admins
+        queryset = User.objects.exclude(role='ADMIN').order_by('username')
         
         # Restriction: Librarians can ONLY see Members
         if self.request.user.role == 'LIBRARIAN':
@@ -105,7 +106,8 @@ class MemberDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
         context['borrow_history'] = BorrowRecord.objects.filter(user=member).order_by('-issued_date')
         
         # Add Fines
-        context['total_fines'] = BorrowRecord.objects.filter(user=member).aggregate(Sum('fine_amount'))['fine_amount__sum'] or 0.00
+        context['total_fines'] = member.outstanding_balance
+        context['fine_history'] = member.fine_transactions.select_related('borrow_record__book', 'created_by').order_by('-created_at')[:20]
         
         return context
 
@@ -140,17 +142,17 @@ class ChangeMembershipView(LoginRequiredMixin, LibrarianRequiredMixin, View):
 class ClearFinesView(LoginRequiredMixin, LibrarianRequiredMixin, View):
     def post(self, request, pk):
         member = get_object_or_404(User, pk=pk)
-        
-        # Calculate amount to be cleared for logging (optional, could add Transaction model later)
-        total_fines = BorrowRecord.objects.filter(user=member).aggregate(Sum('fine_amount'))['fine_amount__sum'] or 0.00
-        
-        if total_fines > 0:
-            # Clear fines
-            BorrowRecord.objects.filter(user=member).update(fine_amount=0.00)
-            messages.success(request, f"Cleared ${total_fines} in fines for {member.username}.")
+
+        # Settle the whole balance as a payment (or a waiver), keeping the loans' fine history
+        kind = FineTransaction.Kind.WAIVER if request.POST.get('action') == 'waive' else FineTransaction.Kind.PAYMENT
+        entry = fines.settle(member, kind, by=request.user)
+
+        if entry:
+            verb = "Waived" if kind == FineTransaction.Kind.WAIVER else "Cleared"
+            messages.success(request, f"{verb} ₹{entry.amount} in fines for {member.username}.")
         else:
             messages.info(request, f"{member.username} has no outstanding fines.")
-            
+
         return redirect('member_list')
 
 class UserProfileView(LoginRequiredMixin, UpdateView):
@@ -176,20 +178,18 @@ class HomeView(TemplateView):
         if user.is_authenticated:
             if user.role == 'MEMBER':
                 # Stats for Member
-                active_borrows = BorrowRecord.objects.filter(user=user, status='ISSUED')
-                context['active_loans_count'] = active_borrows.count()
-                context['total_fines'] = BorrowRecord.objects.filter(user=user).aggregate(Sum('fine_amount'))['fine_amount__sum'] or 0.00
-                context['overdue_loans_count'] = 0
-                for record in active_borrows:
-                    if record.is_overdue:
-                        context['overdue_loans_count'] += 1
+                counts = counters.loan_counts(user_id=user.pk)
+                context['active_loans_count'] = counts['active']
+                context['total_fines'] = user.outstanding_balance
+                context['overdue_loans_count'] = counts['overdue']
 
             elif user.role in ['LIBRARIAN', 'ADMIN']:
                 # Stats for Librarian/Admin
-                context['total_active_loans'] = BorrowRecord.objects.filter(status='ISSUED').count()
-                all_issued = BorrowRecord.objects.filter(status='ISSUED')
-                context['total_overdue'] = sum(1 for r in all_issued if r.is_overdue)
+                counts = counters.staff_counts()
+                context['total_active_loans'] = counts['active']
+                context['total_overdue'] = counts['overdue']
 
+        context['trending_books'] = trending.top(7, limit=5)
         return context
 
 def register(request):
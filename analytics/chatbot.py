@@ -1,8 +1,9 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from books.models import Book
+from books.models import Book, Category
 from circulation.models import BorrowRecord
+from . import trending
 import json
 
 @csrf_exempt
@@ -47,10 +48,15 @@ def chatbot_api(request):
 
     # 3. Recommendations
     elif "recommend" in user_message or "suggestion" in user_message:
-        # Recommend top 3 popular books
-        popular = Book.objects.all()[:3]
+        # Recommend the top 3 of this month's trending list, in a category if one is named
+        category = next((c for c in Category.objects.all() if c.name.lower() in user_message), None)
+        popular = trending.top(30, category, limit=3) or trending.top(trending.ALL_TIME, category, limit=3)
         items = [f"'{b.title}' by {b.author.name}" for b in popular]
-        response_text = "I recommend checking out these popular titles:\n" + "\n".join(items)
+        if items:
+            scope = f" in {category.name}" if category else ""
+            response_text = f"I recommend checking out these popular titles{scope}:\n" + "\n".join(items)
+        else:
+            response_text = "I don't have enough borrowing history to recommend anything yet."
 
     # 4. Help / FAQ
     elif "help" in user_message or "hi" in user_message or "hello" in user_message:
@@ -0,0 +1,87 @@
+"""
+Analytics tables fed from the circulation event log.
+
+Each consumer reads only the events appended since its last run (see
+circulation.events.consume), so keeping these tables current costs time
+proportional to new activity rather than to the whole loan history.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.utils import timezone
+from books.models import Book
+from circulation import events
+from circulation.models import ConsumerOffset
+from .models import DailyCirculation, TrendingCount, TrendingWindow
+from . import trending
+
+
+def _amount(event, *names):
+    return sum((Decimal(event.data.get(name, '0')) for name in names), Decimal('0.00'))
+
+
+def daily_rollup(batch):
+    """Add the batch's issues, returns, losses and fines to each (day, book) row."""
+    deltas = {}
+    for event in batch:
+        if event.kind not in (events.Kind.ISSUED, events.Kind.RETURNED, events.Kind.LOST):
+            continue
+        key = (timezone.localdate(event.created_at), event.book_id)
+        delta = deltas.setdefault(key, {'issues': 0, 'returns': 0, 'lost': 0, 'fines': Decimal('0.00')})
+        if event.kind == events.Kind.ISSUED:
+            delta['issues'] += 1
+        elif event.kind == events.Kind.RETURNED:
+            delta['returns'] += 1
+            delta['fines'] += _amount(event, 'fine', 'paid')
+        else:
+            delta['lost'] += 1
+    if not deltas:
+        return
+
+    # consume() holds this consumer's lock, so nothing else writes these rows meanwhile
+    rows = {
+        (row.date, row.book_id): row
+        for row in DailyCirculation.objects.filter(
+            date__in={date for date, book_id in deltas}, book_id__in={book_id for date, book_id in deltas}
+        )
+    }
+    categories = dict(Book.objects.filter(pk__in={book_id for date, book_id in deltas}).values_list('pk', 'category_id'))
+    # Events outlive deleted books, whose rollup rows went with them
+    deltas = {key: delta for key, delta in deltas.items() if key[1] in categories}
+    new_rows = []
+    for (date, book_id), delta in deltas.items():
+        row = rows.get((date, book_id))
+        if row is None:
+            new_rows.append(DailyCirculation(date=date, book_id=book_id, category_id=categories.get(book_id), **delta))
+            continue
+        for field, value in delta.items():
+            setattr(row, field, getattr(row, field) + value)
+    DailyCirculation.objects.bulk_update(
+        [rows[key] for key in deltas if key in rows], ['issues', 'returns', 'lost', 'fines']
+    )
+    DailyCirculation.objects.bulk_create(new_rows)
+    trending.add({key: delta['issues'] for key, delta in deltas.items() if delta['issues']}, categories)
+
+
+CONSUMERS = {
+    'analytics.daily': daily_rollup,
+}
+
+# The tables each consumer maintains, emptied when it is rebuilt
+TABLES = {
+    # Without their TrendingWindow rows the trending counts take in all history; expire() trims them again
+    'analytics.daily': [DailyCirculation, TrendingCount, TrendingWindow],
+}
+
+
+def catch_up(names=None):
+    """Run the named consumers (all by default) over new events. Returns {name: events handled}."""
+    return {name: events.consume(name, CONSUMERS[name]) for name in names or CONSUMERS}
+
+
+def rebuild(name, batch_size=5000):
+    """Recompute consumer `name`'s table from the whole event log in one transaction."""
+    with transaction.atomic():
+        for model in TABLES[name]:
+            model.objects.all().delete()
+        ConsumerOffset.objects.filter(name=name).delete()
+        return events.consume(name, CONSUMERS[name], batch_size)
@@ -0,0 +1,189 @@
+"""
+Background report jobs.
+
+Submitting a report creates a ReportJob and returns at once; the
+run_report_jobs worker claims queued jobs and streams each report into a
+file in default_storage (MEDIA_ROOT) on a thread pool. The page polls the
+job's status and links to the file once it is ready.
+
+Jobs are keyed by a hash of their parameters. A request for a report that
+is already queued or running joins that job (a partial unique index makes
+this hold under concurrent submits), and one finished within REUSE_FOR is
+served again instead of being rerun.
+
+While a job runs, a heartbeat thread stamps its heartbeat_at every
+HEARTBEAT_EVERY, so however long a report takes, only a job whose worker
+has stopped beating is requeued. A claim is identified by its started_at:
+if the job was requeued and claimed again meanwhile, the first worker
+stops and its outcome is dropped rather than written over the new run.
+"""
+import hashlib
+import json
+import logging
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import ReportJob
+from . import exports, reports
+
+logger = logging.getLogger(__name__)
+
+Status = ReportJob.Status
+
+# Finished results are served again for this long; reports read live data
+REUSE_FOR = timedelta(hours=1)
+# A running job's worker stamps heartbeat_at this often
+HEARTBEAT_EVERY = timedelta(seconds=30)
+# A RUNNING job with no heartbeat for this long belonged to a worker that died
+STALE_AFTER = timedelta(minutes=5)
+# Jobs and their files are deleted this long after they finish
+KEEP_FOR = timedelta(days=7)
+
+
+def params_hash(report_type, export_format, start_date, end_date):
+    params = [report_type, export_format, start_date.isoformat(), end_date.isoformat()]
+    return hashlib.sha256(json.dumps(params).encode()).hexdigest()
+
+
+def submit(user, report_type, export_format, start_date, end_date, now=None):
+    """The job producing this report: a running or recent one if any, else a new one. Returns (job, created)."""
+    now = now or timezone.now()
+    digest = params_hash(report_type, export_format, start_date, end_date)
+    reusable = ReportJob.objects.filter(params_hash=digest).filter(
+        Q(status__in=[Status.PENDING, Status.RUNNING]) | Q(status=Status.DONE, finished_at__gte=now - REUSE_FOR)
+    )
+    job = reusable.order_by('-created_at').first()
+    if job:
+        return job, False
+    try:
+        with transaction.atomic():
+            return ReportJob.objects.create(
+                requested_by=user, report_type=report_type, export_format=export_format,
+                start_date=start_date, end_date=end_date, params_hash=digest,
+            ), True
+    except IntegrityError:
+        # Someone queued the same report a moment ago
+        return ReportJob.objects.get(params_hash=digest, status__in=[Status.PENDING, Status.RUNNING]), False
+
+
+def claim(limit, now=None):
+    """Mark up to `limit` of the oldest queued jobs as running for this worker and return them."""
+    now = now or timezone.now()
+    claimed = []
+    for pk in ReportJob.objects.filter(status=Status.PENDING).order_by('created_at').values_list('pk', flat=True)[:limit]:
+        # Conditional, so two workers never claim the same job
+        if ReportJob.objects.filter(pk=pk, status=Status.PENDING).update(
+            status=Status.RUNNING, started_at=now, heartbeat_at=now
+        ):
+            claimed.append(ReportJob.objects.get(pk=pk))
+    return claimed
+
+
+class Superseded(Exception):
+    """The job was requeued and claimed again while this worker was running it."""
+
+
+def _claimed(job):
+    # `job` as long as it is still running under the claim this worker was handed
+    return ReportJob.objects.filter(pk=job.pk, status=Status.RUNNING, started_at=job.started_at)
+
+
+def _beat(job, stop, lost):
+    """Stamp `job`'s heartbeat until `stop` is set; set `lost` and stop if the claim is gone."""
+    try:
+        while not stop.wait(HEARTBEAT_EVERY.total_seconds()):
+            if not _claimed(job).update(heartbeat_at=timezone.now()):
+                lost.set()
+                return
+    finally:
+        connections.close_all()
+
+
+def run(job):
+    """Write claimed `job`'s report to storage and record the outcome."""
+    rows = 0
+    stop, lost = threading.Event(), threading.Event()
+
+    def counted(iterable):
+        nonlocal rows
+        for row in iterable:
+            if lost.is_set():
+                raise Superseded
+            rows += 1
+            yield row
+
+    # Its own thread, so the heartbeat goes on during a slow query too
+    heartbeat = threading.Thread(target=_beat, args=(job, stop, lost), daemon=True)
+    heartbeat.start()
+    try:
+        report = reports.REPORTS[job.report_type]
+        chunks = exports.WRITERS[job.export_format](
+            report.export_header(), counted(report.export_rows(job.start_date, job.end_date))
+        )
+        # Spooled to a local temporary file, so memory stays flat however large the report
+        with tempfile.TemporaryFile() as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            spool.seek(0)
+            name = f"{job.report_type}_{job.start_date}_{job.end_date}.{job.export_format}"
+            job.file.save(name, File(spool, name=name), save=False)
+    except Superseded:
+        logger.warning("Report job %s was claimed by another worker; stopping", job.pk)
+        return
+    except Exception as e:
+        logger.exception("Report job %s failed", job.pk)
+        _claimed(job).update(status=Status.FAILED, error=str(e), finished_at=timezone.now())
+        return
+    finally:
+        stop.set()
+        heartbeat.join()
+    if not _claimed(job).update(status=Status.DONE, file=job.file.name, row_count=rows, finished_at=timezone.now()):
+        # Requeued while finishing; the run that now holds the job writes its own file
+        logger.warning("Report job %s was claimed by another worker; dropping its file", job.pk)
+        default_storage.delete(job.file.name)
+
+
+def _run_in_thread(job):
+    try:
+        run(job)
+    finally:
+        # Worker threads get their own connection; don't leave it open
+        connections.close_all()
+
+
+def run_pending(workers=2, now=None):
+    """Claim queued jobs and run them on `workers` threads until the queue is empty. Returns how many ran."""
+    ran, running = 0, set()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='report-jobs') as pool:
+        while True:
+            close_old_connections()
+            # Top the pool up as jobs finish, so one long report doesn't hold up the others
+            for job in claim(workers - len(running), now) if len(running) < workers else []:
+                running.add(pool.submit(_run_in_thread, job))
+            if not running:
+                return ran
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            ran += len(done)
+
+
+def requeue_stale(now=None):
+    """Put jobs whose worker stopped beating back in the queue. Returns how many were requeued."""
+    now = now or timezone.now()
+    return ReportJob.objects.filter(status=Status.RUNNING, heartbeat_at__lt=now - STALE_AFTER).update(
+        status=Status.PENDING, started_at=None, heartbeat_at=None
+    )
+
+
+def purge(now=None):
+    """Delete finished jobs older than KEEP_FOR along with their files. Returns how many were deleted."""
+    now = now or timezone.now()
+    old = ReportJob.objects.filter(status__in=[Status.DONE, Status.FAILED], finished_at__lt=now - KEEP_FOR)
+    for name in old.exclude(file='').values_list('file', flat=True):
+        default_storage.delete(name)
+    return old.delete()[0]
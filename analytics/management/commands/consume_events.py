@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+from analytics import consumers
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply circulation events appended since the last run to the analytics tables. "
+        "Each consumer resumes from its stored position, so this is cheap to run often from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumers', nargs='*', help=f"Consumers to run (default: all of {', '.join(consumers.CONSUMERS)}).")
+
+    def handle(self, *args, **options):
+        unknown = set(options['consumers']) - set(consumers.CONSUMERS)
+        if unknown:
+            raise CommandError(f"Unknown consumers: {', '.join(sorted(unknown))}.")
+        for name, handled in consumers.catch_up(options['consumers']).items():
+            self.stdout.write(self.style.SUCCESS(f"{name}: {handled} events"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from analytics import exports, queries, snapshot
+
+
+class Command(BaseCommand):
+    help = "Answer a question over the circulation snapshot and print the result as CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', choices=list(queries.QUESTIONS))
+
+    def handle(self, *args, **options):
+        try:
+            current = snapshot.load()
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        header, rows = queries.QUESTIONS[options['question']](current)
+        for chunk in exports.csv_chunks(header, rows):
+            self.stdout.write(chunk.decode(), ending='')
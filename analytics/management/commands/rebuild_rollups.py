@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from analytics import consumers
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild analytics tables (daily circulation rollups, trending counts) from the whole "
+        "circulation event log. Run once after deploying a new table; consume_events keeps them current."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('consumers', nargs='*', help=f"Tables to rebuild (default: all of {', '.join(consumers.CONSUMERS)}).")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Events read per batch (default: 5000).")
+
+    def handle(self, *args, **options):
+        names = options['consumers'] or list(consumers.CONSUMERS)
+        unknown = set(names) - set(consumers.CONSUMERS)
+        if unknown:
+            raise CommandError(f"Unknown consumers: {', '.join(sorted(unknown))}.")
+        for name in names:
+            handled = consumers.rebuild(name, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"{name}: rebuilt from {handled} events"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from analytics import consumers, trending
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring the trending lists up to date: apply new loans to the window counts, expire the days "
+        "that have left each window, and re-rank. Each step touches only what changed; run it from cron."
+    )
+
+    def handle(self, *args, **options):
+        handled = consumers.catch_up([trending.DAILY_CONSUMER])[trending.DAILY_CONSUMER]
+        moved = trending.expire()
+        ranked = trending.rank()
+        self.stdout.write(self.style.SUCCESS(
+            f"Applied {handled} events, moved {moved} windows, ranked {ranked} entries"
+        ))
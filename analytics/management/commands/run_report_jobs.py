@@ -0,0 +1,28 @@
+import time
+from django.core.management.base import BaseCommand
+from analytics import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued report jobs on a pool of worker threads, writing each report under MEDIA_ROOT. "
+        "Keeps polling for new jobs unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Reports built at the same time (default: 2).")
+        parser.add_argument('--poll', type=float, default=5, help="Seconds between checks for new jobs (default: 5).")
+        parser.add_argument('--once', action='store_true', help="Run the jobs queued now, then exit.")
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = jobs.requeue_stale()
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stalled jobs."))
+            jobs.purge()
+            ran = jobs.run_pending(workers=options['workers'])
+            if ran:
+                self.stdout.write(self.style.SUCCESS(f"Ran {ran} report jobs."))
+            if options['once']:
+                return
+            time.sleep(options['poll'])
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from analytics import snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring the columnar circulation snapshot (memory-mapped .npy files in ANALYTICS_SNAPSHOT_DIR) up to date. "
+        "Only loans added or changed since the last run are read; run it from a single cron job."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rewrite the snapshot from every loan.")
+
+    def handle(self, *args, **options):
+        appended, updated = snapshot.refresh(full=options['full'])
+        rows = len(snapshot.load())
+        self.stdout.write(self.style.SUCCESS(f"Appended {appended} loans, updated {updated}; {rows} loans in the snapshot"))
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ("books", "0008_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookPopularity",
+            fields=[
+                (
+                    "book",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="popularity",
+                        serialize=False,
+                        to="books.book",
+                    ),
+                ),
+                ("borrow_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["-borrow_count"], name="popularity_count_idx")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,136 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max, Sum
+
+WINDOWS = (7, 30, 365, 0)
+
+
+def seed_counts(apps, schema_editor):
+    # The daily consumer has already read past the existing history, so the counts start
+    # from its rollup; with no TrendingWindow rows yet, expire() trims them to each window.
+    DailyCirculation = apps.get_model("analytics", "DailyCirculation")
+    TrendingCount = apps.get_model("analytics", "TrendingCount")
+    totals = (
+        DailyCirculation.objects.filter(issues__gt=0)
+        .values("book_id")
+        .annotate(n=Sum("issues"), book_category=Max("book__category_id"))
+        .values_list("book_id", "book_category", "n")
+    )
+    TrendingCount.objects.bulk_create(
+        [
+            TrendingCount(
+                window=days, book_id=book_id, category_id=category_id, borrow_count=n
+            )
+            for book_id, category_id, n in totals
+            for days in WINDOWS
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0003_report_job"),
+        ("books", "0008_hot_path_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrendingWindow",
+            fields=[
+                (
+                    "days",
+                    models.PositiveSmallIntegerField(primary_key=True, serialize=False),
+                ),
+                ("expired_through", models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TrendingBook",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("window", models.PositiveSmallIntegerField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("borrow_count", models.PositiveIntegerField()),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="books.category",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="TrendingCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("window", models.PositiveSmallIntegerField()),
+                ("borrow_count", models.PositiveIntegerField(default=0)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="books.category",
+                    ),
+                ),
+            ],
+        ),
+        migrations.DeleteModel(
+            name="BookPopularity",
+        ),
+        migrations.AddIndex(
+            model_name="trendingbook",
+            index=models.Index(
+                fields=["window", "category", "rank"], name="trending_book_list_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="trendingcount",
+            constraint=models.UniqueConstraint(
+                fields=("window", "book"), name="trending_count_window_book_uniq"
+            ),
+        ),
+        migrations.RunPython(seed_counts, migrations.RunPython.noop),
+    ]
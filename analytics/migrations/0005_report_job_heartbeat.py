@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:56
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def stamp_running_jobs(apps, schema_editor):
+    # Jobs running now had no heartbeat; date it from their claim so requeue_stale() can see them
+    ReportJob = apps.get_model("analytics", "ReportJob")
+    ReportJob.objects.filter(status="RUNNING").update(heartbeat_at=F("started_at"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("analytics", "0004_trending"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_running_jobs, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,111 @@
+from django.conf import settings
 from django.db import models
+from books.models import Book, Category
 
-# Create your models here.
+class DailyCirculation(models.Model):
+    """One book's circulation on one day, summed from the circulation event log."""
+    date = models.DateField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    # The book's category when the activity happened, so totals per category need no join
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    issues = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    lost = models.PositiveIntegerField(default=0)
+    # Overdue fines assessed on returns, whether paid at the desk or charged to the account
+    fines = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'book'], name='daily_circulation_date_book_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['category', 'date'], name='daily_circulation_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.book.title}"
+
+class TrendingWindow(models.Model):
+    """How far a trending window's counts have been expired."""
+    days = models.PositiveSmallIntegerField(primary_key=True)
+    # Loans on this day and earlier have been taken off the window's counts
+    expired_through = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.days} days, expired through {self.expired_through}"
+
+class TrendingCount(models.Model):
+    """One book's loans within one trending window (window 0 is all time)."""
+    window = models.PositiveSmallIntegerField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    borrow_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['window', 'book'], name='trending_count_window_book_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.window}d {self.book.title}: {self.borrow_count}"
+
+class TrendingBook(models.Model):
+    """One place in a precomputed trending list, rewritten by analytics.trending.rank()."""
+    window = models.PositiveSmallIntegerField()
+    # Null for the list across all categories
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='+')
+    borrow_count = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['window', 'category', 'rank'], name='trending_book_list_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.window}d #{self.rank} {self.book.title}"
+
+class ReportJob(models.Model):
+    """A report export run by the run_report_jobs worker instead of in the web request."""
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Queued'
+        RUNNING = 'RUNNING', 'Running'
+        DONE = 'DONE', 'Ready'
+        FAILED = 'FAILED', 'Failed'
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    report_type = models.CharField(max_length=30)
+    export_format = models.CharField(max_length=10)
+    start_date = models.DateField()
+    end_date = models.DateField()
+    # sha256 of the parameters above; identical requests share one job
+    params_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    file = models.FileField(upload_to='reports/', blank=True)
+    row_count = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Stamped by the running worker every jobs.HEARTBEAT_EVERY
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            # At most one queued or running job per parameter set
+            models.UniqueConstraint(
+                fields=['params_hash'], condition=models.Q(status__in=['PENDING', 'RUNNING']), name='report_job_active_uniq'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['params_hash', 'finished_at'], name='report_job_params_idx'),
+            models.Index(fields=['status', 'created_at'], name='report_job_queue_idx'),
+        ]
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.DONE, self.Status.FAILED)
+
+    def __str__(self):
+        return f"{self.report_type} {self.start_date}..{self.end_date} ({self.status})"
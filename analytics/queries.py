@@ -0,0 +1,138 @@
+"""
+Vectorized questions over the circulation snapshot (analytics.snapshot).
+
+The primitives work on whole NumPy columns: group keys are factorized with
+np.unique into one code per row, counts and sums per group come from
+np.bincount, and per-group percentiles from one lexsort of (group, value).
+Nothing loops over loans in Python, so a question over millions of loans
+costs a few passes over a few memory-mapped columns.
+
+Each entry in QUESTIONS takes a Snapshot and returns (header, rows), ready
+for analytics.exports; the query_snapshot command prints them as CSV.
+"""
+from datetime import date, datetime, timezone as dt_timezone
+import numpy as np
+from django.utils import timezone
+from core.utils import day_range
+from .snapshot import NONE, STATUSES
+
+DAY = 86400
+
+
+def groups(*keys):
+    """Factorize equal-length key columns. Returns (distinct key rows, group code per row)."""
+    if len(keys) == 1:
+        labels, codes = np.unique(keys[0], return_inverse=True)
+        return labels.reshape(-1, 1), codes.reshape(-1)
+    labels, codes = np.unique(np.column_stack(keys), axis=0, return_inverse=True)
+    return labels, codes.reshape(-1)
+
+
+def group_count(codes, size):
+    return np.bincount(codes, minlength=size)
+
+
+def group_sum(codes, values, size):
+    return np.bincount(codes, weights=np.asarray(values, dtype=np.float64), minlength=size)
+
+
+def group_mean(codes, values, size):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return group_sum(codes, values, size) / group_count(codes, size)
+
+
+def group_percentile(codes, values, q, size):
+    """The q-th percentile (0-100, linearly interpolated like np.percentile) of `values` in each group; NaN for empty groups."""
+    values = np.asarray(values, dtype=np.float64)
+    ordered = values[np.lexsort((values, codes))]
+    counts = group_count(codes, size)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    present = counts > 0
+    position = starts[present] + (counts[present] - 1) * (q / 100)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    result = np.full(size, np.nan)
+    result[present] = ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+    return result
+
+
+def histogram(values, bins):
+    """(counts, bin edges) of `values`; `bins` as for np.histogram."""
+    return np.histogram(values, bins=bins)
+
+
+def months(epochs):
+    """
+    Local calendar month of each epoch timestamp. Returns (first day of each
+    month spanned, index into it per row). The month boundaries are computed
+    once in local time, then every row is placed with one binary search.
+    """
+    if not len(epochs):
+        return [], np.empty(0, dtype=np.int64)
+    first = timezone.localdate(datetime.fromtimestamp(int(epochs.min()), tz=dt_timezone.utc))
+    last = timezone.localdate(datetime.fromtimestamp(int(epochs.max()), tz=dt_timezone.utc))
+    starts = []
+    month = first.replace(day=1)
+    while month <= last:
+        starts.append(month)
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    bounds = np.array([int(day_range(start)[0].timestamp()) for start in starts], dtype=np.int64)
+    return starts, np.searchsorted(bounds, epochs, side='right') - 1
+
+
+def _returned(snapshot):
+    """Mask of loans that have been returned."""
+    return (snapshot['returned'] != NONE) & (snapshot['status'] == STATUSES.index('RETURNED'))
+
+
+def loan_days_by_category_by_month(snapshot, q=50):
+    """Percentile `q` of loan length in days for returned loans, by category and month of issue."""
+    returned = _returned(snapshot)
+    issued = np.asarray(snapshot['issued'][returned])
+    days = (np.asarray(snapshot['returned'][returned]) - issued) / DAY
+    starts, month_codes = months(issued)
+    labels, codes = groups(np.asarray(snapshot['category'][returned]), month_codes)
+    counts = group_count(codes, len(labels))
+    values = group_percentile(codes, days, q, len(labels))
+    return (
+        ['Category', 'Month', 'Loans', f'P{q:g} loan days'],
+        [
+            (snapshot.label('category', category), starts[month].strftime('%Y-%m'), int(count), round(float(value), 2))
+            for (category, month), count, value in zip(labels, counts, values)
+        ],
+    )
+
+
+def renewal_rate_by_tier(snapshot):
+    """Share of loans renewed at least once, by the member's membership tier."""
+    labels, codes = groups(np.asarray(snapshot['tier']))
+    counts = group_count(codes, len(labels))
+    rates = group_mean(codes, np.asarray(snapshot['renewals']) > 0, len(labels))
+    return (
+        ['Tier', 'Loans', 'Renewal rate'],
+        [
+            (snapshot.label('tier', tier), int(count), round(float(rate), 4))
+            for (tier,), count, rate in zip(labels, counts, rates)
+        ],
+    )
+
+
+def loan_length_histogram(snapshot, bins=(0, 1, 3, 7, 14, 21, 30, 60, 90, 365)):
+    """How many returned loans lasted how long, in day buckets."""
+    returned = _returned(snapshot)
+    days = (np.asarray(snapshot['returned'][returned]) - np.asarray(snapshot['issued'][returned])) / DAY
+    counts, edges = histogram(days, np.append(bins, np.inf))
+    return (
+        ['From days', 'To days', 'Loans'],
+        [
+            (int(low), '' if np.isinf(high) else int(high), int(count))
+            for low, high, count in zip(edges[:-1], edges[1:], counts)
+        ],
+    )
+
+
+QUESTIONS = {
+    'loan-days-by-category-month': loan_days_by_category_by_month,
+    'renewal-rate-by-tier': renewal_rate_by_tier,
+    'loan-length-histogram': loan_length_histogram,
+}
@@ -0,0 +1,220 @@
+"""
+Columnar snapshot of circulation facts for ad-hoc analysis.
+
+Every loan is one row across a set of fixed-width NumPy columns (int32 ids,
+int64 epoch seconds, small integer codes), each saved as a .npy file and
+opened memory-mapped by load(). analytics.queries answers questions over
+them with whole-column NumPy operations, so a new question over millions of
+loans needs no new ORM query.
+
+refresh() is incremental, driven by two high-water marks kept in meta.json:
+the highest BorrowRecord id written, so only newer loans are read from the
+database, and the highest CirculationEvent id seen, whose RETURNED, RENEWED
+and LOST events name the older loans that have changed since; those are read
+again and patched. Each refresh writes a new generation directory and then
+points meta.json at it with an atomic rename, so a reader never sees a
+half-written snapshot; refreshes themselves should run one at a time, from
+a single cron job. Changes that log no event (admin edits, a book moved
+to another category, a member changing tier) are picked up by
+refresh(full=True).
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from django.db.models import Max
+from accounts.models import MembershipTier
+from books.models import Category
+from circulation.models import BorrowRecord, CirculationEvent
+
+COLUMNS = {
+    'id': np.int32,
+    'user': np.int32,
+    'book': np.int32,
+    # Category and membership tier ids, NONE for none
+    'category': np.int32,
+    'tier': np.int32,
+    # Index into STATUSES
+    'status': np.int8,
+    # Seconds since the epoch; returned is NONE while the loan is out
+    'issued': np.int64,
+    'due': np.int64,
+    'returned': np.int64,
+    'renewals': np.int16,
+    'fine_cents': np.int64,
+}
+NONE = -1
+STATUSES = tuple(code for code, label in BorrowRecord.STATUS_CHOICES)
+
+# BorrowRecord values read for each column of COLUMNS, in order
+_FIELDS = (
+    'pk', 'user_id', 'book_id', 'book__category_id', 'user__membership_tier_id', 'status',
+    'issued_date', 'due_date', 'return_date', 'renewal_count', 'fine_amount',
+)
+_CHANGES = (CirculationEvent.Kind.RETURNED, CirculationEvent.Kind.RENEWED, CirculationEvent.Kind.LOST)
+READ_CHUNK_SIZE = 5000
+
+
+def _epoch(value):
+    return NONE if value is None else int(value.timestamp())
+
+
+_CONVERTERS = (
+    int, int, int,
+    lambda value: NONE if value is None else value,
+    lambda value: NONE if value is None else value,
+    STATUSES.index,
+    _epoch, _epoch, _epoch,
+    int,
+    lambda amount: int(amount * 100),
+)
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', settings.BASE_DIR / 'analytics_snapshot'))
+
+
+class Snapshot:
+    """One generation of the snapshot, its columns memory-mapped read-only."""
+
+    def __init__(self, root, meta):
+        self.meta = meta
+        directory = root / meta['generation']
+        self.columns = {
+            # An empty file can't be mapped
+            name: np.load(directory / f'{name}.npy', mmap_mode='r' if meta['rows'] else None)
+            for name in COLUMNS
+        }
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def label(self, kind, code):
+        """The name behind a category or tier code."""
+        if code == NONE:
+            return 'None'
+        return self.meta['labels'][kind].get(str(code), f'#{code}')
+
+
+def _read_meta(root):
+    try:
+        return json.loads((root / 'meta.json').read_text())
+    except FileNotFoundError:
+        return None
+
+
+def load(root=None):
+    """The current snapshot."""
+    root = root or snapshot_dir()
+    meta = _read_meta(root)
+    if meta is None:
+        raise FileNotFoundError(f"No circulation snapshot in {root}; run the snapshot_circulation command.")
+    return Snapshot(root, meta)
+
+
+def _to_columns(rows):
+    """Column arrays for a list of _FIELDS tuples."""
+    values = list(zip(*rows)) or [()] * len(_FIELDS)
+    return {
+        name: np.fromiter(map(convert, column), dtype=dtype, count=len(rows))
+        for (name, dtype), convert, column in zip(COLUMNS.items(), _CONVERTERS, values)
+    }
+
+
+def _read(queryset):
+    """Column arrays for the loans in `queryset`, read in id order a chunk at a time."""
+    chunks = []
+    rows = queryset.order_by('pk').values_list(*_FIELDS)
+    batch = []
+    for row in rows.iterator(chunk_size=READ_CHUNK_SIZE):
+        batch.append(row)
+        if len(batch) == READ_CHUNK_SIZE:
+            chunks.append(_to_columns(batch))
+            batch = []
+    chunks.append(_to_columns(batch))
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
+
+
+def _changed_loans(meta, event_mark):
+    """Column arrays for already-written loans that have been returned, renewed or lost since the last refresh."""
+    ids = sorted(set(CirculationEvent.objects.filter(
+        pk__gt=meta['event_mark'], pk__lte=event_mark, kind__in=_CHANGES, borrow_record_id__lte=meta['loan_mark'],
+    ).values_list('borrow_record_id', flat=True)))
+    # In slices, to stay under the database's limit on query parameters
+    chunks = [
+        _read(BorrowRecord.objects.filter(pk__in=ids[start:start + READ_CHUNK_SIZE]))
+        for start in range(0, len(ids), READ_CHUNK_SIZE)
+    ]
+    if not chunks:
+        return None
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in COLUMNS}
+
+
+def _write_meta(root, meta):
+    temporary = root / 'meta.json.tmp'
+    temporary.write_text(json.dumps(meta))
+    os.replace(temporary, root / 'meta.json')
+
+
+def refresh(full=False, root=None):
+    """Bring the snapshot up to date with the database. Returns (loans appended, loans updated)."""
+    root = root or snapshot_dir()
+    root.mkdir(parents=True, exist_ok=True)
+    meta = _read_meta(root)
+    previous = Snapshot(root, meta) if meta and not full else None
+
+    # Taken before any loan is read, so a change logged meanwhile is applied again next time
+    event_mark = CirculationEvent.objects.aggregate(mark=Max('pk'))['mark'] or 0
+    loan_mark = meta['loan_mark'] if previous else 0
+    new = _read(BorrowRecord.objects.filter(pk__gt=loan_mark))
+    changed = _changed_loans(meta, event_mark) if previous else None
+    appended, updated = len(new['id']), 0 if changed is None else len(changed['id'])
+
+    labels = {
+        'category': {str(pk): name for pk, name in Category.objects.values_list('pk', 'name')},
+        'tier': {str(pk): name for pk, name in MembershipTier.objects.values_list('pk', 'name')},
+    }
+    if previous and not appended and not updated:
+        _write_meta(root, dict(meta, event_mark=event_mark, labels=labels))
+        return 0, 0
+
+    number = meta['number'] + 1 if meta else 1
+    generation = f'generation-{number:06d}'
+    directory = root / generation
+    # Left behind by a refresh that died part-way
+    shutil.rmtree(directory, ignore_errors=True)
+    directory.mkdir()
+    kept = len(previous) if previous else 0
+    if changed is not None:
+        # Loans were written in id order, so a binary search finds each one's row
+        positions = np.searchsorted(previous['id'], changed['id'])
+        found = positions < kept
+        # A loan deleted since it was written has no row to patch
+        found[found] = previous['id'][positions[found]] == changed['id'][found]
+    for name, dtype in COLUMNS.items():
+        if not kept + appended:
+            np.save(directory / f'{name}.npy', np.empty(0, dtype=dtype))
+            continue
+        column = np.lib.format.open_memmap(directory / f'{name}.npy', mode='w+', dtype=dtype, shape=(kept + appended,))
+        if kept:
+            column[:kept] = previous[name]
+        column[kept:] = new[name]
+        if changed is not None:
+            column[positions[found]] = changed[name][found]
+        column.flush()
+        del column
+
+    _write_meta(root, {
+        'number': number, 'generation': generation, 'rows': kept + appended,
+        'loan_mark': int(new['id'][-1]) if appended else loan_mark, 'event_mark': event_mark, 'labels': labels,
+    })
+    # Readers of an older generation keep their open maps; the files go once they close
+    for stale in root.glob('generation-*'):
+        if stale.name != generation:
+            shutil.rmtree(stale, ignore_errors=True)
+    return appended, updated
@@ -1,3 +1,506 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+import numpy as np
+from django.core.management import call_command
+from django.http import StreamingHttpResponse
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.urls import reverse
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from datetime import datetime, timedelta
+from decimal import Decimal
+from accounts.models import MembershipTier
+from books.models import Author, Book, Category
+from circulation import services
+from core.pagination import encode_cursor
+from circulation.models import BorrowRecord, CirculationEvent, ConsumerOffset
+from .models import DailyCirculation, ReportJob, TrendingCount
+from . import consumers, jobs, queries, reports, snapshot, trending
 
-# Create your tests here.
+User = get_user_model()
+
+class TrendingTests(TestCase):
+    def setUp(self):
+        tier = MembershipTier.objects.create(name="Standard", max_books=20, borrow_duration_days=14, max_renewals=1)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=tier)
+        author = Author.objects.create(name="Test Author")
+        self.fiction = Category.objects.create(name="Fiction")
+        self.history = Category.objects.create(name="History")
+        self.books = [
+            Book.objects.create(
+                title=f"Book {i}", isbn=f"978000000030{i}", author=author, publication_date="2020-01-01",
+                category=self.fiction if i < 2 else self.history, total_copies=5, available_copies=5,
+            )
+            for i in range(3)
+        ]
+        self.today = timezone.localdate()
+
+    def borrow(self, book, days_ago=0, times=1):
+        for _ in range(times):
+            services.issue_book(self.member, book)
+            CirculationEvent.objects.filter(pk=CirculationEvent.objects.latest('pk').pk).update(
+                created_at=timezone.now() - timedelta(days=days_ago)
+            )
+
+    def lists(self, category=None):
+        return {
+            days: [(book.title, book.borrow_count) for book in trending.top(days, category)]
+            for days in trending.WINDOWS
+        }
+
+    def test_windows_and_categories(self):
+        self.borrow(self.books[0], days_ago=200, times=3)
+        self.borrow(self.books[1], days_ago=20, times=2)
+        self.borrow(self.books[2], days_ago=1)
+        self.borrow(self.books[1])
+        call_command('refresh_trending', stdout=StringIO())
+
+        self.assertEqual(self.lists(), {
+            7: [("Book 1", 1), ("Book 2", 1)],
+            30: [("Book 1", 3), ("Book 2", 1)],
+            365: [("Book 0", 3), ("Book 1", 3), ("Book 2", 1)],
+            0: [("Book 0", 3), ("Book 1", 3), ("Book 2", 1)],
+        })
+        self.assertEqual(self.lists(self.history)[30], [("Book 2", 1)])
+        self.assertEqual(self.lists(self.fiction)[7], [("Book 1", 1)])
+
+    def test_windows_slide_incrementally(self):
+        self.borrow(self.books[0], days_ago=5, times=2)
+        self.borrow(self.books[1], days_ago=2)
+        call_command('refresh_trending', stdout=StringIO())
+
+        # Three days on, book 0's loans have left the week but not the month
+        self.borrow(self.books[2])
+        consumers.catch_up()
+        self.assertEqual(trending.expire(self.today + timedelta(days=3)), 3)
+        trending.rank()
+        self.assertEqual(self.lists()[7], [("Book 1", 1), ("Book 2", 1)])
+        self.assertEqual(self.lists()[30], [("Book 0", 2), ("Book 1", 1), ("Book 2", 1)])
+        self.assertFalse(TrendingCount.objects.filter(window=7, book=self.books[0]).exists())
+
+        # Expiring again the same day changes nothing
+        self.assertEqual(trending.expire(self.today + timedelta(days=3)), 0)
+        self.assertEqual(TrendingCount.objects.get(window=7, book=self.books[1]).borrow_count, 1)
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.borrow(self.books[0], days_ago=40)
+        self.borrow(self.books[1], days_ago=3, times=2)
+        call_command('refresh_trending', stdout=StringIO())
+        incremental = self.lists()
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        call_command('refresh_trending', stdout=StringIO())
+        self.assertEqual(self.lists(), incremental)
+
+    def test_pages_read_the_trending_lists(self):
+        self.borrow(self.books[0], days_ago=20)
+        self.borrow(self.books[2], times=2)
+        call_command('refresh_trending', stdout=StringIO())
+        client = Client()
+        client.login(username='librarian', password='password')
+
+        response = client.get(reverse('analytics_dashboard'))
+        self.assertEqual([(b.title, b.borrow_count) for b in response.context['popular_books']], [("Book 2", 2), ("Book 0", 1)])
+        response = client.get(reverse('analytics_dashboard'), {'window': '7', 'category': self.fiction.pk})
+        self.assertEqual(response.context['popular_books'], [])
+
+        response = client.get(reverse('home'))
+        self.assertEqual([b.title for b in response.context['trending_books']], ["Book 2"])
+
+        response = client.post(
+            reverse('chatbot_api'), data=json.dumps({'message': 'Can you recommend some fiction?'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['response'], "I recommend checking out these popular titles in Fiction:\n'Book 0' by Test Author")
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        tier = MembershipTier.objects.create(name="Standard", max_books=5, borrow_duration_days=14, max_renewals=1)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=tier)
+        author = Author.objects.create(name="Test Author")
+        self.category = Category.objects.create(name="Fiction")
+        self.books = [
+            Book.objects.create(
+                title=f"Book {i}", isbn=f"978000000050{i}", author=author, publication_date="2020-01-01",
+                category=self.category, total_copies=2, available_copies=2, price=30,
+            )
+            for i in range(2)
+        ]
+        self.today = timezone.localdate()
+
+    def circulate(self):
+        late = services.issue_book(self.member, self.books[0])
+        BorrowRecord.objects.filter(pk=late.pk).update(due_date=timezone.now() - timedelta(days=2))
+        late.refresh_from_db()
+        services.return_book(late, Decimal('10.00'), paid=Decimal('0.00'))
+        services.issue_book(self.member, self.books[0])
+        services.mark_lost(services.issue_book(self.member, self.books[1]), Decimal('0.00'), paid=Decimal('30.00'))
+        # A loan made yesterday lands on yesterday's row
+        services.issue_book(self.member, self.books[1])
+        CirculationEvent.objects.filter(pk=CirculationEvent.objects.latest('pk').pk).update(
+            created_at=timezone.now() - timedelta(days=1)
+        )
+
+    def rows(self):
+        return {
+            (row.date, row.book_id): (row.issues, row.returns, row.lost, row.fines, row.category_id)
+            for row in DailyCirculation.objects.all()
+        }
+
+    def test_rollup_follows_events(self):
+        self.circulate()
+        call_command('consume_events', stdout=StringIO())
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(self.rows(), {
+            (self.today, self.books[0].pk): (2, 1, 0, Decimal('10.00'), self.category.pk),
+            (self.today, self.books[1].pk): (1, 0, 1, Decimal('0.00'), self.category.pk),
+            (yesterday, self.books[1].pk): (1, 0, 0, Decimal('0.00'), self.category.pk),
+        })
+
+        # Later events add to the existing rows
+        services.return_book(BorrowRecord.objects.get(book=self.books[0], status='ISSUED'), Decimal('0.00'))
+        call_command('consume_events', 'analytics.daily', stdout=StringIO())
+        self.assertEqual(self.rows()[(self.today, self.books[0].pk)][:2], (2, 2))
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.circulate()
+        call_command('consume_events', stdout=StringIO())
+        incremental = self.rows()
+        DailyCirculation.objects.update(issues=99)
+
+        call_command('rebuild_rollups', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(self.rows(), incremental)
+        self.assertEqual(TrendingCount.objects.get(window=trending.ALL_TIME, book=self.books[0]).borrow_count, 2)
+
+    def test_rebuild_after_deleting_a_book_and_member(self):
+        self.circulate()
+        call_command('consume_events', stdout=StringIO())
+        self.books[0].delete()
+        # The deleted book's rows go with it; the rest rebuild from the surviving log
+        incremental = self.rows()
+        self.member.delete()
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.rows(), incremental)
+        self.assertEqual(DailyCirculation.objects.filter(book=self.books[1]).count(), 2)
+
+    def test_dashboard_reads_the_rollup(self):
+        self.circulate()
+        client = Client()
+        client.login(username='librarian', password='password')
+        # The page reads the tables as cron last left them, without consuming events itself
+        response = client.get(reverse('analytics_dashboard'))
+        self.assertEqual(response.context['lost_count'], 0)
+        self.assertFalse(ConsumerOffset.objects.exists())
+
+        call_command('consume_events', stdout=StringIO())
+        response = client.get(reverse('analytics_dashboard'))
+        self.assertEqual(response.context['borrowed_this_month'], 3 if self.today.day == 1 else 4)
+        self.assertEqual(response.context['total_fines'], Decimal('10.00'))
+        self.assertEqual(response.context['lost_count'], 1)
+
+
+class ReportExportTests(TestCase):
+    def setUp(self):
+        tier = MembershipTier.objects.create(name="Standard", max_books=50, borrow_duration_days=14, max_renewals=1)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=tier)
+        author = Author.objects.create(name="Test Author")
+        self.books = [
+            Book.objects.create(
+                title=f"Book <{i}> & co", isbn=f"9780000006{i:03d}", author=author, publication_date="2020-01-01",
+            )
+            for i in range(30)
+        ]
+        services.issue_books(self.member, self.books)
+        overdue = BorrowRecord.objects.filter(book=self.books[0])
+        overdue.update(due_date=timezone.now() - timedelta(days=3))
+        services.return_book(overdue.get(), Decimal('15.00'))
+        self.client = Client()
+        self.client.login(username='librarian', password='password')
+        today = timezone.localdate().isoformat()
+        self.params = {'report_type': 'borrow_history', 'start_date': today, 'end_date': today}
+
+    def export(self, export_format, **params):
+        response = self.client.get(reverse('report_builder'), {**self.params, **params, 'export': export_format})
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv_export_streams_every_row(self):
+        response, content = self.export('csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[0], ['Issued', 'Member', 'Book', 'ISBN', 'Due', 'Returned', 'Status'])
+        self.assertEqual(len(rows), 31)
+        self.assertEqual({row[6] for row in rows[1:]}, {'ISSUED', 'RETURNED'})
+
+        _, content = self.export('csv', report_type='fines_report')
+        self.assertEqual(list(csv.reader(io.StringIO(content.decode())))[1][4], '15.00')
+
+    def test_xlsx_export_is_a_valid_workbook(self):
+        response, content = self.export('xlsx')
+        self.assertIn('.xlsx', response['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(content)) as workbook:
+            self.assertIsNone(workbook.testzip())
+            self.assertIn('xl/workbook.xml', workbook.namelist())
+            sheet = workbook.read('xl/worksheets/sheet1.xml').decode()
+        self.assertEqual(sheet.count('<row>'), 31)
+        self.assertIn('Book &lt;0&gt; &amp; co', sheet)
+
+    def test_page_is_paginated_by_cursor(self):
+        response = self.client.get(reverse('report_builder'), self.params)
+        self.assertEqual(len(response.context['report_data']), 25)
+        page = response.context['cursor_page']
+        self.assertTrue(page.has_next())
+
+        response = self.client.get(reverse('report_builder') + '?' + page.next_query)
+        self.assertEqual(len(response.context['report_data']), 5)
+        self.assertFalse(response.context['cursor_page'].has_next())
+        self.assertIn(reverse('report_job_submit'), response.content.decode())
+
+        # A tampered cursor starts over from the first page
+        response = self.client.get(reverse('report_builder'), {**self.params, 'cursor': encode_cursor(['notadate', 1])})
+        self.assertEqual(len(response.context['report_data']), 25)
+
+
+class ReportJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        tier = MembershipTier.objects.create(name="Standard", max_books=5, borrow_duration_days=14, max_renewals=1)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=tier)
+        author = Author.objects.create(name="Test Author")
+        for i in range(3):
+            book = Book.objects.create(title=f"Book {i}", isbn=f"978000000070{i}", author=author, publication_date="2020-01-01")
+            services.issue_book(member, book)
+        self.client = Client()
+        self.client.login(username='librarian', password='password')
+        today = timezone.localdate().isoformat()
+        self.params = {'report_type': 'borrow_history', 'start_date': today, 'end_date': today, 'export': 'csv'}
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_submit_returns_at_once_and_reuses_identical_jobs(self):
+        response = self.client.post(reverse('report_job_submit'), self.params)
+        job = ReportJob.objects.get()
+        self.assertRedirects(response, reverse('report_job_detail', args=[job.pk]))
+        self.assertEqual(job.status, ReportJob.Status.PENDING)
+
+        self.client.post(reverse('report_job_submit'), self.params)
+        self.client.post(reverse('report_job_submit'), {**self.params, 'export': 'xlsx'})
+        self.assertEqual(ReportJob.objects.count(), 2)
+
+        # A finished result is reused for a while, then rebuilt
+        self.assertEqual(jobs.claim(1), [job])
+        job.refresh_from_db()
+        jobs.run(job)
+        self.assertEqual(jobs.submit(self.librarian, 'borrow_history', 'csv', job.start_date, job.end_date)[0], job)
+        later = timezone.now() + jobs.REUSE_FOR + timedelta(minutes=1)
+        self.assertTrue(jobs.submit(self.librarian, 'borrow_history', 'csv', job.start_date, job.end_date, now=later)[1])
+
+    def test_worker_writes_the_file_for_download(self):
+        self.client.post(reverse('report_job_submit'), self.params)
+        job, = jobs.claim(5)
+        self.assertEqual(jobs.claim(5), [])
+        status = self.client.get(reverse('report_job_status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['download_url']), ('RUNNING', None))
+
+        jobs.run(job)
+        status = self.client.get(reverse('report_job_status', args=[job.pk])).json()
+        self.assertEqual((status['status'], status['row_count']), ('DONE', 3))
+
+        response = self.client.get(status['download_url'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 4)
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_failures_are_recorded(self):
+        jobs.submit(self.librarian, 'no_such_report', 'csv', timezone.localdate(), timezone.localdate())
+        job, = jobs.claim(1)
+        jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportJob.Status.FAILED)
+        self.assertEqual(self.client.get(reverse('report_job_download', args=[job.pk])).status_code, 404)
+
+    def test_stale_and_old_jobs(self):
+        job, _ = jobs.submit(self.librarian, 'borrow_history', 'csv', timezone.localdate(), timezone.localdate())
+        jobs.claim(1)
+        self.assertEqual(jobs.requeue_stale(), 0)
+        # However long a job has run, it stays while its worker beats
+        later = timezone.now() + jobs.STALE_AFTER * 10
+        ReportJob.objects.filter(pk=job.pk).update(heartbeat_at=later - timedelta(seconds=30))
+        self.assertEqual(jobs.requeue_stale(now=later), 0)
+        self.assertEqual(jobs.requeue_stale(now=later + jobs.STALE_AFTER), 1)
+
+        job, = jobs.claim(1)
+        jobs.run(job)
+        job.refresh_from_db()
+        path = job.file.path
+        self.assertEqual(jobs.purge(now=timezone.now() + jobs.KEEP_FOR + timedelta(days=1)), 1)
+        self.assertFalse(ReportJob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+
+    def test_requeued_job_keeps_the_new_claim(self):
+        jobs.submit(self.librarian, 'borrow_history', 'csv', timezone.localdate(), timezone.localdate())
+        job, = jobs.claim(1)
+        # Requeued and claimed again by another worker while this one ran
+        jobs.requeue_stale(now=timezone.now() + jobs.STALE_AFTER + timedelta(minutes=1))
+        jobs.claim(1, now=timezone.now() + timedelta(seconds=1))
+
+        jobs.run(job)
+        rerun = ReportJob.objects.get()
+        self.assertEqual((rerun.status, rerun.file.name), (ReportJob.Status.RUNNING, ''))
+        self.assertFalse(os.listdir(os.path.join(self.media_root, 'reports')))
+
+
+class ReportWorkerTests(TransactionTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_worker_pool_drains_the_queue(self):
+        today = timezone.localdate()
+        for report_type in ('borrow_history', 'overdue_report', 'fines_report', 'lost_books_report'):
+            jobs.submit(None, report_type, 'xlsx', today, today)
+        call_command('run_report_jobs', '--once', '--workers', '3', stdout=StringIO())
+        self.assertEqual(set(ReportJob.objects.values_list('status', flat=True)), {ReportJob.Status.DONE})
+
+    def test_running_job_beats_until_it_finishes(self):
+        def slow_rows(start_date, end_date):
+            for i in range(5):
+                time.sleep(0.05)
+                yield [i]
+
+        today = timezone.localdate()
+        jobs.submit(None, 'borrow_history', 'csv', today, today)
+        job, = jobs.claim(1)
+        with mock.patch.object(jobs, 'HEARTBEAT_EVERY', timedelta(milliseconds=10)), \
+                mock.patch.object(reports.REPORTS['borrow_history'], 'export_rows', slow_rows):
+            jobs.run(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.row_count), (ReportJob.Status.DONE, 5))
+        self.assertGreater(job.heartbeat_at, job.started_at)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings_override = override_settings(ANALYTICS_SNAPSHOT_DIR=self.root)
+        self.settings_override.enable()
+        self.standard = MembershipTier.objects.create(name="Standard", max_books=10, borrow_duration_days=14, max_renewals=1)
+        self.premium = MembershipTier.objects.create(name="Premium", max_books=10, borrow_duration_days=28, max_renewals=3)
+        self.members = [
+            User.objects.create_user(username=f'member{i}', password='password', role='MEMBER', membership_tier=tier)
+            for i, tier in enumerate([self.standard, self.premium])
+        ]
+        author = Author.objects.create(name="Test Author")
+        self.fiction = Category.objects.create(name="Fiction")
+        self.history = Category.objects.create(name="History")
+        self.books = [
+            Book.objects.create(
+                title=f"Book {i}", isbn=f"978000000070{i}", author=author, publication_date="2020-01-01",
+                category=self.fiction if i < 3 else self.history, total_copies=5, available_copies=5,
+            )
+            for i in range(4)
+        ]
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def loan(self, member, book, issued=None, days=None):
+        """A loan issued at `issued`, returned `days` later if given."""
+        record = services.issue_book(member, book)
+        if days is not None:
+            services.return_book(record, 0)
+        if issued:
+            BorrowRecord.objects.filter(pk=record.pk).update(
+                issued_date=issued, return_date=issued + timedelta(days=days) if days is not None else None
+            )
+        record.refresh_from_db()
+        return record
+
+    def columns(self, root=None):
+        current = snapshot.load(root)
+        return {name: current[name].tolist() for name in snapshot.COLUMNS}
+
+    def test_incremental_refresh_matches_full_rewrite(self):
+        first = self.loan(self.members[0], self.books[0])
+        second = self.loan(self.members[1], self.books[1])
+        self.loan(self.members[0], self.books[3], days=0)
+        self.assertEqual(snapshot.refresh(), (3, 0))
+
+        # One loan returned, one renewed and one new: only those three are read
+        services.return_book(first, Decimal('5.00'))
+        services.renew_loan(second)
+        self.loan(self.members[1], self.books[2])
+        with self.assertNumQueries(6):  # event mark, new loans, changed ids, changed loans, two label tables
+            self.assertEqual(snapshot.refresh(), (1, 2))
+        self.assertEqual(snapshot.refresh(), (0, 0))
+
+        incremental = self.columns()
+        self.assertEqual(incremental['status'], [snapshot.STATUSES.index(status) for status in ('RETURNED', 'ISSUED', 'RETURNED', 'ISSUED')])
+        self.assertEqual(incremental['renewals'], [0, 1, 0, 0])
+        self.assertEqual(incremental['fine_cents'], [500, 0, 0, 0])
+        self.assertEqual(incremental['category'], [self.fiction.pk, self.fiction.pk, self.history.pk, self.fiction.pk])
+
+        other = tempfile.mkdtemp()
+        try:
+            snapshot.refresh(full=True, root=Path(other))
+            self.assertEqual(self.columns(Path(other)), incremental)
+        finally:
+            shutil.rmtree(other, ignore_errors=True)
+        # Only the current generation is kept
+        self.assertEqual(len(list(Path(self.root).glob('generation-*'))), 1)
+
+    def test_questions(self):
+        march = timezone.make_aware(datetime(2026, 3, 10, 12))
+        april = timezone.make_aware(datetime(2026, 4, 10, 12))
+        for book, days in [(self.books[0], 2), (self.books[1], 4), (self.books[2], 10), (self.books[3], 5)]:
+            self.loan(self.members[0], book, march, days)
+        self.loan(self.members[1], self.books[0], april, 20)
+        services.renew_loan(self.loan(self.members[1], self.books[1]))
+        snapshot.refresh()
+        current = snapshot.load()
+
+        header, rows = queries.loan_days_by_category_by_month(current)
+        self.assertEqual(rows, [('Fiction', '2026-03', 3, 4.0), ('Fiction', '2026-04', 1, 20.0), ('History', '2026-03', 1, 5.0)])
+        header, rows = queries.renewal_rate_by_tier(current)
+        self.assertEqual(rows, [('Standard', 4, 0.0), ('Premium', 2, 0.5)])
+        header, rows = queries.loan_length_histogram(current, bins=(0, 3, 7, 30))
+        self.assertEqual(rows, [(0, 3, 1), (3, 7, 2), (7, 30, 2), (30, '', 0)])
+
+        out = StringIO()
+        call_command('query_snapshot', 'renewal-rate-by-tier', stdout=out)
+        self.assertEqual(out.getvalue().splitlines(), ['Tier,Loans,Renewal rate', 'Standard,4,0.0', 'Premium,2,0.5'])
+
+    def test_group_percentile_matches_numpy(self):
+        rng = np.random.default_rng(0)
+        codes = rng.integers(0, 5, size=1000)
+        values = rng.normal(size=1000)
+        for q in (0, 25, 50, 90, 100):
+            expected = [np.percentile(values[codes == code], q) for code in range(5)]
+            np.testing.assert_allclose(queries.group_percentile(codes, values, q, 6)[:5], expected)
+        self.assertTrue(np.isnan(queries.group_percentile(codes, values, 50, 6)[5]))
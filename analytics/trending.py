@@ -0,0 +1,131 @@
+"""
+Trending lists: the most borrowed books of the last 7, 30 and 365 days and
+of all time, overall and per category.
+
+TrendingCount holds each book's loans within each window and is kept as a
+sliding sum. The daily rollup consumer adds loans to it as it reads them
+from the event log (add), and expire() takes off the loans of days that
+have since left a window, reading them back from DailyCirculation. Neither
+step ever recounts the loan history. Both run under the daily consumer's
+lock, so for every window and book
+
+    borrow_count == sum of DailyCirculation.issues on days after expired_through
+
+rank() then writes the top RANK_SIZE books of each window, overall and per
+category, into TrendingBook, the small table pages read from. The
+refresh_trending command runs all three steps.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from circulation.models import ConsumerOffset
+from .models import DailyCirculation, TrendingBook, TrendingCount, TrendingWindow
+
+ALL_TIME = 0
+# Window length in days: label
+WINDOWS = {7: 'This week', 30: 'This month', 365: 'This year', ALL_TIME: 'All time'}
+RANK_SIZE = 10
+
+# The consumer whose batches call add(); its offset row doubles as the lock
+DAILY_CONSUMER = 'analytics.daily'
+
+
+def add(issues, categories):
+    """
+    Add loans to the window counts. `issues` maps (date, book_id) to a number
+    of loans and `categories` maps book_id to its category id.
+    """
+    expired = dict(TrendingWindow.objects.values_list('days', 'expired_through'))
+    totals = {}
+    for (date, book_id), n in issues.items():
+        for days in WINDOWS:
+            through = expired.get(days)
+            # Loans on days already expired from a window were never counted there
+            if days != ALL_TIME and through is not None and date <= through:
+                continue
+            totals[days, book_id] = totals.get((days, book_id), 0) + n
+    if not totals:
+        return
+
+    rows = {
+        (row.window, row.book_id): row
+        for row in TrendingCount.objects.filter(book_id__in={book_id for days, book_id in totals})
+    }
+    new_rows = []
+    for (days, book_id), n in totals.items():
+        row = rows.get((days, book_id))
+        if row is None:
+            new_rows.append(TrendingCount(
+                window=days, book_id=book_id, category_id=categories.get(book_id), borrow_count=n
+            ))
+        else:
+            row.borrow_count += n
+    TrendingCount.objects.bulk_update([rows[key] for key in totals if key in rows], ['borrow_count'])
+    TrendingCount.objects.bulk_create(new_rows)
+
+
+def expire(today=None):
+    """Take the loans of days that have slid out of each window off its counts. Returns how many windows moved."""
+    today = today or timezone.localdate()
+    moved = 0
+    with transaction.atomic():
+        # Keeps the daily consumer from adding to the counts while they are expired
+        ConsumerOffset.objects.select_for_update().get_or_create(name=DAILY_CONSUMER)
+        for days in WINDOWS:
+            if days == ALL_TIME:
+                continue
+            window, _ = TrendingWindow.objects.get_or_create(days=days)
+            through = today - timedelta(days=days)
+            if window.expired_through is not None and window.expired_through >= through:
+                continue
+
+            leaving = DailyCirculation.objects.filter(date__lte=through, issues__gt=0)
+            if window.expired_through is not None:
+                leaving = leaving.filter(date__gt=window.expired_through)
+            # One UPDATE per distinct decrement, as most books leave a window a loan or two at a time
+            by_decrement = {}
+            for book_id, n in leaving.values('book_id').annotate(n=Sum('issues')).values_list('book_id', 'n'):
+                by_decrement.setdefault(n, []).append(book_id)
+            counts = TrendingCount.objects.filter(window=days)
+            for n, book_ids in by_decrement.items():
+                counts.filter(book_id__in=book_ids).update(borrow_count=F('borrow_count') - n)
+            counts.filter(borrow_count=0).delete()
+
+            window.expired_through = through
+            window.save(update_fields=['expired_through'])
+            moved += 1
+    return moved
+
+
+def rank(size=RANK_SIZE):
+    """Rewrite TrendingBook from the counts: the top `size` of every window, overall and per category."""
+    entries = []
+    for days in WINDOWS:
+        overall, by_category = 0, {}
+        counts = TrendingCount.objects.filter(window=days, borrow_count__gt=0).order_by('-borrow_count', 'book_id')
+        for book_id, category_id, n in counts.values_list('book_id', 'category_id', 'borrow_count').iterator():
+            if overall < size:
+                overall += 1
+                entries.append(TrendingBook(window=days, rank=overall, book_id=book_id, borrow_count=n))
+            placed = by_category.get(category_id, 0)
+            if category_id is not None and placed < size:
+                by_category[category_id] = placed + 1
+                entries.append(TrendingBook(
+                    window=days, category_id=category_id, rank=placed + 1, book_id=book_id, borrow_count=n
+                ))
+    with transaction.atomic():
+        TrendingBook.objects.all().delete()
+        TrendingBook.objects.bulk_create(entries)
+    return len(entries)
+
+
+def top(days, category=None, limit=RANK_SIZE):
+    """The books of a trending list, best first, each with its borrow_count set."""
+    books = []
+    for entry in TrendingBook.objects.filter(window=days, category=category).select_related(
+        'book__author'
+    ).order_by('rank')[:limit]:
+        entry.book.borrow_count = entry.borrow_count
+        books.append(entry.book)
+    return books
@@ -4,5 +4,9 @@ from . import views, chatbot
 urlpatterns = [
     path('dashboard/', views.AnalyticsDashboardView.as_view(), name='analytics_dashboard'),
     path('reports/', views.ReportBuilderView.as_view(), name='report_builder'),
+    path('reports/jobs/', views.ReportJobSubmitView.as_view(), name='report_job_submit'),
+    path('reports/jobs/<int:pk>/', views.ReportJobDetailView.as_view(), name='report_job_detail'),
+    path('reports/jobs/<int:pk>/status/', views.ReportJobStatusView.as_view(), name='report_job_status'),
+    path('reports/jobs/<int:pk>/download/', views.ReportJobDownloadView.as_view(), name='report_job_download'),
     path('chatbot/api/', chatbot.chatbot_api, name='chatbot_api'),
 ]
@@ -1,21 +1,59 @@
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.views.generic import TemplateView, FormView
-from django.db.models import Count, Sum
+from django.contrib import messages
+from django.views.generic import DetailView, TemplateView, FormView, View
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.db.models import Q, Sum
 from django.utils import timezone
 from datetime import timedelta
 from circulation.models import BorrowRecord
-from books.models import Book
+from circulation import counters
+from books.models import Category
+from core.pagination import CursorPaginationMixin
+from core.utils import day_range
 from .forms import ReportFilterForm
+from .models import DailyCirculation, ReportJob
+from . import exports, jobs, reports, trending
 
 class LibrarianRequiredMixin(UserPassesTestMixin):
     def test_func(self):
         return self.request.user.is_authenticated and \
                self.request.user.role in ['LIBRARIAN', 'ADMIN']
 
-class ReportBuilderView(LoginRequiredMixin, LibrarianRequiredMixin, FormView):
+class ReportBuilderView(LoginRequiredMixin, LibrarianRequiredMixin, CursorPaginationMixin, FormView):
     template_name = 'analytics/report_builder.html'
     form_class = ReportFilterForm
+    paginate_by = 25
+
+    def use_cursor_pagination(self):
+        # Reports can run to hundreds of thousands of rows, so the page is always keyset-paginated
+        return True
+
+    def get_report_form(self):
+        if not self.request.GET:
+            return None
+        form = self.form_class(self.request.GET)
+        return form if form.is_valid() else None
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('export')
+        form = self.get_report_form()
+        if form and export_format in exports.WRITERS:
+            return self.export(form.cleaned_data, export_format)
+        return super().get(request, *args, **kwargs)
+
+    def export(self, filters, export_format):
+        report = reports.REPORTS[filters['report_type']]
+        start_date, end_date = filters['start_date'], filters['end_date']
+        rows = report.export_rows(start_date, end_date)
+        response = StreamingHttpResponse(
+            exports.WRITERS[export_format](report.export_header(), rows),
+            content_type=exports.CONTENT_TYPES[export_format],
+        )
+        filename = f"{filters['report_type']}_{start_date}_{end_date}.{export_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -23,44 +61,31 @@ class ReportBuilderView(LoginRequiredMixin, LibrarianRequiredMixin, FormView):
         # Default empty results
         context['report_data'] = None
         
-        if self.request.GET:
-            form = self.form_class(self.request.GET)
-            if form.is_valid():
-                start_date = form.cleaned_data['start_date']
-                end_date = form.cleaned_data['end_date']
-                report_type = form.cleaned_data['report_type']
-                
-                context['start_date'] = start_date
-                context['end_date'] = end_date
-                context['report_type_label'] = dict(form.fields['report_type'].choices)[report_type]
-
-                if report_type == 'borrow_history':
-                    context['report_data'] = BorrowRecord.objects.filter(
-                        issued_date__date__range=[start_date, end_date]
-                    ).select_related('user', 'book').order_by('-issued_date')
-                    context['headers'] = ['Date', 'Member', 'Book', 'Status']
-                    
-                elif report_type == 'overdue_report':
-                    context['report_data'] = BorrowRecord.objects.filter(
-                        status='ISSUED',
-                        due_date__date__lte=end_date
-                    ).select_related('user', 'book').order_by('due_date')
-                    context['headers'] = ['Due Date', 'Member', 'Book', 'Days Overdue']
-                    
-                elif report_type == 'fines_report':
-                    context['report_data'] = BorrowRecord.objects.filter(
-                        return_date__date__range=[start_date, end_date],
-                        fine_amount__gt=0
-                    ).select_related('user', 'book').order_by('-return_date')
-                    context['headers'] = ['Return Date', 'Member', 'Book', 'Fine Amount']
-                    context['total_amount'] = context['report_data'].aggregate(Sum('fine_amount'))['fine_amount__sum']
-                    
-                elif report_type == 'lost_books_report':
-                    context['report_data'] = BorrowRecord.objects.filter(
-                        status='LOST',
-                        issued_date__date__range=[start_date, end_date]
-                    ).select_related('user', 'book').order_by('-issued_date')
-                    context['headers'] = ['Issued Date', 'Member', 'Book', 'Fine/Cost']
+        form = self.get_report_form()
+        if form:
+            start_date = form.cleaned_data['start_date']
+            end_date = form.cleaned_data['end_date']
+            report = reports.REPORTS[form.cleaned_data['report_type']]
+
+            context['start_date'] = start_date
+            context['end_date'] = end_date
+            context['report_type'] = form.cleaned_data['report_type']
+            context['report_type_label'] = report.label
+            context['headers'] = report.headers
+
+            queryset = report.queryset(start_date, end_date)
+            if report.total:
+                context['total_amount'] = queryset.aggregate(total=Sum(report.total))['total']
+            self.cursor_ordering = report.ordering
+            _, page, rows, _ = self.paginate_queryset(queryset.select_related('user', 'book'), self.paginate_by)
+            context['report_data'] = rows
+            context['cursor_page'] = page
+            params = self.request.GET.copy()
+            for name in ('cursor', 'page', 'export'):
+                params.pop(name, None)
+            context['export_query'] = params.urlencode()
+
+        context['recent_jobs'] = ReportJob.objects.order_by('-created_at')[:5]
 
         return context
 
@@ -75,48 +100,111 @@ class ReportBuilderView(LoginRequiredMixin, LibrarianRequiredMixin, FormView):
             initial['report_type'] = self.request.GET.get('report_type')
         return initial
 
+# --- Background Report Jobs ---
+
+class ReportJobSubmitView(LoginRequiredMixin, LibrarianRequiredMixin, View):
+    def post(self, request):
+        form = ReportFilterForm(request.POST)
+        export_format = request.POST.get('export')
+        if not form.is_valid() or export_format not in exports.WRITERS:
+            messages.error(request, "Choose a report, a date range and a file format.")
+            return redirect('report_builder')
+
+        job, created = jobs.submit(
+            request.user, form.cleaned_data['report_type'], export_format,
+            form.cleaned_data['start_date'], form.cleaned_data['end_date'],
+        )
+        if created:
+            messages.success(request, "Your report has been queued. It will be ready to download here shortly.")
+        else:
+            messages.info(request, "This report was already requested; showing that copy.")
+        return redirect('report_job_detail', pk=job.pk)
+
+class ReportJobDetailView(LoginRequiredMixin, LibrarianRequiredMixin, DetailView):
+    model = ReportJob
+    template_name = 'analytics/report_job.html'
+    context_object_name = 'job'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['report_type_label'] = reports.REPORTS[self.object.report_type].label
+        return context
+
+class ReportJobStatusView(LoginRequiredMixin, LibrarianRequiredMixin, View):
+    """Polled by the job page until the report is ready."""
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk)
+        return JsonResponse({
+            'id': job.pk,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'finished': job.is_finished,
+            'row_count': job.row_count,
+            'error': job.error,
+            'download_url': reverse('report_job_download', args=[job.pk]) if job.status == ReportJob.Status.DONE else None,
+        })
+
+class ReportJobDownloadView(LoginRequiredMixin, LibrarianRequiredMixin, View):
+    def get(self, request, pk):
+        job = get_object_or_404(ReportJob, pk=pk, status=ReportJob.Status.DONE)
+        try:
+            report_file = job.file.open('rb')
+        except FileNotFoundError:
+            raise Http404("This report file has been removed.")
+        return FileResponse(
+            report_file, as_attachment=True, filename=job.file.name.rsplit('/', 1)[-1],
+            content_type=exports.CONTENT_TYPES[job.export_format],
+        )
+
 class AnalyticsDashboardView(LoginRequiredMixin, TemplateView):
     template_name = 'analytics/dashboard.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         now = timezone.now()
-        start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        month = timezone.localdate(now).replace(day=1)
+        start_of_month, _ = day_range(month)
+
+        # Totals come from the rollup tables, which the consume_events cron job keeps up to date
+        totals = DailyCirculation.objects.aggregate(
+            borrowed_this_month=Sum('issues', filter=Q(date__gte=month)),
+            total_fines=Sum('fines'),
+            lost_count=Sum('lost'),
+        )
 
         # 1. Total Books Borrowed (This Month)
-        context['borrowed_this_month'] = BorrowRecord.objects.filter(
-            issued_date__gte=start_of_month
-        ).count()
+        context['borrowed_this_month'] = totals['borrowed_this_month'] or 0
         context['borrowed_books_list'] = BorrowRecord.objects.filter(
             issued_date__gte=start_of_month
         ).select_related('user', 'book').order_by('-issued_date')[:5]
 
-        # 2. Total Fines Collected (Sum of fine_amount for RETURNED books)
-        context['total_fines'] = BorrowRecord.objects.filter(
-            status='RETURNED'
-        ).aggregate(Sum('fine_amount'))['fine_amount__sum'] or 0.00
+        # 2. Total Fines Collected (overdue fines assessed on returns)
+        context['total_fines'] = totals['total_fines'] or 0.00
         context['fine_payment_list'] = BorrowRecord.objects.filter(
             status='RETURNED',
             fine_amount__gt=0
         ).select_related('user', 'book').order_by('-return_date')[:5]
 
-        # 3. Most Popular Books
-        context['popular_books'] = Book.objects.annotate(
-            borrow_count=Count('borrow_records')
-        ).order_by('-borrow_count')[:5]
+        # 3. Most Popular Books, from the precomputed trending lists
+        window = self.request.GET.get('window', '30')
+        window = int(window) if window.isdigit() and int(window) in trending.WINDOWS else 30
+        category = self.request.GET.get('category', '')
+        category = Category.objects.filter(pk=category).first() if category.isdigit() else None
+        context['popular_books'] = trending.top(window, category, limit=5)
+        context['trending_window'] = window
+        context['trending_windows'] = trending.WINDOWS.items()
+        context['trending_category'] = category
+        context['categories'] = Category.objects.order_by('name')
 
         # 4. Overdue Books Count
-        context['overdue_count'] = BorrowRecord.objects.filter(
-            status='ISSUED',
-            due_date__lt=now
-        ).count()
+        context['overdue_count'] = counters.staff_counts()['overdue']
         context['overdue_books_list'] = BorrowRecord.objects.filter(
             status='ISSUED',
             due_date__lt=now
         ).select_related('user', 'book').order_by('due_date')[:5]
 
         # 5. Lost Books Count
-        context['lost_count'] = BorrowRecord.objects.filter(status='LOST').count()
+        context['lost_count'] = totals['lost_count'] or 0
         context['lost_books_list'] = BorrowRecord.objects.filter(status='LOST').select_related('user', 'book').order_by('-issued_date')[:5]
 
         return context
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+Facet counts (category, availability, decade) for the catalog list.
+
+The books matching the search text and author filter are grouped once by
+(category, status, decade). That small table is cached for a short TTL and
+every facet is derived from it in Python. Each facet's counts honour the
+other facets' selections but not its own, so picking "Fiction" still shows
+how many books the other categories have.
+"""
+import datetime
+import hashlib
+import re
+from django.core.cache import cache
+from django.db.models import Count, Value
+from django.db.models.functions import ExtractYear, Floor
+
+CACHE_TIMEOUT = 60
+
+# Book.status -> the catalog's `status` filter values
+STATUS_BUCKETS = {
+    'AVAILABLE': 'available',
+    'OUT_OF_STOCK': 'borrowed',
+    'RESERVED': 'borrowed',
+    'LOST': 'lost',
+}
+STATUS_LABELS = [
+    ('available', 'Available Now'),
+    ('borrowed', 'Borrowed / Out of Stock'),
+    ('lost', 'Lost Books'),
+]
+BUCKET_STATUSES = {
+    bucket: [status for status, b in STATUS_BUCKETS.items() if b == bucket]
+    for bucket, label in STATUS_LABELS
+}
+
+DIMENSIONS = ('category', 'status', 'decade')
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def selected_filters(params):
+    """The facet selections in a request's GET params, normalized."""
+    status = params.get('status')
+    decade = _int_or_none(params.get('decade'))
+    if decade is not None:
+        decade -= decade % 10
+        # Outside these, decade_range() can't build the dates
+        if not datetime.MINYEAR <= decade <= datetime.MAXYEAR - 10:
+            decade = None
+    return {
+        'category': _int_or_none(params.get('category')),
+        'status': status if status in BUCKET_STATUSES else None,
+        'decade': decade,
+    }
+
+
+def decade_range(decade):
+    """[start, end) publication dates of a decade; a plain range keeps the date index usable."""
+    return datetime.date(decade, 1, 1), datetime.date(decade + 10, 1, 1)
+
+
+def apply_filters(queryset, selected):
+    if selected['category'] is not None:
+        queryset = queryset.filter(category_id=selected['category'])
+    if selected['status']:
+        queryset = queryset.filter(status__in=BUCKET_STATUSES[selected['status']])
+    if selected['decade'] is not None:
+        start, end = decade_range(selected['decade'])
+        queryset = queryset.filter(publication_date__gte=start, publication_date__lt=end)
+    return queryset
+
+
+def cache_key(*parts):
+    # Collapse case and whitespace so "Dune " and "dune" share an entry
+    normalized = '|'.join(re.sub(r'\s+', ' ', str(part or '')).strip().lower() for part in parts)
+    return 'catalog-facets:' + hashlib.md5(normalized.encode()).hexdigest()
+
+
+def count_groups(queryset):
+    """[(category_id, category_name, status, decade, count)] for `queryset` in one GROUP BY query."""
+    rows = (
+        queryset.order_by()
+        .annotate(decade=Floor(ExtractYear('publication_date') / Value(10.0)) * 10)
+        .values('category_id', 'category__name', 'status', 'decade')
+        .annotate(n=Count('pk'))
+    )
+    return [
+        (row['category_id'], row['category__name'], row['status'], int(row['decade']), row['n'])
+        for row in rows
+    ]
+
+
+def get_groups(queryset, key):
+    groups = cache.get(key)
+    if groups is None:
+        groups = count_groups(queryset)
+        cache.set(key, groups, CACHE_TIMEOUT)
+    return groups
+
+
+def _matches(group, selected, skip):
+    category_id, name, status, decade, n = group
+    return (
+        (skip == 'category' or selected['category'] is None or category_id == selected['category']) and
+        (skip == 'status' or selected['status'] is None or STATUS_BUCKETS.get(status) == selected['status']) and
+        (skip == 'decade' or selected['decade'] is None or decade == selected['decade'])
+    )
+
+
+def build_facets(groups, selected, params, include_lost=False):
+    """
+    {'category': [...], 'status': [...], 'decade': [...]} where each entry is a dict
+    with value, label, count, selected and the `query` string that toggles it.
+    """
+    counts = {dimension: {} for dimension in DIMENSIONS}
+    labels = {}
+    for group in groups:
+        category_id, name, status, decade, n = group
+        values = {'category': category_id, 'status': STATUS_BUCKETS.get(status), 'decade': decade}
+        for dimension in DIMENSIONS:
+            if values[dimension] is not None and _matches(group, selected, skip=dimension):
+                counts[dimension][values[dimension]] = counts[dimension].get(values[dimension], 0) + n
+        if category_id is not None:
+            labels[category_id] = name
+
+    def entry(dimension, value, label, count):
+        query = params.copy()
+        for param in ('page', 'cursor'):
+            query.pop(param, None)
+        is_selected = selected[dimension] == value
+        if is_selected:
+            query.pop(dimension, None)
+        else:
+            query[dimension] = str(value)
+        return {'value': value, 'label': label, 'count': count, 'selected': is_selected, 'query': query.urlencode()}
+
+    categories = sorted(counts['category'].items(), key=lambda item: (-item[1], labels[item[0]]))
+    return {
+        'category': [entry('category', pk, labels[pk], n) for pk, n in categories],
+        'status': [
+            entry('status', bucket, label, counts['status'].get(bucket, 0))
+            for bucket, label in STATUS_LABELS
+            if bucket != 'lost' or include_lost
+        ],
+        'decade': [
+            entry('decade', decade, f"{decade}s", n)
+            for decade, n in sorted(counts['decade'].items(), reverse=True)
+        ],
+    }
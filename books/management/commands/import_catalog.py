@@ -0,0 +1,53 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from books import importer
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV or JSON Lines catalog feed into the database, upserting books by ISBN. "
+        "Columns: isbn, title, author, category, publication_date, total_copies, price, borrow_duration."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file to import, or - to read from stdin.")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Input format (default: guessed from the file extension).")
+        parser.add_argument('--batch-size', type=int, default=importer.DEFAULT_BATCH_SIZE, help="Rows written per transaction.")
+        parser.add_argument('--skip-existing', action='store_true', help="Leave books whose ISBN already exists untouched.")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+
+        if options['path'] == '-':
+            stream, fmt = sys.stdin, options['format'] or 'csv'
+        else:
+            try:
+                stream, fmt = importer.open_source(options['path'], options['format'])
+            except OSError as exc:
+                raise CommandError(f"Cannot open {options['path']}: {exc}")
+
+        started = time.monotonic()
+        verbosity = options['verbosity']
+
+        def progress(stats):
+            if verbosity > 1:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f"{stats.rows} rows ({stats.rows / elapsed:.0f} rows/sec)")
+
+        with stream:
+            catalog = importer.CatalogImporter(
+                batch_size=options['batch_size'],
+                update_existing=not options['skip_existing'],
+            )
+            stats = catalog.run(importer.read_rows(stream, fmt), progress=progress)
+
+        elapsed = time.monotonic() - started
+        for error in stats.errors:
+            self.stderr.write(f"Skipped {error}")
+        rate = stats.rows / elapsed if elapsed else stats.rows
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {stats.rows} rows in {elapsed:.1f}s ({rate:.0f} rows/sec): "
+            f"{stats.created} created, {stats.updated} updated, {stats.unchanged} unchanged, {stats.skipped} skipped."
+        ))
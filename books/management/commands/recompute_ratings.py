@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from books import ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized rating aggregates on Book from the Review table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Books updated per bulk_update batch.")
+
+    def handle(self, *args, **options):
+        corrected = ratings.recompute(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Corrected rating aggregates on {corrected} books."))
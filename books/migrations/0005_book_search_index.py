@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-18 09:00
+
+from django.db import migrations
+
+from books import search
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if not search.is_enabled(connection):
+        return
+    search.create_index(connection)
+
+    Book = apps.get_model("books", "Book")
+    rows = Book.objects.using(connection.alias).values_list(
+        "pk", "title", "author__name", "category__name", "isbn"
+    )
+    search.write_rows(connection, rows.iterator(chunk_size=2000))
+
+
+def drop_search_index(apps, schema_editor):
+    if search.is_enabled(schema_editor.connection):
+        search.drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0004_alter_book_status"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.1 on 2026-10-18 20:56
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0005_book_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                django.db.models.functions.text.Lower("title"),
+                name="book_title_lower_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:00
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    Review = apps.get_model("books", "Review")
+
+    aggregates = {}
+    for row in (
+        Review.objects.values("book_id", "rating").annotate(n=Count("id")).order_by()
+    ):
+        book = aggregates.setdefault(
+            row["book_id"], {"rating_sum": 0, "review_count": 0}
+        )
+        book["rating_sum"] += row["rating"] * row["n"]
+        book["review_count"] += row["n"]
+        book[f"rating_{row['rating']}_count"] = row["n"]
+
+    for book_id, fields in aggregates.items():
+        Book.objects.filter(pk=book_id).update(**fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0006_book_book_title_lower_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="rating_1_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_2_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_3_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_4_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_5_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="review_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0007_book_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["status", "publication_date"], name="book_status_pub_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(fields=["publication_date"], name="book_pub_date_idx"),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.urls import reverse
 from django.conf import settings
 
@@ -39,6 +40,28 @@ class Book(models.Model):
     borrow_duration = models.PositiveIntegerField(default=14, help_text="Default borrow duration in days")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='AVAILABLE')
 
+    # Rating aggregates, maintained incrementally by the Review signals in books/signals.py
+    rating_sum = models.PositiveIntegerField(default=0)
+    review_count = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    RATING_FIELDS = ('rating_sum', 'review_count', 'rating_1_count', 'rating_2_count',
+                     'rating_3_count', 'rating_4_count', 'rating_5_count')
+
+    class Meta:
+        indexes = [
+            # Case-insensitive title prefix lookups from the circulation desk typeahead
+            models.Index(Lower('title'), name='book_title_lower_idx'),
+            # Catalog filtered by status, newest first
+            models.Index(fields=['status', 'publication_date'], name='book_status_pub_idx'),
+            # Unfiltered catalog and its keyset pagination on (publication_date, id)
+            models.Index(fields=['publication_date'], name='book_pub_date_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -48,11 +71,39 @@ class Book(models.Model):
                 self.status = 'OUT_OF_STOCK'
             else:
                 self.status = 'AVAILABLE'
+
+        # Never write rating aggregates back from a possibly stale instance;
+        # they are only changed through atomic F() updates.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.RATING_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('book_detail', args=[str(self.id)])
 
+    @staticmethod
+    def rating_count_field(rating):
+        return f'rating_{int(rating)}_count'
+
+    @property
+    def average_rating(self):
+        if self.review_count:
+            return self.rating_sum / self.review_count
+        return None
+
+    @property
+    def rating_histogram(self):
+        """[(stars, count, percent), ...] from 5 stars down to 1."""
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, self.rating_count_field(stars))
+            percent = round(100 * count / self.review_count) if self.review_count else 0
+            histogram.append((stars, count, percent))
+        return histogram
+
 class Review(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reviews')
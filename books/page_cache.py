@@ -0,0 +1,82 @@
+"""
+Versioned cache for the shared part of the book detail page.
+
+Each book has a version token in the cache. The book (with its author and
+category) and its reviews are cached under a key containing that token, so
+changing the token is all it takes to invalidate them: nothing has to be
+found and deleted, and stale entries simply expire. Tokens are replaced
+after the surrounding transaction commits, so a request that reads the old
+rows can't re-cache them under the new token.
+
+The receivers in books/signals.py bump the version on Book, Review and
+BorrowRecord changes; code that changes those rows with queryset.update()
+(circulation.services, books.importer) calls bump() itself.
+"""
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.http import Http404
+
+# Bumps are seen only by processes sharing this cache backend; with a
+# per-process cache (the default LocMemCache) a bump made by another web
+# worker or a cron command (expire_holds, import_catalog) never arrives here,
+# so a cached page lives no longer than its availability can be out of date.
+CACHE_TIMEOUT = 60
+
+
+def version_key(book_id):
+    return f'book-page:{book_id}:version'
+
+
+def _new_token():
+    return time.time_ns()
+
+
+def get_version(book_id):
+    version = cache.get(version_key(book_id))
+    if version is None:
+        cache.add(version_key(book_id), _new_token(), None)
+        version = cache.get(version_key(book_id))
+    return version
+
+
+def bump(*book_ids):
+    """Invalidate the cached pages of `book_ids` once the current transaction commits."""
+    book_ids = [book_id for book_id in book_ids if book_id is not None]
+    if not book_ids:
+        return
+    token = _new_token()
+    transaction.on_commit(lambda: cache.set_many({version_key(book_id): token for book_id in book_ids}, None))
+
+
+def _load(book_id):
+    from .models import Book
+    try:
+        book = Book.objects.select_related('author', 'category').get(pk=book_id)
+    except Book.DoesNotExist:
+        raise Http404("No book found matching the query")
+    # Only what the page shows; the cache must not hold whole User rows (password hashes)
+    reviews = list(book.reviews.select_related('user').only(
+        'rating', 'comment', 'created_at', 'book_id', 'user__username'
+    ))
+    return {'book': book, 'reviews': reviews}
+
+
+def get_shared(book_id):
+    """{'book': Book, 'reviews': [Review]} for the detail page, from cache when current."""
+    key = f'book-page:{book_id}:v{get_version(book_id)}'
+    shared = cache.get(key)
+    if shared is None:
+        shared = _load(book_id)
+        cache.set(key, shared, CACHE_TIMEOUT)
+    return shared
+
+
+def get_user_flag(book_id, user_id, name, compute):
+    """A per-user value for this book, cached until the book's version changes."""
+    key = f'book-page:{book_id}:v{get_version(book_id)}:{name}:{user_id}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, CACHE_TIMEOUT)
+    return value
@@ -0,0 +1,67 @@
+"""
+Incremental maintenance of the denormalized rating aggregates on Book.
+
+Each review change is applied as a single UPDATE with F() expressions, so
+concurrent reviews never lose increments. `recompute()` rebuilds the
+aggregates from the Review table to repair drift.
+"""
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Count, F
+from .models import Book, Review
+from . import page_cache
+
+
+def apply_rating_change(book_id, old_rating=None, new_rating=None):
+    """Move one review from old_rating to new_rating (None meaning absent)."""
+    if old_rating == new_rating:
+        return
+
+    updates = {}
+    if old_rating is not None:
+        updates['rating_sum'] = F('rating_sum') - old_rating
+        updates['review_count'] = F('review_count') - 1
+        updates[Book.rating_count_field(old_rating)] = F(Book.rating_count_field(old_rating)) - 1
+    if new_rating is not None:
+        updates['rating_sum'] = updates.get('rating_sum', F('rating_sum')) + new_rating
+        updates['review_count'] = updates.get('review_count', F('review_count')) + 1
+        updates[Book.rating_count_field(new_rating)] = F(Book.rating_count_field(new_rating)) + 1
+
+    Book.objects.filter(pk=book_id).update(**updates)
+
+
+def compute_aggregates():
+    """{book_id: {field: value}} computed from the Review table in one grouped query."""
+    aggregates = defaultdict(lambda: dict.fromkeys(Book.RATING_FIELDS, 0))
+    for row in Review.objects.values('book_id', 'rating').annotate(n=Count('id')).order_by():
+        book = aggregates[row['book_id']]
+        book['rating_sum'] += row['rating'] * row['n']
+        book['review_count'] += row['n']
+        book[Book.rating_count_field(row['rating'])] += row['n']
+    return aggregates
+
+
+def recompute(batch_size=1000):
+    """Repair drifted aggregates. Returns the number of books corrected."""
+    empty = dict.fromkeys(Book.RATING_FIELDS, 0)
+    corrected = 0
+
+    with transaction.atomic():
+        aggregates = compute_aggregates()
+        drifted = []
+        for book in Book.objects.only('pk', *Book.RATING_FIELDS).iterator(chunk_size=batch_size):
+            expected = aggregates.get(book.pk, empty)
+            if any(getattr(book, field) != value for field, value in expected.items()):
+                for field, value in expected.items():
+                    setattr(book, field, value)
+                drifted.append(book)
+            if len(drifted) >= batch_size:
+                Book.objects.bulk_update(drifted, Book.RATING_FIELDS)
+                page_cache.bump(*[book.pk for book in drifted])
+                corrected += len(drifted)
+                drifted = []
+        Book.objects.bulk_update(drifted, Book.RATING_FIELDS)
+        page_cache.bump(*[book.pk for book in drifted])
+        corrected += len(drifted)
+
+    return corrected
@@ -0,0 +1,156 @@
+"""
+Full-text search index for the book catalog.
+
+On SQLite the catalog is mirrored into an FTS5 virtual table whose rowid is
+the Book primary key. The index is kept in sync by the receivers in
+books/signals.py and can be rebuilt with `manage.py rebuild_search_index`.
+Other database backends fall back to plain icontains filtering.
+"""
+import re
+from django.db import connection
+from django.db.models import Q
+
+FTS_TABLE = 'books_book_fts'
+BATCH_SIZE = 500
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def is_enabled(conn=None):
+    return (conn or connection).vendor == 'sqlite'
+
+
+def create_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(title, author, category, isbn, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def write_rows(conn, rows):
+    """Insert (id, title, author, category, isbn) rows, replacing existing entries."""
+    rows = list(rows)
+    with conn.cursor() as cursor:
+        for chunk in _chunks(rows):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})",
+                [row[0] for row in chunk]
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, author, category, isbn) VALUES (%s, %s, %s, %s, %s)",
+                [(pk, title, author or '', category or '', isbn) for pk, title, author, category, isbn in chunk]
+            )
+    return len(rows)
+
+
+def _book_rows(queryset):
+    return queryset.values_list('pk', 'title', 'author__name', 'category__name', 'isbn')
+
+
+def index_books(book_ids):
+    if not is_enabled():
+        return 0
+    from .models import Book
+    count = 0
+    for chunk in _chunks(book_ids):
+        count += write_rows(connection, _book_rows(Book.objects.filter(pk__in=chunk)))
+    return count
+
+
+def remove_books(book_ids):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        for chunk in _chunks(book_ids):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+
+
+def _update_column(column, value, fk_column, fk_value):
+    from .models import Book
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {FTS_TABLE} SET {column} = %s "
+            f"WHERE rowid IN (SELECT id FROM {Book._meta.db_table} WHERE {fk_column} = %s)",
+            [value, fk_value]
+        )
+
+
+def update_author(author, name=None):
+    if is_enabled():
+        _update_column('author', author.name if name is None else name, 'author_id', author.pk)
+
+
+def update_category(category, name=None):
+    if is_enabled():
+        _update_column('category', category.name if name is None else name, 'category_id', category.pk)
+
+
+def rebuild(batch_size=2000):
+    """Drop every entry and re-index the whole catalog. Returns the number of books indexed."""
+    from .models import Book
+    create_index(connection)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    count = 0
+    batch = []
+    for row in _book_rows(Book.objects.order_by('pk')).iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            count += write_rows(connection, batch)
+            batch = []
+    count += write_rows(connection, batch)
+    return count
+
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 query: every word must match, and the
+    last characters typed are treated as a prefix ("harr pot" -> harry potter).
+    """
+    tokens = TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def filter_books(queryset, query, ranked=True):
+    """Restrict a Book queryset to search matches, best matches first unless `ranked` is False."""
+    if not is_enabled():
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(author__name__icontains=query) |
+            Q(category__name__icontains=query) |
+            Q(isbn__icontains=query)
+        )
+
+    match = build_match_expression(query)
+    if match is None:
+        return queryset.none()
+
+    book_table = queryset.model._meta.db_table
+    where = [f"{FTS_TABLE}.rowid = {book_table}.id", f"{FTS_TABLE} MATCH %s"]
+    if not ranked:
+        # Aggregations (facet counts) must not group by the rank column
+        return queryset.extra(tables=[FTS_TABLE], where=where, params=[match])
+    # Join the FTS table directly so SQLite drives the query from the index
+    # and reads the bm25 rank for matching rows only.
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=where,
+        params=[match],
+        select={'search_rank': f"{FTS_TABLE}.rank"},
+    ).order_by('search_rank', '-publication_date')
@@ -0,0 +1,92 @@
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Book, Author, Category, Review
+from . import search, ratings, page_cache
+from circulation.models import BorrowRecord
+from core import thumbnails
+
+# --- Search Index Sync ---
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, raw=False, **kwargs):
+    # Fixture loads may arrive before their authors; run rebuild_search_index afterwards.
+    if raw:
+        return
+    search.index_books([instance.pk])
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    search.remove_books([instance.pk])
+
+@receiver(post_save, sender=Author)
+def reindex_author_books(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    search.update_author(instance)
+
+@receiver(post_save, sender=Category)
+def reindex_category_books(sender, instance, created=False, raw=False, **kwargs):
+    if raw or created:
+        return
+    search.update_category(instance)
+
+@receiver(pre_delete, sender=Category)
+def clear_category_from_index(sender, instance, **kwargs):
+    # Books survive the delete with category=NULL via a bulk update that sends no signals.
+    search.update_category(instance, name='')
+
+# --- Rating Aggregates ---
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, raw=False, **kwargs):
+    instance._previous_rating = None
+    instance._previous_book_id = None
+    if instance.pk and not raw:
+        previous = Review.objects.filter(pk=instance.pk).values('rating', 'book_id').first()
+        if previous:
+            instance._previous_rating = previous['rating']
+            instance._previous_book_id = previous['book_id']
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_rating = getattr(instance, '_previous_rating', None)
+    old_book_id = getattr(instance, '_previous_book_id', None)
+    new_rating = int(instance.rating)
+
+    if old_book_id is not None and old_book_id != instance.book_id:
+        ratings.apply_rating_change(old_book_id, old_rating=old_rating)
+        old_rating = None
+    ratings.apply_rating_change(instance.book_id, old_rating=old_rating, new_rating=new_rating)
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    ratings.apply_rating_change(instance.book_id, old_rating=int(instance.rating))
+
+# --- Detail Page Cache ---
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=BorrowRecord)
+@receiver(post_delete, sender=BorrowRecord)
+def bump_book_page(sender, instance, **kwargs):
+    book_id = instance.pk if sender is Book else instance.book_id
+    page_cache.bump(book_id, getattr(instance, '_previous_book_id', None))
+
+@receiver(post_save, sender=Author)
+def bump_author_book_pages(sender, instance, created=False, raw=False, **kwargs):
+    if not (raw or created):
+        page_cache.bump(*instance.books.values_list('pk', flat=True))
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def bump_category_book_pages(sender, instance, created=False, raw=False, **kwargs):
+    if not (raw or created):
+        page_cache.bump(*instance.books.values_list('pk', flat=True))
+
+# --- Cover Thumbnails ---
+
+thumbnails.register(Book, 'cover_image', ['list', 'detail'])
@@ -1,3 +1,376 @@
-from django.test import TestCase
+import os
+import tempfile
+from io import StringIO
+from decimal import Decimal
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.db import connection
+from django.contrib.auth import get_user_model
+from books.models import Book, Author, Category, Review
+from django.core.cache import cache
+from books import page_cache, search, ratings
+from circulation.models import BorrowRecord
 
-# Create your tests here.
+User = get_user_model()
+
+
+class CatalogSearchTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+
+        self.fiction = Category.objects.create(name="Fiction")
+        self.science = Category.objects.create(name="Science")
+        self.rowling = Author.objects.create(name="J.K. Rowling")
+        self.hawking = Author.objects.create(name="Stephen Hawking")
+
+        self.potter = Book.objects.create(
+            title="Harry Potter and the Philosopher's Stone",
+            isbn="9780747532699",
+            author=self.rowling,
+            category=self.fiction,
+            publication_date="1997-06-26",
+        )
+        self.history = Book.objects.create(
+            title="A Brief History of Time",
+            isbn="9780553380163",
+            author=self.hawking,
+            category=self.science,
+            publication_date="1988-04-01",
+        )
+
+    def search(self, q):
+        response = self.client.get(reverse('book_list'), {'q': q})
+        return list(response.context['books'])
+
+    def test_prefix_match_on_every_word(self):
+        self.assertEqual(self.search("harr pot"), [self.potter])
+        self.assertEqual(self.search("brief tim"), [self.history])
+
+    def test_matches_author_category_and_isbn(self):
+        self.assertEqual(self.search("hawk"), [self.history])
+        self.assertEqual(self.search("fiction"), [self.potter])
+        self.assertEqual(self.search("978074753"), [self.potter])
+
+    def test_title_match_ranks_first(self):
+        Book.objects.create(
+            title="Cosmos",
+            isbn="9780345539434",
+            author=Author.objects.create(name="Carl Sagan"),
+            category=self.science,
+            publication_date="2000-01-01",
+        )
+        results = self.search("time")
+        self.assertEqual(results[0], self.history)
+
+    def test_index_follows_author_and_category_changes(self):
+        self.rowling.name = "Robert Galbraith"
+        self.rowling.save()
+        self.assertEqual(self.search("galbraith"), [self.potter])
+        self.assertEqual(self.search("rowling"), [])
+
+        self.science.delete()
+        self.assertEqual(self.search("science"), [])
+
+    def test_deleted_book_is_removed_from_index(self):
+        self.potter.delete()
+        self.assertEqual(self.search("potter"), [])
+
+    def test_rebuild_restores_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(self.search("potter"), [])
+
+        self.assertEqual(search.rebuild(), 2)
+        self.assertEqual(self.search("potter"), [self.potter])
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='password')
+        self.bob = User.objects.create_user(username='bob', password='password')
+        author = Author.objects.create(name="Test Author")
+        self.book = Book.objects.create(title="Dune", isbn="9780441013593", author=author, publication_date="1965-08-01")
+        self.other = Book.objects.create(title="Emma", isbn="9780141439587", author=author, publication_date="1815-12-23")
+
+    def assertAggregates(self, book, rating_sum, review_count, histogram):
+        book.refresh_from_db()
+        self.assertEqual(book.rating_sum, rating_sum)
+        self.assertEqual(book.review_count, review_count)
+        self.assertEqual([count for stars, count, percent in book.rating_histogram], histogram)
+
+    def test_create_edit_delete_keep_aggregates_in_sync(self):
+        review = Review.objects.create(user=self.alice, book=self.book, rating=5, comment="Great")
+        Review.objects.create(user=self.bob, book=self.book, rating=3, comment="Fine")
+        self.assertAggregates(self.book, 8, 2, [1, 0, 1, 0, 0])
+        self.assertEqual(self.book.average_rating, 4)
+
+        review.rating = 4
+        review.save()
+        self.assertAggregates(self.book, 7, 2, [0, 1, 1, 0, 0])
+
+        review.delete()
+        self.assertAggregates(self.book, 3, 1, [0, 0, 1, 0, 0])
+
+    def test_stale_book_save_does_not_clobber_aggregates(self):
+        stale = Book.objects.get(pk=self.book.pk)
+        Review.objects.create(user=self.alice, book=self.book, rating=4, comment="Good")
+
+        stale.title = "Dune (Deluxe Edition)"
+        stale.save()
+        self.assertAggregates(self.book, 4, 1, [0, 1, 0, 0, 0])
+
+    def test_recompute_repairs_drift(self):
+        Review.objects.create(user=self.alice, book=self.book, rating=2, comment="Meh")
+        Book.objects.filter(pk=self.book.pk).update(rating_sum=99, review_count=7)
+        Book.objects.filter(pk=self.other.pk).update(rating_5_count=3)
+
+        self.assertEqual(ratings.recompute(), 2)
+        self.assertAggregates(self.book, 2, 1, [0, 0, 0, 1, 0])
+        self.assertAggregates(self.other, 0, 0, [0, 0, 0, 0, 0])
+        self.assertEqual(ratings.recompute(), 0)
+
+    def test_book_list_sorts_by_rating(self):
+        Review.objects.create(user=self.alice, book=self.other, rating=5, comment="Classic")
+        Review.objects.create(user=self.alice, book=self.book, rating=3, comment="Long")
+
+        response = self.client.get(reverse('book_list'), {'sort': 'rating'})
+        self.assertEqual(list(response.context['books']), [self.other, self.book])
+
+
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        self.herbert = Author.objects.create(name="Frank Herbert")
+        self.dune = Book.objects.create(
+            title="Dune", isbn="9780441013593", author=self.herbert,
+            publication_date="1965-08-01", total_copies=3, available_copies=1,
+        )
+
+    def write_feed(self, suffix, content):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def import_feed(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalog', path, *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upserts_by_isbn_and_resolves_names(self):
+        path = self.write_feed('.csv', (
+            "isbn,title,author,category,publication_date,total_copies,price\n"
+            "978-0441013593,Dune (Deluxe),Frank Herbert,Science Fiction,1965-08-01,5,18.00\n"
+            "9780441172719,Dune Messiah,Frank Herbert,Science Fiction,1969,2,9.99\n"
+            "9780553293357,Foundation,Isaac Asimov,Science Fiction,1951-05-01,0,\n"
+            ",Missing ISBN,Nobody,,,,\n"
+        ))
+        out, err = self.import_feed(path, '--batch-size', '2')
+
+        self.assertIn("4 rows", out)
+        self.assertIn("2 created, 1 updated, 0 unchanged, 1 skipped", out)
+        self.assertIn("line 5", err)
+
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.title, "Dune (Deluxe)")
+        # Two copies are on loan, so they stay unavailable after the restock
+        self.assertEqual((self.dune.total_copies, self.dune.available_copies), (5, 3))
+
+        self.assertEqual(Author.objects.filter(name="Frank Herbert").count(), 1)
+        self.assertEqual(Category.objects.filter(name="Science Fiction").count(), 1)
+        messiah = Book.objects.get(isbn="9780441172719")
+        self.assertEqual((messiah.author, str(messiah.publication_date)), (self.herbert, "1969-01-01"))
+        self.assertEqual(Book.objects.get(isbn="9780553293357").status, 'OUT_OF_STOCK')
+
+        out, err = self.import_feed(path)
+        self.assertIn("0 created, 0 updated, 3 unchanged", out)
+
+        response = self.client.get(reverse('book_list'), {'q': 'asimov'})
+        self.assertEqual([b.isbn for b in response.context['books']], ["9780553293357"])
+
+    def test_jsonl_with_skip_existing(self):
+        path = self.write_feed('.jsonl', (
+            '{"isbn": "9780441013593", "title": "Renamed", "author": "Someone Else"}\n'
+            '{"isbn": "9780062316097", "title": "Sapiens", "author": "Yuval Noah Harari", "total_copies": 4, "publication_date": "2011"}\n'
+            'not json\n'
+        ))
+        out, err = self.import_feed(path, '--skip-existing')
+
+        self.assertIn("1 created, 0 updated, 0 unchanged, 2 skipped", out)
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.title, "Dune")
+        self.assertFalse(Author.objects.filter(name="Someone Else").exists())
+        sapiens = Book.objects.get(isbn="9780062316097")
+        self.assertEqual((sapiens.total_copies, sapiens.available_copies, sapiens.category), (4, 4, None))
+
+
+    def test_blank_publication_date_keeps_the_current_one(self):
+        path = self.write_feed('.csv', (
+            "isbn,title,author,publication_date\n"
+            "9780441013593,Dune (Deluxe),Frank Herbert,\n"
+            "9780441172719,Dune Messiah,Frank Herbert,\n"
+        ))
+        out, err = self.import_feed(path)
+
+        self.assertIn("0 created, 1 updated, 0 unchanged, 1 skipped", out)
+        self.assertIn("line 3: publication_date is required for a new book", err)
+        self.dune.refresh_from_db()
+        self.assertEqual((self.dune.title, str(self.dune.publication_date)), ("Dune (Deluxe)", "1965-08-01"))
+        self.assertFalse(Book.objects.filter(isbn="9780441172719").exists())
+
+
+    def test_blank_columns_keep_the_existing_values(self):
+        fiction = Category.objects.create(name="Fiction")
+        Book.objects.filter(pk=self.dune.pk).update(category=fiction, price=Decimal('18.00'), borrow_duration=7)
+        path = self.write_feed('.csv', (
+            "isbn,title,author,category,publication_date,total_copies,price,borrow_duration\n"
+            "9780441013593,Dune (Deluxe),Frank Herbert,,,,,\n"
+            "9780441172719,Dune Messiah,Frank Herbert,,1969,,,\n"
+            "9780553293357,Foundation,Isaac Asimov,,1951,1,NaN,\n"
+            "9780553293358,Foundation,Isaac Asimov,,1951,1,-5,\n"
+        ))
+        out, err = self.import_feed(path)
+
+        self.assertIn("1 created, 1 updated, 0 unchanged, 2 skipped", out)
+        self.assertIn("line 4: invalid price 'NaN'", err)
+        self.assertIn("line 5: negative price", err)
+        self.dune.refresh_from_db()
+        self.assertEqual(self.dune.title, "Dune (Deluxe)")
+        self.assertEqual(
+            (self.dune.category, self.dune.total_copies, self.dune.available_copies, self.dune.price, self.dune.borrow_duration),
+            (fiction, 3, 1, Decimal('18.00'), 7),
+        )
+        messiah = Book.objects.get(isbn="9780441172719")
+        self.assertEqual(
+            (messiah.category, messiah.total_copies, messiah.price, messiah.borrow_duration), (None, 1, Decimal('0.00'), 14)
+        )
+
+
+class CatalogFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fiction = Category.objects.create(name="Fiction")
+        self.science = Category.objects.create(name="Science")
+        herbert = Author.objects.create(name="Frank Herbert")
+        sagan = Author.objects.create(name="Carl Sagan")
+        self.dune = Book.objects.create(title="Dune", isbn="9780441013593", author=herbert, category=self.fiction, publication_date="1965-08-01")
+        self.messiah = Book.objects.create(title="Dune Messiah", isbn="9780441172719", author=herbert, category=self.fiction, publication_date="1969-10-15", available_copies=0)
+        self.cosmos = Book.objects.create(title="Cosmos", isbn="9780345539434", author=sagan, category=self.science, publication_date="1980-10-01")
+        self.lost = Book.objects.create(title="Contact", isbn="9781501197987", author=sagan, category=self.fiction, publication_date="1985-09-01")
+        Book.objects.filter(pk=self.lost.pk).update(status='LOST')
+
+    def get(self, **params):
+        return self.client.get(reverse('book_list'), params).context
+
+    def counts(self, context, dimension):
+        return {entry['label']: entry['count'] for entry in context['facets'][dimension]}
+
+    def test_counts_per_category_status_and_decade(self):
+        context = self.get()
+        self.assertEqual(self.counts(context, 'category'), {'Fiction': 2, 'Science': 1})
+        self.assertEqual(self.counts(context, 'status'), {'Available Now': 2, 'Borrowed / Out of Stock': 1})
+        self.assertEqual(self.counts(context, 'decade'), {'1980s': 1, '1960s': 2})
+
+    def test_selection_filters_results_but_not_its_own_facet(self):
+        context = self.get(category=self.fiction.pk)
+        self.assertEqual(set(context['books']), {self.dune, self.messiah})
+        self.assertEqual(self.counts(context, 'category'), {'Fiction': 2, 'Science': 1})
+        self.assertEqual(self.counts(context, 'decade'), {'1960s': 2})
+
+        context = self.get(category=self.fiction.pk, decade=1960, status='available')
+        self.assertEqual(list(context['books']), [self.dune])
+        selected = [entry for entry in context['facets']['status'] if entry['selected']]
+        self.assertEqual(selected[0]['label'], 'Available Now')
+        self.assertNotIn('status=', selected[0]['query'])
+
+    def test_out_of_range_decade_is_ignored(self):
+        for decade in ('100000', '-10', '0', '9999'):
+            response = self.client.get(reverse('book_list'), {'decade': decade})
+            self.assertEqual(response.status_code, 200, decade)
+            self.assertEqual(len(response.context['books']), 3)
+            self.assertFalse(any(entry['selected'] for entry in response.context['facets']['decade']))
+
+    def test_search_text_and_author_narrow_facets(self):
+        context = self.get(q='dune')
+        self.assertEqual(self.counts(context, 'category'), {'Fiction': 2})
+
+        context = self.get(author=self.cosmos.author_id)
+        self.assertEqual(list(context['books']), [self.cosmos])
+        self.assertEqual(context['author_filter'].name, "Carl Sagan")
+
+    def test_counts_are_cached_per_normalized_query(self):
+        self.get(q='Dune ')
+        with self.assertNumQueries(2):
+            # Paginator COUNT and the page of books; facets come from the cache
+            self.get(q='dune', category=self.fiction.pk)
+
+    def test_staff_see_lost_bucket(self):
+        librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.client.force_login(librarian)
+        context = self.get()
+        self.assertEqual(self.counts(context, 'status')['Lost Books'], 1)
+        self.assertEqual(self.counts(context, 'category'), {'Fiction': 3, 'Science': 1})
+
+
+class BookPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.member = User.objects.create_user(username='member', password='password')
+        self.author = Author.objects.create(name="Frank Herbert", bio="Author of Dune.")
+        self.book = Book.objects.create(title="Dune", isbn="9780441013593", author=self.author, publication_date="1965-08-01")
+        self.url = reverse('book_detail', args=[self.book.pk])
+
+    def render(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(self.url)
+
+    def test_repeat_anonymous_views_run_no_queries(self):
+        self.render()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Author of Dune.")
+
+    def test_review_book_and_loan_changes_invalidate(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.member, book=self.book, rating=4, comment="A classic")
+        self.assertContains(self.render(), "A classic")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = "Dune (Deluxe)"
+            self.book.save()
+        self.assertContains(self.render(), "Dune (Deluxe)")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.bio = "Wrote six Dune novels."
+            self.author.save()
+        self.assertContains(self.render(), "Wrote six Dune novels.")
+
+    def test_can_review_is_per_user(self):
+        other = User.objects.create_user(username='other', password='password')
+        with self.captureOnCommitCallbacks(execute=True):
+            BorrowRecord.objects.create(user=self.member, book=self.book, status='RETURNED')
+
+        self.client.force_login(self.member)
+        self.assertTrue(self.render().context['can_review'])
+        self.client.force_login(other)
+        self.assertFalse(self.render().context['can_review'])
+
+        self.client.force_login(self.member)
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.member, book=self.book, rating=5, comment="Loved it")
+        self.assertFalse(self.render().context['can_review'])
+
+    def test_cached_reviews_hold_no_user_secrets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=self.member, book=self.book, rating=4, comment="A classic")
+        self.render()
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(self.url), "member")
+
+        review = page_cache.get_shared(self.book.pk)['reviews'][0]
+        self.assertIn('password', review.user.get_deferred_fields())
+
+    def test_missing_book_is_404(self):
+        self.assertEqual(self.client.get(reverse('book_detail', args=[9999])).status_code, 404)
@@ -2,9 +2,12 @@ from django.shortcuts import render
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
-from django.db.models import Q
+from django.db.models import F, ExpressionWrapper, FloatField
+from django.db.models.functions import NullIf
 from .models import Book, Author, Category
 from .forms import BookForm, AuthorForm, CategoryForm
+from . import search, facets
+from core.pagination import CursorPaginationMixin
 
 # Mixin to restrict access to Librarians and Admins
 class LibrarianRequiredMixin(UserPassesTestMixin):
@@ -13,49 +16,98 @@ class LibrarianRequiredMixin(UserPassesTestMixin):
                self.request.user.role in ['LIBRARIAN', 'ADMIN']
 
 # Public Views
-class BookListView(ListView):
+class BookListView(CursorPaginationMixin, ListView):
     model = Book
     template_name = 'books/book_list.html'
     context_object_name = 'books'
     paginate_by = 12
+    cursor_ordering = ('-publication_date', '-pk')
+    cursor_approximate_count = True
 
-    def get_queryset(self):
-        query = self.request.GET.get('q')
-        status_filter = self.request.GET.get('status')
+    def use_cursor_pagination(self):
+        # Search results and rating sort have no stable key to page on
+        return super().use_cursor_pagination() and not self.request.GET.get('q') \
+            and self.request.GET.get('sort') != 'rating'
+
+    def is_staff(self):
         user = self.request.user
-        
-        queryset = Book.objects.all().order_by('-publication_date')
-        
+        return user.is_authenticated and user.role in ['LIBRARIAN', 'ADMIN']
+
+    def get_selected_filters(self):
+        selected = facets.selected_filters(self.request.GET)
+        if selected['status'] == 'lost' and not self.is_staff():
+            selected['status'] = None
+        return selected
+
+    def get_base_queryset(self):
+        """Books visible to this user, narrowed by author; facet dimensions are applied on top."""
+        queryset = Book.objects.all()
+
         # Hide LOST books from non-staff
-        if not (user.is_authenticated and user.role in ['LIBRARIAN', 'ADMIN']):
+        if not self.is_staff():
             queryset = queryset.exclude(status='LOST')
-        
+
+        author = self.request.GET.get('author')
+        if author and author.isdigit():
+            queryset = queryset.filter(author_id=author)
+        return queryset
+
+    def get_queryset(self):
+        query = self.request.GET.get('q')
+        sort = self.request.GET.get('sort')
+
+        queryset = self.get_base_queryset().select_related('author').order_by('-publication_date')
+        queryset = facets.apply_filters(queryset, self.get_selected_filters())
+
+        # Full-text search (ranked by relevance, prefix matching on each word)
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(author__name__icontains=query) |
-                Q(category__name__icontains=query) |
-                Q(isbn__icontains=query)
+            queryset = search.filter_books(queryset, query)
+
+        # Highest rated first, read from the denormalized aggregates (no Review scan)
+        if sort == 'rating':
+            average = ExpressionWrapper(
+                F('rating_sum') * 1.0 / NullIf(F('review_count'), 0), output_field=FloatField()
             )
-            
-        if status_filter:
-            if status_filter == 'available':
-                queryset = queryset.filter(status='AVAILABLE')
-            elif status_filter == 'borrowed':
-                queryset = queryset.filter(status__in=['OUT_OF_STOCK', 'RESERVED'])
-            elif status_filter == 'lost' and user.is_authenticated and user.role in ['LIBRARIAN', 'ADMIN']:
-                queryset = queryset.filter(status='LOST')
+            queryset = queryset.order_by(average.desc(nulls_last=True), '-review_count', '-publication_date')
                 
         return queryset
 
+    def get_facets(self):
+        query = self.request.GET.get('q', '')
+        author = self.request.GET.get('author', '')
+        queryset = self.get_base_queryset()
+        if query:
+            queryset = search.filter_books(queryset, query, ranked=False)
+
+        key = facets.cache_key(query, author, self.is_staff())
+        groups = facets.get_groups(queryset, key)
+        return facets.build_facets(groups, self.get_selected_filters(), self.request.GET, include_lost=self.is_staff())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['facets'] = self.get_facets()
+
+        author = self.request.GET.get('author')
+        if author and author.isdigit():
+            context['author_filter'] = Author.objects.filter(pk=author).first()
+            params = self.request.GET.copy()
+            params.pop('author')
+            context['clear_author_query'] = params.urlencode()
+
+        # Querystring for page links, keeping every active filter
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        context['page_query'] = params.urlencode()
+        return context
+
 from django.shortcuts import render, redirect
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
-from django.db.models import Q, Avg
 from .models import Book, Author, Category, Review
 from circulation.models import BorrowRecord
 from .forms import BookForm, AuthorForm, CategoryForm
+from . import page_cache
 
 # ... (Mixins and List views remain same)
 
@@ -63,20 +115,27 @@ class BookDetailView(DetailView):
     model = Book
     template_name = 'books/book_detail.html'
 
+    def get_object(self, queryset=None):
+        # Book, author, category and reviews come from the versioned page cache
+        if not hasattr(self, '_shared'):
+            self._shared = page_cache.get_shared(self.kwargs['pk'])
+        return self._shared['book']
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        book = self.get_object()
+        book = self.object
+        context['reviews'] = self._shared['reviews']
         
-        # Calculate Avg Rating
-        context['avg_rating'] = book.reviews.aggregate(Avg('rating'))['rating__avg']
+        # Avg Rating (denormalized on Book)
+        context['avg_rating'] = book.average_rating
         
         # Check if current user can review (must have borrowed and returned this book)
-        if self.request.user.is_authenticated:
-            context['can_review'] = BorrowRecord.objects.filter(
-                user=self.request.user,
-                book=book,
-                status='RETURNED'
-            ).exists() and not Review.objects.filter(user=self.request.user, book=book).exists()
+        user = self.request.user
+        if user.is_authenticated:
+            context['can_review'] = page_cache.get_user_flag(book.pk, user.pk, 'can_review', lambda: (
+                BorrowRecord.objects.filter(user=user, book=book, status='RETURNED').exists()
+                and not Review.objects.filter(user=user, book=book).exists()
+            ))
             
         return context
 
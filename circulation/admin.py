@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import BorrowRecord, Reservation
+from .models import BorrowRecord, CirculationEvent, FineTransaction, Reservation
 
 @admin.register(BorrowRecord)
 class BorrowRecordAdmin(admin.ModelAdmin):
@@ -9,5 +9,38 @@ class BorrowRecordAdmin(admin.ModelAdmin):
 
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
-    list_display = ('user', 'book', 'reserved_date', 'status')
-    list_filter = ('status',)
\ No newline at end of file
+    list_display = ('user', 'book', 'reserved_date', 'status', 'queue_position')
+    list_filter = ('status',)
+
+@admin.register(FineTransaction)
+class FineTransactionAdmin(admin.ModelAdmin):
+    # Ledger entries are append-only; balances are kept in step by circulation.fines
+    list_display = ('user', 'kind', 'amount', 'borrow_record', 'created_by', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('user__username',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(CirculationEvent)
+class CirculationEventAdmin(admin.ModelAdmin):
+    # The event log is append-only; consumers track their position by event id.
+    # Ids rather than objects, as the member or book may since have been deleted
+    list_display = ('id', 'kind', 'user_id', 'book_id', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('user__username', 'book__title')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
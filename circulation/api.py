@@ -0,0 +1,222 @@
+"""
+JSON circulation API for self-checkout kiosks and handheld scanners.
+
+A request carries one operation or a pipelined batch of them (issue, return,
+renew, lost), each with a client-chosen idempotency `key`. Operations run in
+order, each in its own transaction, through the same services as the desk
+pages. An operation's outcome is stored under its key in that same
+transaction, so a retried key replays the stored result instead of acting
+twice, even when the first attempt's response was lost in flight. Lookups that
+fail (unknown member, no open loan) change nothing and are not stored.
+Every response ends with the updated loan state of the members it touched.
+Stored outcomes are kept for KEEP_KEYS_FOR, long enough for any client retry;
+the purge_api_keys command deletes older ones.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import BorrowRecord, IdempotencyKey
+from . import services
+from books.models import Book
+
+User = get_user_model()
+
+MAX_BATCH = 50
+KEEP_KEYS_FOR = timedelta(days=7)
+
+
+class OperationError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def fingerprint(operation):
+    body = {name: value for name, value in operation.items() if name != 'key'}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _member(operation):
+    username = operation.get('member')
+    if not username:
+        raise OperationError("'member' is required.")
+    try:
+        return User.objects.get(username=username)
+    except User.DoesNotExist:
+        raise OperationError(f"No member with username '{username}'.", 404)
+
+
+def _open_loan(operation):
+    # The book may be on loan to several members; `member` picks one
+    isbn = operation.get('isbn')
+    if not isbn:
+        raise OperationError("'isbn' is required.")
+    loans = BorrowRecord.objects.filter(book__isbn=isbn, status='ISSUED').select_related('user', 'book')
+    if operation.get('member'):
+        loans = loans.filter(user__username=operation['member'])
+    loans = list(loans[:2])
+    if not loans:
+        raise OperationError(f"No open loan for ISBN {isbn}.", 404)
+    if len(loans) > 1:
+        raise OperationError(f"ISBN {isbn} is on loan to several members; send 'member'.")
+    return loans[0]
+
+
+def _amount(operation, name, default):
+    try:
+        amount = Decimal(str(operation.get(name, default)))
+    except InvalidOperation:
+        raise OperationError(f"'{name}' must be a number.")
+    # NaN can't be compared, and Infinity can't be stored
+    if not amount.is_finite():
+        raise OperationError(f"'{name}' must be a number.")
+    if amount < 0:
+        raise OperationError(f"'{name}' cannot be negative.")
+    return amount
+
+
+def _flag(operation, name):
+    # A JSON boolean only: bool("false") would be true
+    value = operation.get(name, False)
+    if not isinstance(value, bool):
+        raise OperationError(f"'{name}' must be true or false.")
+    return value
+
+
+def _loan(record):
+    return {
+        'id': record.pk,
+        'isbn': record.book.isbn,
+        'title': record.book.title,
+        'member': record.user.username,
+        'status': record.status,
+        'due_date': record.due_date.isoformat(),
+        'renewal_count': record.renewal_count,
+    }
+
+
+def issue(operation, caller):
+    member = _member(operation)
+    isbn = operation.get('isbn')
+    try:
+        book = Book.objects.get(isbn=isbn)
+    except Book.DoesNotExist:
+        raise OperationError(f"No book with ISBN {isbn}.", 404)
+    return member, {'loan': _loan(services.issue_book(member, book))}
+
+
+def return_(operation, caller):
+    record = _open_loan(operation)
+    pay_now = _flag(operation, 'pay_now')
+    fine, overdue_days = services.calculate_fine(record)
+    reservation = services.return_book(
+        record, Decimal('0.00') if pay_now else fine, paid=fine if pay_now else Decimal('0.00'), by=caller
+    )
+    return record.user, {
+        'loan': _loan(record),
+        'fine': str(fine),
+        'overdue_days': overdue_days,
+        'paid': pay_now,
+        # Set the copy aside for this member instead of shelving it
+        'hold_for': reservation.user.username if reservation else None,
+    }
+
+
+def renew(operation, caller):
+    record = _open_loan(operation)
+    return record.user, {'loan': _loan(services.renew_loan(record))}
+
+
+def lost(operation, caller):
+    record = _open_loan(operation)
+    fee = _amount(operation, 'fee', record.book.price)
+    pay_now = _flag(operation, 'pay_now')
+    services.mark_lost(record, Decimal('0.00') if pay_now else fee, paid=fee if pay_now else Decimal('0.00'), by=caller)
+    return record.user, {'loan': _loan(record), 'fee': str(fee), 'paid': pay_now}
+
+
+ACTIONS = {'issue': issue, 'return': return_, 'renew': renew, 'lost': lost}
+
+
+def apply(operation, caller):
+    """
+    Run one operation for `caller` and return (member_id or None, result).
+    The result dict always has `key`, `action`, `ok` and `status`.
+    """
+    if not isinstance(operation, dict):
+        return None, {'key': None, 'action': None, 'ok': False, 'status': 400, 'error': "Operations must be objects."}
+    key, action = operation.get('key'), operation.get('action')
+    result = {'key': key, 'action': action}
+    if not isinstance(key, str) or not 0 < len(key) <= 64:
+        return None, dict(result, ok=False, status=400, error="'key' must be a string of 1 to 64 characters.")
+    if action not in ACTIONS:
+        return None, dict(result, ok=False, status=400, error=f"'action' must be one of {', '.join(ACTIONS)}.")
+
+    digest = fingerprint(operation)
+    stored = IdempotencyKey.objects.filter(user=caller, key=key).first()
+    if stored is None:
+        try:
+            with transaction.atomic():
+                try:
+                    member, outcome = ACTIONS[action](operation, caller)
+                    result.update(ok=True, status=200, member=member.username, **outcome)
+                except services.CirculationError as e:
+                    member = None
+                    result.update(ok=False, status=409, error=e.message)
+                IdempotencyKey.objects.create(user=caller, key=key, fingerprint=digest, result=result)
+            return (member.pk if member else None), dict(result, replayed=False)
+        except OperationError as e:
+            return None, dict(result, ok=False, status=e.status, error=e.message)
+        except IntegrityError:
+            # A concurrent retry of the same key committed first; its work stands and ours rolled back
+            stored = IdempotencyKey.objects.get(user=caller, key=key)
+
+    if stored.fingerprint != digest:
+        return None, dict(result, ok=False, status=422, error="This key was already used for a different operation.")
+    member_id = User.objects.filter(username=stored.result.get('member')).values_list('pk', flat=True).first()
+    return member_id, dict(stored.result, replayed=True)
+
+
+def purge(now=None):
+    """Delete stored outcomes older than KEEP_KEYS_FOR. Returns how many were deleted."""
+    now = now or timezone.now()
+    return IdempotencyKey.objects.filter(created_at__lt=now - KEEP_KEYS_FOR).delete()[0]
+
+
+def member_state(user_ids, now=None):
+    """{username: balance, counts and open loans} for `user_ids`, in two queries."""
+    now = now or timezone.now()
+    users = User.objects.filter(pk__in=user_ids).values_list('pk', 'username', 'outstanding_balance')
+    state = {
+        pk: {'username': username, 'outstanding_balance': str(balance), 'active': 0, 'overdue': 0, 'loans': []}
+        for pk, username, balance in users
+    }
+    loans = BorrowRecord.objects.filter(user_id__in=user_ids, status='ISSUED').select_related('user', 'book')
+    for record in loans.order_by('due_date'):
+        member = state[record.user_id]
+        member['loans'].append(dict(_loan(record), overdue=record.due_date < now))
+        member['active'] += 1
+        member['overdue'] += record.due_date < now
+    return {member.pop('username'): member for member in state.values()}
+
+
+def handle(payload, caller):
+    """Run a request body: one operation, or {'operations': [...]}. Returns the response dict."""
+    operations = payload.get('operations', [payload]) if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise OperationError("Send an operation object or {'operations': [...]}.")
+    if len(operations) > MAX_BATCH:
+        raise OperationError(f"A batch holds at most {MAX_BATCH} operations.")
+
+    results, members = [], []
+    for operation in operations:
+        member_id, result = apply(operation, caller)
+        results.append(result)
+        if member_id and member_id not in members:
+            members.append(member_id)
+    return {'results': results, 'members': member_state(members)}
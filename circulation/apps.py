@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CirculationConfig(AppConfig):
     name = "circulation"
+
+    def ready(self):
+        from . import signals  # noqa: F401
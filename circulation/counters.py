@@ -0,0 +1,48 @@
+"""
+Active and overdue loan counts.
+
+Both counts come from one aggregate over the (status, due_date) index instead
+of loading loans and testing is_overdue in Python. The library-wide counts
+shown to staff are cached. The cache entry is dropped when a loan is issued,
+returned, renewed or written off, and it never outlives the next due date,
+which is when a loan can become overdue without any write.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from .models import BorrowRecord
+
+CACHE_KEY = 'circulation-counters'
+CACHE_TIMEOUT = 60 * 5
+
+
+def loan_counts(user_id=None, now=None):
+    """{'active', 'overdue', 'next_due'} for one member's loans, or all loans."""
+    now = now or timezone.now()
+    queryset = BorrowRecord.objects.filter(status='ISSUED')
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    return queryset.aggregate(
+        active=Count('pk'),
+        overdue=Count('pk', filter=Q(due_date__lt=now)),
+        next_due=Min('due_date', filter=Q(due_date__gte=now)),
+    )
+
+
+def staff_counts():
+    """Library-wide loan counts, cached until a loan changes or falls due."""
+    counts = cache.get(CACHE_KEY)
+    if counts is None:
+        now = timezone.now()
+        counts = loan_counts(now=now)
+        timeout = CACHE_TIMEOUT
+        if counts['next_due']:
+            timeout = max(min(timeout, int((counts['next_due'] - now).total_seconds()) + 1), 1)
+        cache.set(CACHE_KEY, counts, timeout)
+    return counts
+
+
+def invalidate():
+    """Drop the cached counts once the current transaction commits."""
+    transaction.on_commit(lambda: cache.delete(CACHE_KEY))
@@ -0,0 +1,63 @@
+"""
+Append-only circulation event log.
+
+BorrowRecord rows are updated in place, so their history is gone and every
+report has to rescan them. Each issue, return, renewal, loss and reservation
+change also appends a CirculationEvent in the same transaction, and events
+are never updated or deleted. Their foreign keys carry no database
+constraint, so an event outlives the member, book or loan it names;
+consumers must allow for ids that no longer resolve.
+
+Consumers read the log in id order from a stored high-water mark
+(ConsumerOffset). consume() passes each batch of new events to a handler
+and moves the mark in the handler's transaction, so a batch is applied
+exactly once even if the consumer crashes or two runs overlap. With
+SQLite's IMMEDIATE transactions, writers are serialized and ids commit in
+order, so the mark never skips an event that commits late.
+"""
+from django.db import transaction
+from django.utils import timezone
+from .models import CirculationEvent, ConsumerOffset
+
+Kind = CirculationEvent.Kind
+
+
+def for_loan(kind, record, now=None, **data):
+    """An unsaved event about `record`; write it with log()."""
+    return CirculationEvent(
+        kind=kind, user_id=record.user_id, book_id=record.book_id, borrow_record_id=record.pk,
+        data={name: str(value) for name, value in data.items()}, created_at=now or timezone.now(),
+    )
+
+
+def for_reservation(kind, reservation, now=None, **data):
+    return CirculationEvent(
+        kind=kind, user_id=reservation.user_id, book_id=reservation.book_id, reservation_id=reservation.pk,
+        data={name: str(value) for name, value in data.items()}, created_at=now or timezone.now(),
+    )
+
+
+def log(*events):
+    """Append `events` with one INSERT; call inside the transaction that made the change."""
+    return CirculationEvent.objects.bulk_create(events)
+
+
+def consume(name, handler, batch_size=1000):
+    """
+    Feed events after consumer `name`'s mark to handler(events), oldest first,
+    in batches of `batch_size`. Returns how many events were handled.
+    """
+    handled = 0
+    while True:
+        with transaction.atomic():
+            # The lock keeps two runs of the same consumer from handling one batch twice
+            offset, _ = ConsumerOffset.objects.select_for_update().get_or_create(name=name)
+            batch = list(CirculationEvent.objects.filter(pk__gt=offset.position).order_by('pk')[:batch_size])
+            if not batch:
+                return handled
+            handler(batch)
+            offset.position = batch[-1].pk
+            offset.save(update_fields=['position', 'updated_at'])
+        handled += len(batch)
+        if len(batch) < batch_size:
+            return handled
@@ -0,0 +1,78 @@
+"""
+Member fine ledger.
+
+Every charge, payment and waiver is an append-only FineTransaction, and the
+member's denormalized User.outstanding_balance is moved by the same amount
+with an F() UPDATE in the same transaction. Showing a balance is then a
+column read, and the ledger stays a complete audit trail of who paid what.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from .models import FineTransaction
+
+User = get_user_model()
+Kind = FineTransaction.Kind
+
+
+def _check(amount):
+    # The kind gives an entry its sign; a negative or NaN amount would move the balance the wrong way
+    if not Decimal(amount).is_finite() or Decimal(amount) < 0:
+        raise ValueError(f"Fine amounts must be zero or more, not {amount}.")
+
+
+def post(entries):
+    """
+    Write unsaved FineTransactions and apply them to their members' balances:
+    one INSERT, plus one UPDATE per member. Zero amounts are dropped.
+    """
+    for entry in entries:
+        _check(entry.amount)
+    entries = [entry for entry in entries if entry.amount]
+    if not entries:
+        return []
+    deltas = defaultdict(Decimal)
+    for entry in entries:
+        deltas[entry.user_id] += entry.signed_amount
+    with transaction.atomic():
+        FineTransaction.objects.bulk_create(entries)
+        for user_id, delta in deltas.items():
+            if delta:
+                User.objects.filter(pk=user_id).update(outstanding_balance=F('outstanding_balance') + delta)
+    return entries
+
+
+def charge_loan(record, amount, paid=Decimal('0.00'), by=None, note=''):
+    """
+    Ledger entries for a fine on `record`: `amount` goes on the member's
+    account and `paid` is charged and settled at the desk in one go.
+    """
+    _check(amount)
+    _check(paid)
+    total = Decimal(amount) + Decimal(paid)
+    entries = [FineTransaction(
+        user_id=record.user_id, kind=Kind.ACCRUAL, amount=total, borrow_record_id=record.pk, created_by=by, note=note,
+    )]
+    if paid:
+        entries.append(FineTransaction(
+            user_id=record.user_id, kind=Kind.PAYMENT, amount=Decimal(paid), borrow_record_id=record.pk,
+            created_by=by, note="Paid at the desk",
+        ))
+    return entries
+
+
+def settle(user, kind, amount=None, by=None, note=''):
+    """
+    Record a payment or waiver against `user`'s balance, by default the whole
+    of it. Returns the entry, or None when there was nothing to settle.
+    """
+    with transaction.atomic():
+        balance = User.objects.select_for_update().values_list('outstanding_balance', flat=True).get(pk=user.pk)
+        amount = balance if amount is None else min(Decimal(amount), balance)
+        if amount <= 0:
+            return None
+        entry, = post([FineTransaction(user_id=user.pk, kind=kind, amount=amount, created_by=by, note=note)])
+    user.outstanding_balance = balance - amount
+    return entry
@@ -12,10 +12,8 @@ class IssueBookForm(forms.Form):
     def clean_username(self):
         username = self.cleaned_data['username']
         try:
-            user = User.objects.get(username=username)
-            if user.role != 'MEMBER': # Depending on policy, maybe admins can borrow too? Let's restrict to MEMBERS for now.
-                # Actually, Librarians/Admins might borrow too. Let's allow any valid user.
-                pass
+            # Kept on the form so the view doesn't look the member up again
+            self.member = User.objects.get(username=username)
         except User.DoesNotExist:
             raise forms.ValidationError("User with this username does not exist.")
         return username
@@ -23,7 +21,7 @@ class IssueBookForm(forms.Form):
     def clean_book_isbn(self):
         isbn = self.cleaned_data['book_isbn']
         try:
-            Book.objects.get(isbn=isbn)
+            self.book = Book.objects.get(isbn=isbn)
         except Book.DoesNotExist:
             raise forms.ValidationError("Book with this ISBN not found.")
         return isbn
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from circulation import reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel reservation holds not collected within LibraryConfiguration.hold_expiry_days and "
+        "pass each copy to the next member in line or back into stock. Safe to run from cron."
+    )
+
+    def handle(self, *args, **options):
+        stats = reservations.expire_holds()
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {stats['expired']} holds: {stats['advanced']} passed to the next member, "
+            f"{stats['restocked']} copies returned to stock."
+        ))
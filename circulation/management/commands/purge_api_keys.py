@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from circulation import api
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete circulation API idempotency keys older than api.KEEP_KEYS_FOR; a retry of a purged key "
+        "runs as a new operation. Safe to run from cron."
+    )
+
+    def handle(self, *args, **options):
+        deleted = api.purge()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} idempotency keys."))
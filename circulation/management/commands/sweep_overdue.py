@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from circulation import reminders
+
+
+class Command(BaseCommand):
+    help = (
+        "Notify members of overdue loans and loans falling due soon, plus an overdue summary for staff. "
+        "Each alert is sent at most once per loan per day, so the job can be rerun safely."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--remind-days', type=int, default=2, help="Remind members this many days before a loan is due (0 to disable).")
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Loans read and notifications inserted per batch.")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be at least 1.")
+        if options['remind_days'] < 0:
+            raise CommandError("--remind-days cannot be negative.")
+
+        verbosity = options['verbosity']
+
+        def progress(stats):
+            if verbosity > 1:
+                self.stdout.write(f"{stats['overdue']} overdue, {stats['due-soon']} due soon, {stats['sent']} sent")
+
+        stats = reminders.sweep(
+            remind_days=options['remind_days'],
+            chunk_size=options['chunk_size'],
+            progress=progress,
+        )
+
+        loans = stats['overdue'] + stats['due-soon']
+        rate = loans / stats['seconds'] if stats['seconds'] else loans
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {loans} loans in {stats['seconds']:.1f}s ({rate:.0f} loans/sec): "
+            f"{stats['overdue']} overdue, {stats['due-soon']} due soon, {stats['sent']} notifications sent."
+        ))
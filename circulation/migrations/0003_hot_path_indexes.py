@@ -0,0 +1,54 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_hot_path_indexes"),
+        ("circulation", "0002_borrowrecord_renewal_count"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(
+                fields=["status", "due_date"], name="borrow_status_due_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(
+                fields=["user", "status"], name="borrow_user_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(
+                fields=["status", "issued_date"], name="borrow_status_issued_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(fields=["issued_date"], name="borrow_issued_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="borrowrecord",
+            index=models.Index(fields=["return_date"], name="borrow_returned_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["book", "status", "reserved_date"], name="reservation_queue_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["status", "reserved_date"], name="reservation_status_date_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def number_pending_queues(apps, schema_editor):
+    Reservation = apps.get_model("circulation", "Reservation")
+
+    positions = {}
+    pending = Reservation.objects.filter(status="PENDING").order_by(
+        "book_id", "reserved_date", "pk"
+    )
+    for reservation in pending.only("pk", "book_id"):
+        positions[reservation.book_id] = positions.get(reservation.book_id, 0) + 1
+        Reservation.objects.filter(pk=reservation.pk).update(
+            queue_position=positions[reservation.book_id]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_hot_path_indexes"),
+        ("circulation", "0003_hot_path_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reservation",
+            name="queue_position",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["book", "status", "queue_position"],
+                name="reservation_position_idx",
+            ),
+        ),
+        migrations.RunPython(number_pending_queues, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:33
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def start_existing_holds(apps, schema_editor):
+    # Copies already on the hold shelf get a full hold period from today
+    Reservation = apps.get_model("circulation", "Reservation")
+    Reservation.objects.filter(
+        status="PENDING", queue_position=1, book__status="RESERVED"
+    ).update(ready_date=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_hot_path_indexes"),
+        ("circulation", "0004_reservation_queue_position"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reservation",
+            name="ready_date",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["status", "ready_date"], name="reservation_ready_idx"
+            ),
+        ),
+        migrations.RunPython(start_existing_holds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def open_ledgers(apps, schema_editor):
+    # Each fine already charged to a loan becomes an accrual, and the balance their total
+    BorrowRecord = apps.get_model("circulation", "BorrowRecord")
+    FineTransaction = apps.get_model("circulation", "FineTransaction")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+    charged = BorrowRecord.objects.filter(fine_amount__gt=0).order_by("pk")
+    FineTransaction.objects.bulk_create(
+        (
+            FineTransaction(
+                user_id=record.user_id,
+                kind="ACCRUAL",
+                amount=record.fine_amount,
+                borrow_record_id=record.pk,
+                note="Opening balance",
+            )
+            for record in charged.only("pk", "user_id", "fine_amount").iterator()
+        ),
+        batch_size=1000,
+    )
+    for row in charged.values("user_id").annotate(total=Sum("fine_amount")).order_by():
+        User.objects.filter(pk=row["user_id"]).update(outstanding_balance=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_user_outstanding_balance"),
+        ("circulation", "0005_reservation_ready_date"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FineTransaction",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("ACCRUAL", "Accrual"),
+                            ("PAYMENT", "Payment"),
+                            ("WAIVER", "Waiver"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("note", models.CharField(blank=True, max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "borrow_record",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="fine_transactions",
+                        to="circulation.borrowrecord",
+                    ),
+                ),
+                (
+                    "created_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="fine_transactions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "created_at"], name="fine_user_date_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(open_ledgers, migrations.RunPython.noop),
+    ]
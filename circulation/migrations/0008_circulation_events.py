@@ -0,0 +1,159 @@
+# Generated by Django 6.0.1 on 2026-10-18 22:03
+
+import heapq
+import itertools
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 1000
+
+
+def replay_history(apps, schema_editor):
+    # Rebuild what the rows still show, in time order: loans, returns, losses and reservations.
+    # Each kind is read already sorted and the streams merged, so the history is never held in memory.
+    BorrowRecord = apps.get_model("circulation", "BorrowRecord")
+    Reservation = apps.get_model("circulation", "Reservation")
+    CirculationEvent = apps.get_model("circulation", "CirculationEvent")
+
+    issues = (
+        (issued, "ISSUED", user_id, book_id, pk, None, {})
+        for pk, user_id, book_id, issued in BorrowRecord.objects.order_by(
+            "issued_date", "pk"
+        )
+        .values_list("pk", "user_id", "book_id", "issued_date")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    # When a copy was written off was never recorded
+    closes = (
+        (
+            closed,
+            status,
+            user_id,
+            book_id,
+            pk,
+            None,
+            {"fine" if status == "RETURNED" else "fee": str(fine)},
+        )
+        for pk, user_id, book_id, closed, status, fine in BorrowRecord.objects.filter(
+            status__in=["RETURNED", "LOST"]
+        )
+        .annotate(closed=Coalesce("return_date", "issued_date"))
+        .order_by("closed", "pk")
+        .values_list("pk", "user_id", "book_id", "closed", "status", "fine_amount")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    reservations = (
+        (reserved, "RESERVED", user_id, book_id, None, pk, {})
+        for pk, user_id, book_id, reserved in Reservation.objects.order_by(
+            "reserved_date", "pk"
+        )
+        .values_list("pk", "user_id", "book_id", "reserved_date")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+
+    history = heapq.merge(issues, closes, reservations, key=lambda event: event[0])
+    while True:
+        batch = [
+            CirculationEvent(
+                created_at=created_at,
+                kind=kind,
+                user_id=user_id,
+                book_id=book_id,
+                borrow_record_id=borrow_record_id,
+                reservation_id=reservation_id,
+                data=data,
+            )
+            for created_at, kind, user_id, book_id, borrow_record_id, reservation_id, data in itertools.islice(
+                history, BATCH_SIZE
+            )
+        ]
+        if not batch:
+            break
+        CirculationEvent.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_hot_path_indexes"),
+        ("circulation", "0007_idempotency_key"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConsumerOffset",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                ("position", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="CirculationEvent",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("ISSUED", "Issued"),
+                            ("RETURNED", "Returned"),
+                            ("RENEWED", "Renewed"),
+                            ("LOST", "Lost"),
+                            ("RESERVED", "Reserved"),
+                            ("RESERVATION_CANCELLED", "Reservation cancelled"),
+                            ("HOLD_EXPIRED", "Hold expired"),
+                        ],
+                        max_length=25,
+                    ),
+                ),
+                ("data", models.JSONField(blank=True, default=dict)),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="books.book",
+                    ),
+                ),
+                (
+                    "borrow_record",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="circulation.borrowrecord",
+                    ),
+                ),
+                (
+                    "reservation",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="circulation.reservation",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.RunPython(replay_history, migrations.RunPython.noop),
+    ]
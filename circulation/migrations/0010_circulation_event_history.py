@@ -0,0 +1,61 @@
+# Generated by Django 6.0.1 on 2026-10-18 23:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_hot_path_indexes"),
+        ("circulation", "0009_idempotency_created_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="circulationevent",
+            name="book",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="books.book",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="circulationevent",
+            name="borrow_record",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="circulation.borrowrecord",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="circulationevent",
+            name="reservation",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="circulation.reservation",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="circulationevent",
+            name="user",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -20,6 +20,19 @@ class BorrowRecord(models.Model):
     fine_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     renewal_count = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Overdue sweeps and dashboards: status='ISSUED' AND due_date < now
+            models.Index(fields=['status', 'due_date'], name='borrow_status_due_idx'),
+            # A member's active loans (borrow limit, profile, chatbot)
+            models.Index(fields=['user', 'status'], name='borrow_user_status_idx'),
+            # Lost/returned lists ordered by issue date
+            models.Index(fields=['status', 'issued_date'], name='borrow_status_issued_idx'),
+            # "Issued/returned today", monthly counts and report date ranges
+            models.Index(fields=['issued_date'], name='borrow_issued_idx'),
+            models.Index(fields=['return_date'], name='borrow_returned_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.pk:
             # Set due date based on book's borrow duration
@@ -46,6 +59,120 @@ class Reservation(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='reservations')
     reserved_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    # 1-based place in the book's pending queue; cleared once fulfilled or cancelled
+    queue_position = models.PositiveIntegerField(null=True, blank=True)
+    # When a returned copy was set aside for this member; the hold lapses hold_expiry_days later
+    ready_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Head of a book's queue: book=? AND status='PENDING' ORDER BY queue_position
+            models.Index(fields=['book', 'status', 'queue_position'], name='reservation_position_idx'),
+            models.Index(fields=['book', 'status', 'reserved_date'], name='reservation_queue_idx'),
+            # Hold expiry sweep: status='PENDING' AND ready_date < cutoff
+            models.Index(fields=['status', 'ready_date'], name='reservation_ready_idx'),
+            # Desk list of all pending reservations, oldest first
+            models.Index(fields=['status', 'reserved_date'], name='reservation_status_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.status == 'PENDING' and self.queue_position is None:
+            # Join the back of the book's queue; circulation.reservations.enqueue() serializes this
+            last = Reservation.objects.filter(book_id=self.book_id, status='PENDING').aggregate(
+                last=models.Max('queue_position')
+            )['last']
+            self.queue_position = (last or 0) + 1
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Reservation: {self.user.username} for {self.book.title}"
+
+class FineTransaction(models.Model):
+    """One entry in a member's fine ledger. Entries are never edited or deleted."""
+    class Kind(models.TextChoices):
+        ACCRUAL = 'ACCRUAL', 'Accrual'
+        PAYMENT = 'PAYMENT', 'Payment'
+        WAIVER = 'WAIVER', 'Waiver'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='fine_transactions')
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+    # Always positive; `kind` decides whether it adds to or settles the balance
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    borrow_record = models.ForeignKey(BorrowRecord, on_delete=models.SET_NULL, null=True, blank=True, related_name='fine_transactions')
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # A member's payment history, newest first
+            models.Index(fields=['user', 'created_at'], name='fine_user_date_idx'),
+        ]
+
+    @property
+    def signed_amount(self):
+        return self.amount if self.kind == self.Kind.ACCRUAL else -self.amount
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.amount} for {self.user.username}"
+
+class IdempotencyKey(models.Model):
+    """The stored outcome of one circulation API operation, replayed when a client retries its key."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=64)
+    # sha256 of the operation, so a key reused for a different request is refused
+    fingerprint = models.CharField(max_length=64)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_uniq'),
+        ]
+        indexes = [
+            # api.purge() deletes by age
+            models.Index(fields=['created_at'], name='idempotency_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.user.username})"
+
+class CirculationEvent(models.Model):
+    """One entry in the append-only circulation log; consumers read it in id order."""
+    class Kind(models.TextChoices):
+        ISSUED = 'ISSUED', 'Issued'
+        RETURNED = 'RETURNED', 'Returned'
+        RENEWED = 'RENEWED', 'Renewed'
+        LOST = 'LOST', 'Lost'
+        RESERVED = 'RESERVED', 'Reserved'
+        RESERVATION_CANCELLED = 'RESERVATION_CANCELLED', 'Reservation cancelled'
+        HOLD_EXPIRED = 'HOLD_EXPIRED', 'Hold expired'
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=25, choices=Kind.choices)
+    # Unconstrained, so deleting a member, book, loan or reservation leaves its history as it was
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+'
+    )
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    borrow_record = models.ForeignKey(
+        BorrowRecord, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    # What changed, e.g. the new due date or the fine charged; dates and amounts as strings
+    data = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_kind_display()}"
+
+class ConsumerOffset(models.Model):
+    """How far one consumer has read the circulation log."""
+    name = models.CharField(max_length=64, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Reservation: {self.user.username} for {self.book.title}"
\ No newline at end of file
+        return f"{self.name} @ {self.position}"
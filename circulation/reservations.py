@@ -0,0 +1,199 @@
+"""
+Per-book reservation queues.
+
+Every pending reservation carries its 1-based `queue_position` within its
+book's queue, so the head of a queue is read from the (book, status,
+queue_position) index and a member's place in line needs no COUNT over the
+reservations ahead of them. Leaving the queue (fulfil or cancel) clears the
+position and shifts everyone behind it forward in the same transaction, so
+positions stay dense: 1..n for n pending reservations.
+"""
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import BorrowRecord, Reservation
+from . import events
+from books.models import Book
+from books import page_cache
+from core.models import LibraryConfiguration, Notification
+
+
+def pending(book_ids):
+    return Reservation.objects.filter(book_id__in=book_ids, status='PENDING')
+
+
+def head(book):
+    """The first pending reservation for `book`, or None."""
+    return (
+        Reservation.objects.filter(book=book, status='PENDING')
+        .select_related('user').order_by('queue_position').first()
+    )
+
+
+def heads(book_ids):
+    """{book_id: first pending Reservation} for several books in one query."""
+    result = {}
+    for reservation in pending(book_ids).select_related('user').order_by('book_id', 'queue_position'):
+        result.setdefault(reservation.book_id, reservation)
+    return result
+
+
+def enqueue(user, book):
+    """Add `user` to the back of `book`'s queue. Returns the new Reservation."""
+    with transaction.atomic():
+        # Serializes joins to one queue so two members can't take the same position
+        Book.objects.select_for_update().filter(pk=book.pk).exists()
+        reservation = Reservation.objects.create(user=user, book=book)
+        events.log(events.for_reservation(events.Kind.RESERVED, reservation, position=reservation.queue_position))
+    return reservation
+
+
+def _close(reservations, status):
+    """
+    Move `reservations` (at most one per book) out of their queues and close
+    the gaps they leave. Returns the pks that were still pending; callers
+    that need all of them roll back when some were not.
+    """
+    with transaction.atomic():
+        # Positions are re-read under the lock; the caller's copies may be stale
+        open_positions = list(
+            Reservation.objects.select_for_update()
+            .filter(pk__in=[reservation.pk for reservation in reservations], status='PENDING')
+            .values_list('pk', 'book_id', 'queue_position')
+        )
+        if not open_positions:
+            return set()
+        closed = {pk for pk, book_id, position in open_positions}
+        Reservation.objects.filter(pk__in=closed).update(status=status, queue_position=None)
+        # One UPDATE per distinct position; fulfilling queue heads is a single statement
+        gaps = {}
+        for pk, book_id, position in open_positions:
+            gaps.setdefault(position, []).append(book_id)
+        for position, book_ids in gaps.items():
+            pending(book_ids).filter(queue_position__gt=position).update(queue_position=F('queue_position') - 1)
+    for reservation in reservations:
+        if reservation.pk in closed:
+            reservation.status, reservation.queue_position = status, None
+    return closed
+
+
+def fulfil(*reservations):
+    """Mark queue heads as fulfilled. Returns False if any was already closed."""
+    return len(_close(reservations, 'FULFILLED')) == len(reservations)
+
+
+def cancel(reservation, now=None):
+    now = now or timezone.now()
+    with transaction.atomic():
+        if not _close([reservation], 'CANCELLED'):
+            return False
+        events.log(events.for_reservation(events.Kind.RESERVATION_CANCELLED, reservation))
+        # A copy already set aside for this member goes to the next in line, or back on the shelf
+        if Reservation.objects.filter(pk=reservation.pk, ready_date__isnull=False).exists():
+            _pass_on([reservation.book_id], now)
+    return True
+
+
+def mark_ready(reservations, now):
+    """Start the hold period of queue heads a copy was just set aside for."""
+    Reservation.objects.filter(
+        pk__in=[reservation.pk for reservation in reservations], status='PENDING', ready_date__isnull=True
+    ).update(ready_date=now)
+
+
+def _pass_on(book_ids, now):
+    """
+    Hand the copies held for closed reservations on `book_ids` to the new
+    head of each queue, or put them back in stock where nobody is waiting.
+    Call inside the transaction that closed the reservations.
+    Returns ({book_id: new head}, books restocked).
+    """
+    next_heads = heads(book_ids)
+    # A head that already has a copy waiting was told so when it was set aside
+    newly_ready = [reservation for reservation in next_heads.values() if reservation.ready_date is None]
+    mark_ready(newly_ready, now)
+    # Only books still on the hold shelf are restocked; the copy is returned once
+    empty = [book_id for book_id in book_ids if book_id not in next_heads]
+    restocked = Book.objects.filter(pk__in=empty, status='RESERVED').update(
+        available_copies=F('available_copies') + 1, status='AVAILABLE'
+    ) if empty else 0
+    Notification.objects.bulk_create([
+        Notification(
+            user=reservation.user, kind=Notification.Kind.HOLD_READY,
+            reservation=reservation, book_id=reservation.book_id,
+        )
+        for reservation in newly_ready
+    ])
+    page_cache.bump(*book_ids)
+    return next_heads, restocked
+
+
+def expire_holds(now=None):
+    """
+    Cancel holds nobody collected within hold_expiry_days and pass each
+    copy to the next member in line, or back into stock when the queue is
+    empty. Every step is a conditional UPDATE on rows still in the expected
+    state, so overlapping or repeated runs change nothing twice.
+    Returns {'expired', 'advanced', 'restocked'} counts.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=LibraryConfiguration.load().hold_expiry_days)
+    stats = {'expired': 0, 'advanced': 0, 'restocked': 0}
+
+    expired = list(
+        Reservation.objects.filter(status='PENDING', ready_date__lt=cutoff).order_by('ready_date')
+    )
+    if not expired:
+        return stats
+
+    with transaction.atomic():
+        closed = _close(expired, 'CANCELLED')
+        expired = [reservation for reservation in expired if reservation.pk in closed]
+        book_ids = {reservation.book_id for reservation in expired}
+
+        next_heads, restocked = _pass_on(book_ids, now)
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=reservation.user_id, kind=Notification.Kind.HOLD_EXPIRED,
+                reservation=reservation, book_id=reservation.book_id,
+            )
+            for reservation in expired
+        ])
+        events.log(*[events.for_reservation(events.Kind.HOLD_EXPIRED, reservation, now) for reservation in expired])
+
+    stats.update(expired=len(expired), advanced=len(next_heads), restocked=restocked)
+    return stats
+
+
+def annotate_waits(reservations, now=None):
+    """
+    Set `estimated_date` and `estimated_wait_days` on each pending
+    reservation: when a copy should come back for it, assuming loans are
+    returned on their due dates and every member ahead keeps the book for its
+    full loan period. Both are None when a copy is already on the hold shelf
+    for it or no copy is out on loan. Loans are read in one query for all the
+    books involved.
+    """
+    now = now or timezone.now()
+    reservations = [reservation for reservation in reservations if reservation.queue_position is not None]
+    due_dates = {}
+    loans = BorrowRecord.objects.filter(
+        book_id__in={reservation.book_id for reservation in reservations}, status='ISSUED'
+    ).order_by('book_id', 'due_date').values_list('book_id', 'due_date')
+    for book_id, due_date in loans:
+        due_dates.setdefault(book_id, []).append(max(due_date, now))
+
+    for reservation in reservations:
+        book = reservation.book
+        dates = due_dates.get(book.pk, [])
+        # A RESERVED book has a copy set aside for the head of its queue
+        ahead = reservation.queue_position - 1 - (1 if book.status == 'RESERVED' else 0)
+        reservation.estimated_date = reservation.estimated_wait_days = None
+        if ahead < 0 or not dates:
+            continue
+        # The n-th returned copy goes to the n-th member waiting; copies cycle through the queue
+        rounds, index = divmod(ahead, len(dates))
+        reservation.estimated_date = dates[index] + timedelta(days=rounds * book.borrow_duration)
+        reservation.estimated_wait_days = max((reservation.estimated_date - now).days, 0)
+    return reservations
@@ -0,0 +1,328 @@
+"""
+Transactional circulation operations used by the issue and return desks.
+
+Every operation runs in one transaction and changes stock with conditional
+UPDATE ... SET available_copies = available_copies - 1 WHERE
+available_copies >= 1 statements, so two desks scanning the last copy at
+the same moment can never both succeed or drive stock negative. Borrow
+records move between states the same way (WHERE status = 'ISSUED'), so a
+double-submitted return is applied once. The member row is locked with
+SELECT ... FOR UPDATE where the backend supports it; on SQLite the
+IMMEDIATE transaction mode in settings serializes writers instead.
+"""
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+from .models import BorrowRecord
+from . import counters, events, fines, reservations
+from accounts import tiers
+from books.models import Book
+from books import page_cache
+from core.models import LibraryConfiguration, Notification
+
+User = get_user_model()
+
+
+class CirculationError(Exception):
+    """A circulation rule blocked the operation; `field` names the desk form field at fault."""
+
+    def __init__(self, message, field=None):
+        super().__init__(message)
+        self.message = message
+        self.field = field
+
+
+def _sync_stock_status(book_id, clear_hold=False):
+    # Same rule as Book.save(), applied in SQL to the row's current stock
+    queryset = Book.objects.filter(pk=book_id).exclude(status__in=['LOST'] if clear_hold else ['RESERVED', 'LOST'])
+    queryset.update(status=Case(
+        When(available_copies=0, then=Value('OUT_OF_STOCK')),
+        default=Value('AVAILABLE'),
+    ))
+
+
+def clear_loan_alerts(*records):
+    """Drop the overdue and due-soon alerts of loans that are settled or renewed."""
+    Notification.objects.filter(
+        borrow_record__in=records, kind__in=[Notification.Kind.OVERDUE, Notification.Kind.DUE_SOON]
+    ).delete()
+
+
+def _borrowed_notice(record):
+    return {
+        'user': record.user,
+        'kind': Notification.Kind.BORROWED,
+        'borrow_record': record,
+        'book': record.book,
+        'params': {'due': timezone.localdate(record.due_date).isoformat()},
+    }
+
+
+def calculate_fine(record, now=None):
+    """(fine_amount, overdue_days) owed if `record` were returned at `now`."""
+    now = now or timezone.now()
+    if now <= record.due_date:
+        return Decimal('0.00'), 0
+    overdue_days = (now - record.due_date).days
+    if overdue_days <= 0:
+        return Decimal('0.00'), 0
+    # An unsaved LibraryConfiguration still holds its float default for fine_per_day
+    return overdue_days * Decimal(str(LibraryConfiguration.load().fine_per_day)), overdue_days
+
+
+def issue_book(user, book):
+    """Lend one copy of `book` to `user`. Returns the new BorrowRecord."""
+    with transaction.atomic():
+        # Serializes concurrent issues to the same member so the borrow limit holds
+        user = User.objects.select_for_update().get(pk=user.pk)
+
+        reservation = reservations.head(book)
+        if reservation and reservation.user_id != user.pk:
+            raise CirculationError(f"This book is reserved for {reservation.user.username}.", 'book_isbn')
+
+        policy = tiers.policy(user.membership_tier_id)
+        limit = policy.max_books if policy else 0
+        if BorrowRecord.objects.filter(user=user, status='ISSUED').count() >= limit:
+            raise CirculationError(f"User has reached their borrow limit of {limit} books.")
+
+        took_copy = Book.objects.filter(pk=book.pk, available_copies__gte=1).update(
+            available_copies=F('available_copies') - 1
+        )
+        if reservation:
+            # The holder may take the copy set aside on return, which was never put back into stock
+            if not reservations.fulfil(reservation):
+                raise CirculationError("This reservation has already been fulfilled.", 'book_isbn')
+            _sync_stock_status(book.pk, clear_hold=True)
+        elif took_copy:
+            _sync_stock_status(book.pk)
+        else:
+            raise CirculationError("Book is currently unavailable.", 'book_isbn')
+
+        record = BorrowRecord.objects.create(user=user, book=book)
+        Notification.objects.create(**_borrowed_notice(record))
+        events.log(events.for_loan(events.Kind.ISSUED, record, record.issued_date, due_date=record.due_date.isoformat()))
+    return record
+
+
+def return_book(record, fine_amount, now=None, paid=Decimal('0.00'), by=None):
+    """
+    Check `record` back in, charging `fine_amount` to the member's account;
+    `paid` is a fine settled on the spot, recorded in the ledger only.
+    Returns the reservation the copy is now held for, or None if it went back on the shelf.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        if not BorrowRecord.objects.filter(pk=record.pk, status='ISSUED').update(
+            status='RETURNED', return_date=now, fine_amount=fine_amount
+        ):
+            raise CirculationError("This book has already been checked in.")
+        record.status, record.return_date, record.fine_amount = 'RETURNED', now, fine_amount
+        fines.post(fines.charge_loan(record, fine_amount, paid, by=by, note="Overdue fine"))
+        events.log(events.for_loan(events.Kind.RETURNED, record, now, fine=fine_amount, paid=paid))
+        # Stock and the loan change through update(), which sends no signals
+        page_cache.bump(record.book_id)
+        counters.invalidate()
+
+        clear_loan_alerts(record)
+
+        reservation = reservations.head(record.book)
+        if reservation:
+            # Hold the copy for the next member in the queue instead of restocking it
+            Book.objects.filter(pk=record.book_id).update(status='RESERVED')
+            reservations.mark_ready([reservation], now)
+            Notification.objects.create(
+                user=reservation.user, kind=Notification.Kind.HOLD_READY, reservation=reservation, book_id=record.book_id
+            )
+        else:
+            Book.objects.filter(pk=record.book_id).update(available_copies=F('available_copies') + 1)
+            _sync_stock_status(record.book_id)
+
+        Notification.objects.create(
+            user=record.user, kind=Notification.Kind.RETURNED, borrow_record=record, book_id=record.book_id
+        )
+    return reservation
+
+
+def mark_lost(record, fine_amount, paid=Decimal('0.00'), by=None):
+    """Write off the copy on `record`, charging `fine_amount` to the account or taking `paid` at the desk."""
+    with transaction.atomic():
+        if not BorrowRecord.objects.filter(pk=record.pk, status='ISSUED').update(
+            status='LOST', fine_amount=fine_amount
+        ):
+            raise CirculationError("This book has already been checked in.")
+        record.status, record.fine_amount = 'LOST', fine_amount
+        fines.post(fines.charge_loan(record, fine_amount, paid, by=by, note="Replacement fee"))
+        events.log(events.for_loan(events.Kind.LOST, record, fee=fine_amount, paid=paid))
+        page_cache.bump(record.book_id)
+        counters.invalidate()
+        Book.objects.filter(pk=record.book_id).update(status='LOST')
+
+
+def renew_loan(record):
+    """Extend `record` by its member's loan period, within the tier's renewal limit."""
+    policy = tiers.policy(record.user.membership_tier_id)
+    if reservations.pending([record.book_id]).exists():
+        raise CirculationError(f"Cannot renew '{record.book.title}'. It has been reserved by another member.")
+    max_renewals = policy.max_renewals if policy else 1
+    if record.renewal_count >= max_renewals:
+        raise CirculationError(f"Maximum renewal limit ({max_renewals}) reached for '{record.book.title}'.")
+
+    due_date = record.due_date + timedelta(days=policy.borrow_duration_days if policy else 14)
+    with transaction.atomic():
+        # Conditional on the count read above, so a resubmitted renewal is applied once
+        if not BorrowRecord.objects.filter(pk=record.pk, status='ISSUED', renewal_count=record.renewal_count).update(
+            due_date=due_date, renewal_count=F('renewal_count') + 1
+        ):
+            raise CirculationError(f"'{record.book.title}' has already been renewed or checked in.")
+        record.due_date, record.renewal_count = due_date, record.renewal_count + 1
+        events.log(events.for_loan(
+            events.Kind.RENEWED, record, due_date=due_date.isoformat(), renewal_count=record.renewal_count
+        ))
+        counters.invalidate()
+        # Clear the loan's overdue/due-soon alerts so they don't persist
+        clear_loan_alerts(record)
+    return record
+
+
+# --- Batch (desk session) operations ---
+
+def issue_books(user, books):
+    """
+    Lend one copy of each of `books` to `user` in a single transaction.
+    Either every book is issued or none is. Returns the new BorrowRecords.
+    """
+    books = list({book.pk: book for book in books}.values())
+    if not books:
+        return []
+    book_ids = [book.pk for book in books]
+    now = timezone.now()
+
+    with transaction.atomic():
+        user = User.objects.select_for_update().get(pk=user.pk)
+
+        heads = reservations.heads(book_ids)
+        blocked = [book.title for book in books if book.pk in heads and heads[book.pk].user_id != user.pk]
+        if blocked:
+            raise CirculationError(f"Reserved for another member: {', '.join(blocked)}.")
+
+        policy = tiers.policy(user.membership_tier_id)
+        limit = policy.max_books if policy else 0
+        active = BorrowRecord.objects.filter(user=user, status='ISSUED').count()
+        if active + len(books) > limit:
+            raise CirculationError(
+                f"User has {active} of {limit} books on loan and cannot borrow {len(books)} more."
+            )
+
+        held = [book_id for book_id in book_ids if book_id in heads]
+        shelf = [book_id for book_id in book_ids if book_id not in heads]
+
+        # One conditional UPDATE for every unreserved title; any shortfall rolls the batch back
+        if shelf and Book.objects.filter(pk__in=shelf, available_copies__gte=1).update(
+            available_copies=F('available_copies') - 1
+        ) != len(shelf):
+            unavailable = Book.objects.filter(pk__in=shelf, available_copies__lt=1).values_list('title', flat=True)
+            raise CirculationError(f"Currently unavailable: {', '.join(unavailable) or 'one of the books'}.")
+
+        if held:
+            if not reservations.fulfil(*[heads[book_id] for book_id in held]):
+                raise CirculationError("A reservation in this batch has already been fulfilled.")
+            # Holders may take the copy set aside on return, which was never put back into stock
+            Book.objects.filter(pk__in=held, available_copies__gte=1).update(available_copies=F('available_copies') - 1)
+            Book.objects.filter(pk__in=held).exclude(status='LOST').update(status=Case(
+                When(available_copies=0, then=Value('OUT_OF_STOCK')),
+                default=Value('AVAILABLE'),
+            ))
+        if shelf:
+            Book.objects.filter(pk__in=shelf).exclude(status__in=['RESERVED', 'LOST']).update(status=Case(
+                When(available_copies=0, then=Value('OUT_OF_STOCK')),
+                default=Value('AVAILABLE'),
+            ))
+
+        # bulk_create skips BorrowRecord.save(), so the due date is set here
+        records = BorrowRecord.objects.bulk_create([
+            BorrowRecord(user=user, book=book, due_date=now + timedelta(days=book.borrow_duration))
+            for book in books
+        ])
+        Notification.objects.bulk_create([Notification(**_borrowed_notice(record)) for record in records])
+        events.log(*[
+            events.for_loan(events.Kind.ISSUED, record, now, due_date=record.due_date.isoformat()) for record in records
+        ])
+        page_cache.bump(*book_ids)
+        counters.invalidate()
+    return records
+
+
+def return_books(records, pay_now=False, now=None, by=None):
+    """
+    Check in several loans of one member in a single transaction, charging
+    each record's overdue fine unless `pay_now`. Returns {book_id: Reservation}
+    for the copies that must be set aside for a waiting member.
+    """
+    records = list({record.pk: record for record in records}.values())
+    if not records:
+        return {}
+    now = now or timezone.now()
+    due = {record.pk: calculate_fine(record, now)[0] for record in records}
+    charged = {pk: Decimal('0.00') if pay_now else fine for pk, fine in due.items()}
+
+    with transaction.atomic():
+        if BorrowRecord.objects.filter(pk__in=charged, status='ISSUED').update(
+            status='RETURNED',
+            return_date=now,
+            fine_amount=Case(
+                *[When(pk=pk, then=Value(fine)) for pk, fine in charged.items()], output_field=DecimalField()
+            ),
+        ) != len(records):
+            raise CirculationError("One of these books has already been checked in.")
+        for record in records:
+            record.status, record.return_date, record.fine_amount = 'RETURNED', now, charged[record.pk]
+        fines.post([
+            entry
+            for record in records
+            for entry in fines.charge_loan(
+                record, charged[record.pk], due[record.pk] - charged[record.pk], by=by, note="Overdue fine"
+            )
+        ])
+        events.log(*[
+            events.for_loan(
+                events.Kind.RETURNED, record, now, fine=charged[record.pk], paid=due[record.pk] - charged[record.pk]
+            )
+            for record in records
+        ])
+
+        clear_loan_alerts(*records)
+
+        copies = Counter(record.book_id for record in records)
+        heads = reservations.heads(list(copies))
+        if heads:
+            Book.objects.filter(pk__in=list(heads)).update(status='RESERVED')
+            reservations.mark_ready(heads.values(), now)
+        # Restock every returned copy except the one held for each reservation
+        restock = Counter({book_id: n - (1 if book_id in heads else 0) for book_id, n in copies.items()})
+        for n in set(restock.values()) - {0}:
+            Book.objects.filter(pk__in=[book_id for book_id, count in restock.items() if count == n]).update(
+                available_copies=F('available_copies') + n
+            )
+        restocked = [book_id for book_id, count in restock.items() if count and book_id not in heads]
+        if restocked:
+            Book.objects.filter(pk__in=restocked).exclude(status__in=['RESERVED', 'LOST']).update(status=Case(
+                When(available_copies=0, then=Value('OUT_OF_STOCK')),
+                default=Value('AVAILABLE'),
+            ))
+
+        Notification.objects.bulk_create(
+            [
+                Notification(user=reservation.user, kind=Notification.Kind.HOLD_READY, reservation=reservation, book_id=book_id)
+                for book_id, reservation in heads.items()
+            ] + [
+                Notification(user=record.user, kind=Notification.Kind.RETURNED, borrow_record=record, book_id=record.book_id)
+                for record in records
+            ]
+        )
+        page_cache.bump(*copies)
+        counters.invalidate()
+    return heads
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import BorrowRecord
+from . import counters
+
+# --- Loan Counters ---
+
+@receiver(post_save, sender=BorrowRecord)
+@receiver(post_delete, sender=BorrowRecord)
+def invalidate_loan_counters(sender, instance, **kwargs):
+    # Writes through queryset.update() (circulation.services) invalidate explicitly
+    counters.invalidate()
@@ -1,11 +1,22 @@
+import json
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from decimal import Decimal
 from django.contrib.auth import get_user_model
 from books.models import Book, Author, Category
-from circulation.models import BorrowRecord, Reservation
+from circulation.models import BorrowRecord, CirculationEvent, ConsumerOffset, IdempotencyKey, Reservation
+from circulation import api, counters, events, reminders, reservations, services
 from accounts.models import MembershipTier
+from accounts import tiers
+from core.models import LibraryConfiguration, Notification
 
 User = get_user_model()
 
@@ -182,4 +193,627 @@ class CirculationTests(TestCase):
         self.assertContains(response, "This book is reserved for member.")
         
         # Check NO BorrowRecord created
-        self.assertFalse(BorrowRecord.objects.filter(user=self.other_member, book=self.book, status='ISSUED').exists())
\ No newline at end of file
+        self.assertFalse(BorrowRecord.objects.filter(user=self.other_member, book=self.book, status='ISSUED').exists())
+
+class DeskLookupTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER')
+        User.objects.create_user(username='alice', password='password', role='MEMBER', first_name='Alice', last_name='Moss', email='alice@example.com')
+        User.objects.create_user(username='bob', password='password', role='MEMBER', first_name='Robert', last_name='Mason', email='bob@example.com')
+
+        author = Author.objects.create(name="Test Author")
+        Book.objects.create(title="Dune", isbn="9780441013593", author=author, publication_date="1965-08-01")
+        Book.objects.create(title="Dune Messiah", isbn="9780593098233", author=author, publication_date="1969-10-15")
+        Book.objects.create(title="Emma", isbn="9780141439587", author=author, publication_date="1815-12-23")
+
+    def lookup(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_member_prefix_matches_username_name_and_email(self):
+        self.client.login(username='librarian', password='password')
+        usernames = lambda r: [m['username'] for m in r.json()['results']]
+
+        self.assertEqual(usernames(self.lookup('member_lookup', q='ali')), ['alice'])
+        self.assertEqual(usernames(self.lookup('member_lookup', q='rob')), ['bob'])
+        self.assertEqual(usernames(self.lookup('member_lookup', q='MAS')), ['bob'])
+        self.assertEqual(usernames(self.lookup('member_lookup', q='m', role='MEMBER')), ['alice', 'bob', 'member'])
+
+    def test_book_prefix_matches_title_and_isbn(self):
+        self.client.login(username='librarian', password='password')
+        isbns = lambda r: [b['isbn'] for b in r.json()['results']]
+
+        self.assertEqual(isbns(self.lookup('book_lookup', q='dune')), ['9780441013593', '9780593098233'])
+        self.assertEqual(isbns(self.lookup('book_lookup', q='9780141')), ['9780141439587'])
+
+    def test_limit_pagination_and_cache_headers(self):
+        self.client.login(username='librarian', password='password')
+
+        first = self.lookup('book_lookup', limit=2)
+        self.assertEqual(len(first.json()['results']), 2)
+        self.assertTrue(first.json()['has_next'])
+        self.assertIn('max-age=30', first['Cache-Control'])
+        self.assertIn('private', first['Cache-Control'])
+
+        second = self.lookup('book_lookup', limit=2, page=2)
+        self.assertEqual([b['title'] for b in second.json()['results']], ['Emma'])
+        self.assertFalse(second.json()['has_next'])
+
+        for name in ('book_lookup', 'member_lookup'):
+            response = self.client.get(reverse(name), {'page': '99999999999999999999'})
+            self.assertEqual(response.status_code, 400)
+
+    def test_members_cannot_use_lookups(self):
+        self.client.login(username='member', password='password')
+        response = self.client.get(reverse('member_lookup'), {'q': 'a'})
+        self.assertEqual(response.status_code, 403)
+
+
+class DeskSessionTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.tier = MembershipTier.objects.create(name="Standard", max_books=3, borrow_duration_days=14, max_renewals=1)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=self.tier)
+        self.other_member = User.objects.create_user(username='other', password='password', role='MEMBER', membership_tier=self.tier)
+        author = Author.objects.create(name="Test Author")
+        self.books = [
+            Book.objects.create(
+                title=f"Book {i}", isbn=f"978000000000{i}", author=author, publication_date="2020-01-01",
+                total_copies=2, available_copies=2, borrow_duration=7,
+            )
+            for i in range(4)
+        ]
+        self.client.login(username='librarian', password='password')
+
+    def desk(self, action, **data):
+        return self.client.post(reverse('desk_session'), {'action': action, **data})
+
+    def scan(self, *books):
+        for book in books:
+            self.desk('scan', isbn=book.isbn)
+
+    def test_batch_issue_commits_every_scanned_book(self):
+        self.desk('open', mode='issue', username='member')
+        self.scan(*self.books[:3])
+        self.scan(self.books[0])  # duplicate scans are ignored
+
+        response = self.client.get(reverse('desk_session'))
+        self.assertEqual(len(response.context['items']), 3)
+
+        self.desk('commit')
+
+        records = BorrowRecord.objects.filter(user=self.member, status='ISSUED')
+        self.assertEqual(records.count(), 3)
+        for record in records:
+            self.assertAlmostEqual(record.due_date, record.issued_date + timedelta(days=7), delta=timedelta(seconds=5))
+        self.assertEqual(Notification.objects.filter(user=self.member).count(), 3)
+        for book in self.books[:3]:
+            book.refresh_from_db()
+            self.assertEqual(book.available_copies, 1)
+        self.assertIsNone(self.client.session.get('desk_session'))
+
+    def test_batch_issue_runs_in_constant_queries(self):
+        tiers.policy(self.tier.pk)  # tier policies load once per process, after tiers change
+        with self.assertNumQueries(10):
+            services.issue_books(self.member, self.books[:2])
+        BorrowRecord.objects.all().delete()
+        with self.assertNumQueries(10):
+            services.issue_books(self.member, self.books[:3])
+
+    def test_borrow_limit_applies_to_whole_batch(self):
+        self.desk('open', mode='issue', username='member')
+        self.scan(*self.books)
+        self.desk('commit')
+
+        self.assertFalse(BorrowRecord.objects.exists())
+        self.assertEqual(self.client.session['desk_session']['items'], [book.pk for book in self.books])
+
+    def test_reservation_for_another_member_blocks_the_batch(self):
+        Reservation.objects.create(user=self.other_member, book=self.books[1])
+
+        with self.assertRaises(services.CirculationError):
+            services.issue_books(self.member, self.books[:2])
+        self.assertFalse(BorrowRecord.objects.exists())
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].available_copies, 2)
+
+    def test_unavailable_book_rolls_back_the_batch(self):
+        Book.objects.filter(pk=self.books[2].pk).update(available_copies=0, status='OUT_OF_STOCK')
+
+        with self.assertRaises(services.CirculationError) as raised:
+            services.issue_books(self.member, self.books[:3])
+        self.assertIn("Book 2", raised.exception.message)
+        self.assertFalse(BorrowRecord.objects.exists())
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].available_copies, 2)
+
+    def test_batch_return_charges_fines_and_holds_reserved_copies(self):
+        records = services.issue_books(self.member, self.books[:2])
+        BorrowRecord.objects.filter(pk=records[0].pk).update(due_date=timezone.now() - timedelta(days=3, hours=1))
+        reservation = Reservation.objects.create(user=self.other_member, book=self.books[1])
+
+        self.desk('open', mode='return', username='member')
+        self.scan(*self.books[:2])
+        self.desk('commit', payment='later')
+
+        first, second = (BorrowRecord.objects.get(pk=record.pk) for record in records)
+        self.assertEqual((first.status, first.fine_amount), ('RETURNED', 3))
+        self.assertEqual((second.status, second.fine_amount), ('RETURNED', 0))
+
+        self.books[0].refresh_from_db()
+        self.books[1].refresh_from_db()
+        self.assertEqual((self.books[0].available_copies, self.books[0].status), (2, 'AVAILABLE'))
+        # The returned copy is held for the reservation, not restocked
+        self.assertEqual((self.books[1].available_copies, self.books[1].status), (1, 'RESERVED'))
+        self.assertTrue(Notification.objects.filter(user=reservation.user, kind='HOLD_READY', book=self.books[1]).exists())
+
+    def test_return_scan_requires_an_open_loan(self):
+        self.desk('open', mode='return', username='member')
+        self.scan(self.books[0])
+        self.assertEqual(self.client.session['desk_session']['items'], [])
+
+    def test_members_cannot_open_sessions(self):
+        self.client.login(username='member', password='password')
+        self.assertEqual(self.desk('open', mode='issue', username='member').status_code, 403)
+
+
+class ReservationQueueTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.tier = MembershipTier.objects.create(name="Standard", max_books=5, borrow_duration_days=14, max_renewals=1)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.members = [
+            User.objects.create_user(username=f'member{i}', password='password', membership_tier=self.tier)
+            for i in range(4)
+        ]
+        author = Author.objects.create(name="Test Author")
+        self.book = Book.objects.create(
+            title="Popular Book", isbn="9780000000100", author=author, publication_date="2020-01-01",
+            total_copies=1, available_copies=1, borrow_duration=10,
+        )
+
+    def queue(self):
+        return list(
+            Reservation.objects.filter(book=self.book, status='PENDING')
+            .order_by('queue_position').values_list('user__username', 'queue_position')
+        )
+
+    def reserve_all(self):
+        return [reservations.enqueue(member, self.book) for member in self.members]
+
+    def test_positions_follow_arrival_order(self):
+        self.reserve_all()
+        self.assertEqual(self.queue(), [('member0', 1), ('member1', 2), ('member2', 3), ('member3', 4)])
+        self.assertEqual(reservations.head(self.book).user, self.members[0])
+
+    def test_cancel_recompacts_the_queue(self):
+        queued = self.reserve_all()
+        self.assertTrue(reservations.cancel(queued[1]))
+        self.assertFalse(reservations.cancel(queued[1]))
+
+        self.assertEqual(self.queue(), [('member0', 1), ('member2', 2), ('member3', 3)])
+        self.assertEqual(Reservation.objects.get(pk=queued[1].pk).queue_position, None)
+
+    def test_issuing_to_the_head_moves_everyone_up(self):
+        self.reserve_all()
+        services.issue_book(self.members[0], self.book)
+
+        self.assertEqual(self.queue(), [('member1', 1), ('member2', 2), ('member3', 3)])
+
+    def test_estimated_wait_cycles_through_loans(self):
+        record = services.issue_book(self.members[0], self.book)
+        queued = [reservations.enqueue(member, self.book) for member in self.members[1:]]
+
+        now = timezone.now()
+        with self.assertNumQueries(1):
+            reservations.annotate_waits(queued, now=now)
+        self.assertEqual(queued[0].estimated_date, record.due_date)
+        self.assertEqual(queued[1].estimated_date, record.due_date + timedelta(days=10))
+        self.assertEqual(queued[2].estimated_wait_days, (record.due_date + timedelta(days=20) - now).days)
+
+    def test_member_sees_position_and_can_cancel(self):
+        queued = self.reserve_all()
+        self.client.login(username='member2', password='password')
+
+        response = self.client.get(reverse('my_books'))
+        self.assertContains(response, "#3 in line")
+
+        self.client.post(reverse('cancel_reservation', args=[queued[2].pk]))
+        self.assertEqual(Reservation.objects.get(pk=queued[2].pk).status, 'CANCELLED')
+
+    def test_reservation_list_shows_positions(self):
+        self.reserve_all()
+        self.client.login(username='librarian', password='password')
+
+        with self.assertNumQueries(5):  # session, user, reservations, loans, unread badge
+            response = self.client.get(reverse('reservation_list'))
+        self.assertEqual([r.queue_position for r in response.context['reservations']], [1, 2, 3, 4])
+
+
+class HoldExpiryTests(TestCase):
+    def setUp(self):
+        self.tier = MembershipTier.objects.create(name="Standard", max_books=5, borrow_duration_days=14, max_renewals=1)
+        self.borrower, self.first, self.second = [
+            User.objects.create_user(username=name, password='password', membership_tier=self.tier)
+            for name in ('borrower', 'first', 'second')
+        ]
+        author = Author.objects.create(name="Test Author")
+        self.book = Book.objects.create(
+            title="Held Book", isbn="9780000000200", author=author, publication_date="2020-01-01",
+            total_copies=1, available_copies=1,
+        )
+        self.record = services.issue_book(self.borrower, self.book)
+        self.config = LibraryConfiguration.load()
+
+    def return_copy(self, days_ago):
+        services.return_book(self.record, 0, now=timezone.now() - timedelta(days=days_ago))
+
+    def test_return_starts_the_hold(self):
+        reservation = reservations.enqueue(self.first, self.book)
+        self.return_copy(days_ago=0)
+        reservation.refresh_from_db()
+        self.assertIsNotNone(reservation.ready_date)
+
+    def test_expired_hold_passes_to_next_in_line(self):
+        held = reservations.enqueue(self.first, self.book)
+        waiting = reservations.enqueue(self.second, self.book)
+        self.return_copy(days_ago=self.config.hold_expiry_days + 1)
+
+        stats = reservations.expire_holds()
+
+        self.assertEqual(stats, {'expired': 1, 'advanced': 1, 'restocked': 0})
+        held.refresh_from_db()
+        waiting.refresh_from_db()
+        self.assertEqual((held.status, held.queue_position), ('CANCELLED', None))
+        self.assertEqual(waiting.queue_position, 1)
+        self.assertIsNotNone(waiting.ready_date)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.status, self.book.available_copies), ('RESERVED', 0))
+        self.assertTrue(Notification.objects.filter(user=self.first, kind='HOLD_EXPIRED', reservation=held).exists())
+        self.assertTrue(Notification.objects.filter(user=self.second, kind='HOLD_READY', reservation=waiting).exists())
+
+    def test_last_expired_hold_restocks_once(self):
+        reservations.enqueue(self.first, self.book)
+        self.return_copy(days_ago=self.config.hold_expiry_days + 1)
+
+        self.assertEqual(reservations.expire_holds()['restocked'], 1)
+        self.assertEqual(reservations.expire_holds(), {'expired': 0, 'advanced': 0, 'restocked': 0})
+
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.status, self.book.available_copies), ('AVAILABLE', 1))
+
+    def test_cancelled_ready_hold_passes_to_next_in_line(self):
+        held = reservations.enqueue(self.first, self.book)
+        waiting = reservations.enqueue(self.second, self.book)
+        self.return_copy(days_ago=0)
+
+        self.assertTrue(reservations.cancel(held))
+        waiting.refresh_from_db()
+        self.assertEqual(waiting.queue_position, 1)
+        self.assertIsNotNone(waiting.ready_date)
+        self.assertTrue(Notification.objects.filter(user=self.second, kind='HOLD_READY', reservation=waiting).exists())
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.status, self.book.available_copies), ('RESERVED', 0))
+
+        # With nobody left waiting the copy goes back on the shelf
+        self.assertTrue(reservations.cancel(waiting))
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.status, self.book.available_copies), ('AVAILABLE', 1))
+
+    def test_cancelling_a_waiting_reservation_keeps_the_hold(self):
+        held = reservations.enqueue(self.first, self.book)
+        waiting = reservations.enqueue(self.second, self.book)
+        self.return_copy(days_ago=0)
+
+        self.assertTrue(reservations.cancel(waiting))
+        held.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual((held.status, self.book.status, self.book.available_copies), ('PENDING', 'RESERVED', 0))
+        self.assertEqual(Notification.objects.filter(kind='HOLD_READY').count(), 1)
+
+    def test_fresh_holds_are_kept(self):
+        reservation = reservations.enqueue(self.first, self.book)
+        self.return_copy(days_ago=self.config.hold_expiry_days - 1)
+
+        call_command('expire_holds', stdout=StringIO())
+
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, 'PENDING')
+
+
+class SweepOverdueTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username='member', password='password')
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        author = Author.objects.create(name="Test Author")
+        now = timezone.now()
+        self.records = {}
+        for name, due in (('late', -3), ('soon', 1), ('later', 10)):
+            book = Book.objects.create(title=f"{name} book", isbn=f"97800000003{len(self.records)}", author=author, publication_date="2020-01-01")
+            self.records[name] = BorrowRecord.objects.create(user=self.member, book=book)
+            BorrowRecord.objects.filter(pk=self.records[name].pk).update(due_date=now + timedelta(days=due))
+
+    def test_sends_overdue_and_due_soon_alerts(self):
+        stats = reminders.sweep(chunk_size=1)
+
+        self.assertEqual((stats['overdue'], stats['due-soon'], stats['sent']), (1, 1, 3))
+        texts = sorted(notification.text for notification in Notification.objects.filter(user=self.member))
+        self.assertEqual(len(texts), 2)
+        self.assertTrue(texts[0].startswith("Reminder: 'soon book' is due on"))
+        self.assertTrue(texts[1].startswith("Warning: 'late book' is overdue since"))
+        self.assertEqual(
+            Notification.objects.get(user=self.librarian).text,
+            f"1 loans are overdue as of {timezone.localdate().strftime('%b %d, %Y')}.",
+        )
+
+    def test_rerun_on_the_same_day_sends_nothing(self):
+        reminders.sweep()
+        call_command('sweep_overdue', stdout=StringIO())
+
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual(reminders.sweep()['sent'], 0)
+
+    def test_next_day_sends_again_and_return_clears_alert(self):
+        reminders.sweep()
+        reminders.sweep(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(Notification.objects.filter(borrow_record=self.records['late'], kind='OVERDUE').count(), 2)
+
+        services.return_book(self.records['late'], 0)
+        self.assertFalse(Notification.objects.filter(borrow_record=self.records['late']).exclude(kind='RETURNED').exists())
+
+
+class LoanCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.tier = MembershipTier.objects.create(name="Standard", max_books=5, borrow_duration_days=14, max_renewals=2)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=self.tier)
+        author = Author.objects.create(name="Test Author")
+        self.books = [
+            Book.objects.create(title=f"Book {i}", isbn=f"97800000004{i:02d}", author=author, publication_date="2020-01-01")
+            for i in range(3)
+        ]
+        self.records = [services.issue_book(self.member, book) for book in self.books]
+        BorrowRecord.objects.filter(pk=self.records[0].pk).update(due_date=timezone.now() - timedelta(days=2))
+
+    def test_counts_come_from_the_database(self):
+        self.assertEqual(counters.loan_counts(), {'active': 3, 'overdue': 1, 'next_due': self.records[1].due_date})
+        self.assertEqual(counters.loan_counts(user_id=self.librarian.pk)['active'], 0)
+
+    def test_staff_home_page_cost_is_constant(self):
+        self.client.login(username='librarian', password='password')
+        self.client.get(reverse('home'))
+        for book in self.books:
+            BorrowRecord.objects.bulk_create([BorrowRecord(user=self.member, book=book, due_date=timezone.now() - timedelta(days=1))] * 20)
+
+        with self.assertNumQueries(4):  # session, user, unread badge, trending list; counters come from cache
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.context['total_active_loans'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            counters.invalidate()
+        response = self.client.get(reverse('home'))
+        self.assertEqual((response.context['total_active_loans'], response.context['total_overdue']), (63, 61))
+
+    def test_issue_return_and_renew_invalidate(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(counters.staff_counts()['overdue'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            services.return_book(self.records[1], 0)
+        self.assertEqual(counters.staff_counts()['active'], 2)
+
+        self.client.login(username='member', password='password')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('renew_book', args=[self.records[0].pk]))
+        self.assertEqual(counters.staff_counts()['overdue'], 0)
+
+    def test_cache_expires_when_the_next_loan_falls_due(self):
+        BorrowRecord.objects.filter(pk=self.records[1].pk).update(due_date=timezone.now() + timedelta(seconds=30))
+        with mock.patch.object(counters.cache, 'set') as cache_set:
+            counters.staff_counts()
+        self.assertLessEqual(cache_set.call_args.args[2], 31)
+
+
+class CirculationApiTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.tier = MembershipTier.objects.create(name="Standard", max_books=3, borrow_duration_days=14, max_renewals=1)
+        self.librarian = User.objects.create_user(username='librarian', password='password', role='LIBRARIAN')
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=self.tier)
+        author = Author.objects.create(name="Test Author")
+        self.books = [
+            Book.objects.create(
+                title=f"Book {i}", isbn=f"978000000010{i}", author=author, publication_date="2020-01-01",
+                total_copies=1, available_copies=1, price=20,
+            )
+            for i in range(3)
+        ]
+        self.client.login(username='librarian', password='password')
+
+    def call(self, payload, client=None, **extra):
+        return (client or self.client).post(
+            reverse('circulation_api'), json.dumps(payload), content_type='application/json', **extra
+        )
+
+    def test_batch_returns_results_and_member_state(self):
+        response = self.call({'operations': [
+            {'key': 'a1', 'action': 'issue', 'member': 'member', 'isbn': self.books[0].isbn},
+            {'key': 'a2', 'action': 'issue', 'member': 'member', 'isbn': self.books[1].isbn},
+            {'key': 'a3', 'action': 'renew', 'isbn': self.books[1].isbn},
+            {'key': 'a4', 'action': 'return', 'isbn': self.books[0].isbn},
+            {'key': 'a5', 'action': 'lost', 'isbn': self.books[2].isbn},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([result['status'] for result in data['results']], [200, 200, 200, 200, 404])
+        self.assertEqual(data['results'][2]['loan']['renewal_count'], 1)
+        state = data['members']['member']
+        self.assertEqual((state['active'], state['overdue']), (1, 0))
+        self.assertEqual([loan['isbn'] for loan in state['loans']], [self.books[1].isbn])
+
+    def test_retried_key_is_applied_once(self):
+        operation = {'key': 'scan-1', 'action': 'issue', 'member': 'member', 'isbn': self.books[0].isbn}
+        first = self.call(operation).json()['results'][0]
+        retry = self.call(operation).json()['results'][0]
+
+        self.assertFalse(first['replayed'])
+        self.assertTrue(retry['replayed'])
+        self.assertEqual(retry['loan'], first['loan'])
+        self.assertEqual(BorrowRecord.objects.filter(user=self.member).count(), 1)
+        self.books[0].refresh_from_db()
+        self.assertEqual(self.books[0].available_copies, 0)
+
+    def test_rule_failures_are_stored_and_key_reuse_is_refused(self):
+        services.issue_book(self.member, self.books[0])
+        operation = {'key': 'k', 'action': 'issue', 'member': 'member', 'isbn': self.books[0].isbn}
+        self.assertEqual(self.call(operation).json()['results'][0]['status'], 409)
+        self.assertTrue(self.call(operation).json()['results'][0]['replayed'])
+
+        reused = self.call(dict(operation, isbn=self.books[1].isbn)).json()['results'][0]
+        self.assertEqual(reused['status'], 422)
+        self.assertFalse(BorrowRecord.objects.filter(book=self.books[1]).exists())
+
+    def test_return_charges_overdue_fine_unless_paid(self):
+        record = services.issue_book(self.member, self.books[0])
+        BorrowRecord.objects.filter(pk=record.pk).update(due_date=timezone.now() - timedelta(days=3))
+        result = self.call({'key': 'r', 'action': 'return', 'isbn': self.books[0].isbn}).json()
+        self.assertEqual(result['results'][0]['overdue_days'], 3)
+        self.assertEqual(Decimal(result['members']['member']['outstanding_balance']), Decimal(result['results'][0]['fine']))
+
+    def test_bad_amounts_and_flags_are_refused(self):
+        services.issue_book(self.member, self.books[0])
+        operation = {'action': 'lost', 'isbn': self.books[0].isbn}
+        for n, bad in enumerate([{'fee': 'NaN'}, {'fee': 'Infinity'}, {'fee': '-1'}, {'pay_now': 'false'}]):
+            result = self.call(dict(operation, key=f'bad-{n}', **bad)).json()['results'][0]
+            self.assertEqual(result['status'], 400, bad)
+        self.assertEqual(BorrowRecord.objects.get(book=self.books[0]).status, 'ISSUED')
+
+        result = self.call(dict(operation, key='ok', fee='5', pay_now=False)).json()
+        self.assertFalse(result['results'][0]['paid'])
+        self.assertEqual(Decimal(result['members']['member']['outstanding_balance']), Decimal('5'))
+
+    def test_old_keys_are_purged(self):
+        self.call({'key': 'old', 'action': 'issue', 'member': 'member', 'isbn': self.books[0].isbn})
+        self.call({'key': 'new', 'action': 'issue', 'member': 'member', 'isbn': self.books[1].isbn})
+        IdempotencyKey.objects.filter(key='old').update(created_at=timezone.now() - api.KEEP_KEYS_FOR - timedelta(hours=1))
+        out = StringIO()
+        call_command('purge_api_keys', stdout=out)
+        self.assertIn("Deleted 1 idempotency keys", out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['new'])
+
+    def test_csrf_is_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='librarian', password='password')
+        operation = {'key': 'c', 'action': 'issue', 'member': 'member', 'isbn': self.books[0].isbn}
+        self.assertEqual(self.call(operation, client).status_code, 403)
+
+        response = client.get(reverse('circulation_api'), {'member': 'member'})
+        self.assertEqual(response.json()['members']['member']['active'], 0)
+        token = response.cookies['csrftoken'].value
+        self.assertEqual(self.call(operation, client, HTTP_X_CSRFTOKEN=token).status_code, 200)
+
+    def test_members_cannot_use_the_api(self):
+        self.client.login(username='member', password='password')
+        self.assertEqual(self.call({'key': 'x', 'action': 'renew', 'isbn': self.books[0].isbn}).status_code, 403)
+
+
+class CirculationEventTests(TestCase):
+    def setUp(self):
+        self.tier = MembershipTier.objects.create(name="Standard", max_books=5, borrow_duration_days=14, max_renewals=1)
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER', membership_tier=self.tier)
+        self.other_member = User.objects.create_user(username='other', password='password', role='MEMBER', membership_tier=self.tier)
+        author = Author.objects.create(name="Test Author")
+        self.books = [
+            Book.objects.create(title=f"Book {i}", isbn=f"978000000020{i}", author=author, publication_date="2020-01-01")
+            for i in range(3)
+        ]
+
+    def kinds(self):
+        return list(CirculationEvent.objects.order_by('pk').values_list('kind', flat=True))
+
+    def test_every_operation_appends_an_event(self):
+        record = services.issue_book(self.member, self.books[0])
+        services.renew_loan(record)
+        services.return_book(record, 0)
+        lost = services.issue_book(self.member, self.books[1])
+        services.mark_lost(lost, 20)
+        services.issue_books(self.member, [self.books[0]])
+        services.return_books(BorrowRecord.objects.filter(status='ISSUED'))
+        Book.objects.filter(pk=self.books[2].pk).update(available_copies=0)
+        reservation = reservations.enqueue(self.other_member, self.books[2])
+        reservations.cancel(reservation)
+        reservations.cancel(reservation)  # already closed, logs nothing
+
+        self.assertEqual(self.kinds(), [
+            'ISSUED', 'RENEWED', 'RETURNED', 'ISSUED', 'LOST', 'ISSUED', 'RETURNED', 'RESERVED', 'RESERVATION_CANCELLED',
+        ])
+        renewed = CirculationEvent.objects.get(kind='RENEWED')
+        self.assertEqual((renewed.borrow_record_id, renewed.data['renewal_count']), (record.pk, '1'))
+
+    def test_failed_operations_log_nothing(self):
+        services.issue_book(self.member, self.books[0])
+        with self.assertRaises(services.CirculationError):
+            services.issue_book(self.other_member, self.books[0])
+        self.assertEqual(self.kinds(), ['ISSUED'])
+
+    def test_consumers_resume_from_their_mark(self):
+        seen = []
+        for book in self.books:
+            services.issue_book(self.member, book)
+        self.assertEqual(events.consume('test', seen.extend, batch_size=2), 3)
+        self.assertEqual(events.consume('test', seen.extend), 0)
+
+        services.return_book(BorrowRecord.objects.get(book=self.books[0]), 0)
+        self.assertEqual(events.consume('test', seen.extend), 1)
+        self.assertEqual([event.kind for event in seen], ['ISSUED'] * 3 + ['RETURNED'])
+        self.assertEqual(ConsumerOffset.objects.get(name='test').position, seen[-1].pk)
+        # Other consumers keep their own position
+        self.assertEqual(events.consume('other', lambda batch: None), 4)
+
+    def test_history_outlives_deleted_members_and_books(self):
+        record = services.issue_book(self.member, self.books[0])
+        services.return_book(record, 0)
+        reservations.enqueue(self.other_member, self.books[1])
+        logged = list(CirculationEvent.objects.order_by('pk').values_list('kind', 'user_id', 'book_id', 'borrow_record_id'))
+
+        self.books[0].delete()
+        self.other_member.delete()
+        self.assertEqual(
+            list(CirculationEvent.objects.order_by('pk').values_list('kind', 'user_id', 'book_id', 'borrow_record_id')),
+            logged,
+        )
+
+    def test_replayed_history_is_in_time_order(self):
+        migration = import_module('circulation.migrations.0008_circulation_events')
+        now = timezone.now()
+        first = services.issue_book(self.member, self.books[0])
+        second = services.issue_book(self.member, self.books[1])
+        services.return_book(second, 0, now=now + timedelta(days=1))
+        services.mark_lost(first, 0)
+        Book.objects.filter(pk=self.books[2].pk).update(available_copies=0)
+        reservations.enqueue(self.other_member, self.books[2])
+        BorrowRecord.objects.filter(pk=first.pk).update(issued_date=now - timedelta(days=2))
+        BorrowRecord.objects.filter(pk=second.pk).update(issued_date=now - timedelta(days=1))
+        CirculationEvent.objects.all().delete()
+
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.replay_history(django_apps, None)
+        self.assertEqual(
+            list(CirculationEvent.objects.order_by('pk').values_list('kind', 'borrow_record_id')),
+            [('ISSUED', first.pk), ('LOST', first.pk), ('ISSUED', second.pk), ('RESERVED', None), ('RETURNED', second.pk)],
+        )
+
+    def test_failed_batch_does_not_advance_the_mark(self):
+        services.issue_book(self.member, self.books[0])
+
+        def fail(batch):
+            raise RuntimeError
+        with self.assertRaises(RuntimeError):
+            events.consume('test', fail)
+        self.assertEqual(events.consume('test', lambda batch: None), 1)
@@ -0,0 +1,97 @@
+import threading
+from django.db import connections
+from django.test import TransactionTestCase
+from django.contrib.auth import get_user_model
+from books.models import Book, Author
+from circulation.models import BorrowRecord
+from circulation import services
+from accounts.models import MembershipTier
+
+User = get_user_model()
+
+
+class ParallelDeskTests(TransactionTestCase):
+    """Several desks issuing and returning the same title at once."""
+    desks = 8
+    copies = 3
+
+    def setUp(self):
+        tier = MembershipTier.objects.create(name="Standard", max_books=5, borrow_duration_days=14, max_renewals=1)
+        self.members = [
+            User.objects.create_user(username=f'member{i}', password='password', membership_tier=tier)
+            for i in range(self.desks)
+        ]
+        author = Author.objects.create(name="Test Author")
+        self.book = Book.objects.create(
+            title="Contested Book", isbn="1234567890123", author=author,
+            publication_date="2023-01-01", total_copies=self.copies, available_copies=self.copies,
+        )
+
+    def run_desks(self, work):
+        """Run `work(i)` on one thread per desk, all released at the same moment."""
+        barrier = threading.Barrier(self.desks)
+        results, errors = [None] * self.desks, []
+
+        def desk(i):
+            try:
+                barrier.wait()
+                results[i] = work(i)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=desk, args=(i,)) for i in range(self.desks)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def issue(self, i):
+        try:
+            services.issue_book(self.members[i], self.book)
+            return 'issued'
+        except services.CirculationError:
+            return 'unavailable'
+
+    def test_parallel_issues_never_oversell(self):
+        results = self.run_desks(self.issue)
+
+        self.book.refresh_from_db()
+        self.assertEqual(results.count('issued'), self.copies)
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(self.book.status, 'OUT_OF_STOCK')
+        self.assertEqual(BorrowRecord.objects.filter(book=self.book, status='ISSUED').count(), self.copies)
+
+    def test_double_scanned_return_is_applied_once(self):
+        record = services.issue_book(self.members[0], self.book)
+
+        def checkin(i):
+            try:
+                services.return_book(record, 0)
+                return 'returned'
+            except services.CirculationError:
+                return 'duplicate'
+
+        results = self.run_desks(checkin)
+
+        self.book.refresh_from_db()
+        self.assertEqual(results.count('returned'), 1)
+        self.assertEqual(self.book.available_copies, self.copies)
+
+    def test_stock_matches_open_loans_under_mixed_traffic(self):
+        self.run_desks(self.issue)
+
+        def churn(i):
+            for record in BorrowRecord.objects.filter(user=self.members[i], status='ISSUED'):
+                services.return_book(record, 0)
+            return self.issue(i)
+
+        self.run_desks(churn)
+
+        self.book.refresh_from_db()
+        on_loan = BorrowRecord.objects.filter(book=self.book, status='ISSUED').count()
+        self.assertGreaterEqual(self.book.available_copies, 0)
+        self.assertEqual(self.book.available_copies + on_loan, self.copies)
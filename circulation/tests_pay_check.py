@@ -4,7 +4,8 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
-from circulation.models import BorrowRecord
+from circulation.models import BorrowRecord, FineTransaction
+from circulation import fines, services
 from books.models import Book, Author
 from core.models import LibraryConfiguration, Notification
 
@@ -59,7 +60,10 @@ class PayCheckFeatureTest(TestCase):
         # Create a notification (even if read, it should be deleted)
         notification = Notification.objects.create(
             user=self.member,
-            message=f"OVERDUE ALERT: '{self.book.title}' is overdue.",
+            kind=Notification.Kind.OVERDUE,
+            borrow_record=record,
+            book=self.book,
+            params={'due': record.due_date.date().isoformat()},
             is_read=True
         )
 
@@ -171,3 +175,99 @@ class PayCheckFeatureTest(TestCase):
         
         expected_fine = overdue_days * self.config.fine_per_day
         self.assertEqual(record.fine_amount, expected_fine) # Kept
+
+
+class FineLedgerTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.librarian = User.objects.create_user(username='librarian', password='password123', role=User.Role.LIBRARIAN)
+        self.member = User.objects.create_user(username='member', password='password123', role=User.Role.MEMBER)
+        self.author = Author.objects.create(name='Test Author')
+        self.book = Book.objects.create(
+            title='Test Book', isbn='1234567890', author=self.author,
+            publication_date=timezone.now().date(), available_copies=1, price=Decimal('100.00')
+        )
+        LibraryConfiguration.objects.create(fine_per_day=Decimal('5.00'))
+        self.client.login(username='librarian', password='password123')
+
+    def overdue_record(self, days=2):
+        record = BorrowRecord.objects.create(user=self.member, book=self.book, status='ISSUED')
+        BorrowRecord.objects.filter(pk=record.pk).update(due_date=timezone.now() - timedelta(days=days, hours=1))
+        return record
+
+    def ledger(self):
+        return list(FineTransaction.objects.filter(user=self.member).order_by('pk').values_list('kind', 'amount'))
+
+    def test_pay_later_accrues_to_balance(self):
+        record = self.overdue_record()
+        self.client.post(reverse('return_book'), {'record_id': record.id, 'action': 'return_pay_later'})
+
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.outstanding_balance, Decimal('10.00'))
+        self.assertEqual(self.ledger(), [('ACCRUAL', Decimal('10.00'))])
+        self.assertEqual(FineTransaction.objects.get().created_by, self.librarian)
+
+    def test_pay_now_is_recorded_but_leaves_no_balance(self):
+        record = self.overdue_record()
+        self.client.post(reverse('return_book'), {'record_id': record.id, 'action': 'return_pay_now'})
+
+        self.member.refresh_from_db()
+        record.refresh_from_db()
+        self.assertEqual(record.fine_amount, Decimal('0.00'))
+        self.assertEqual(self.member.outstanding_balance, Decimal('0.00'))
+        self.assertEqual(self.ledger(), [('ACCRUAL', Decimal('10.00')), ('PAYMENT', Decimal('10.00'))])
+
+    def test_clear_fines_pays_balance_and_keeps_history(self):
+        record = self.overdue_record()
+        services.return_book(record, Decimal('10.00'))
+
+        self.client.post(reverse('clear_fines', args=[self.member.pk]))
+
+        self.member.refresh_from_db()
+        record.refresh_from_db()
+        self.assertEqual(self.member.outstanding_balance, Decimal('0.00'))
+        self.assertEqual(record.fine_amount, Decimal('10.00'))
+        self.assertEqual(self.ledger(), [('ACCRUAL', Decimal('10.00')), ('PAYMENT', Decimal('10.00'))])
+
+    def test_waiver_and_partial_payment(self):
+        services.mark_lost(self.overdue_record(), Decimal('100.00'))
+
+        fines.settle(self.member, FineTransaction.Kind.PAYMENT, amount=Decimal('30.00'), by=self.librarian)
+        self.assertEqual(self.member.outstanding_balance, Decimal('70.00'))
+        self.client.post(reverse('clear_fines', args=[self.member.pk]), {'action': 'waive'})
+
+        self.member.refresh_from_db()
+        self.assertEqual(self.member.outstanding_balance, Decimal('0.00'))
+        self.assertEqual(self.ledger()[-1], ('WAIVER', Decimal('70.00')))
+        self.assertIsNone(fines.settle(self.member, FineTransaction.Kind.PAYMENT))
+
+    def test_balance_matches_ledger_after_batch_return(self):
+        other = Book.objects.create(title='Other', isbn='0987654321', author=self.author, publication_date=timezone.now().date())
+        records = [self.overdue_record(days=2), BorrowRecord.objects.create(user=self.member, book=other)]
+        BorrowRecord.objects.filter(pk=records[1].pk).update(due_date=timezone.now() - timedelta(days=3, hours=1))
+        for record in records:
+            record.refresh_from_db()
+
+        services.return_books(records, by=self.librarian)
+
+        self.member.refresh_from_db()
+        ledger_total = sum(entry.signed_amount for entry in FineTransaction.objects.filter(user=self.member))
+        self.assertEqual(self.member.outstanding_balance, Decimal('25.00'))
+        self.assertEqual(ledger_total, self.member.outstanding_balance)
+
+    def test_lost_fee_must_be_zero_or_more(self):
+        record = self.overdue_record()
+        for fee in ['-50', 'NaN', 'Infinity', 'abc']:
+            response = self.client.post(reverse('return_book'), {
+                'record_id': record.id, 'action': 'confirm_lost_pay_later', 'fine_amount': fee,
+            })
+            self.assertContains(response, "Enter a replacement fee of zero or more.")
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'ISSUED')
+        self.assertEqual(self.ledger(), [])
+
+        with self.assertRaises(ValueError):
+            services.mark_lost(record, Decimal('-50.00'))
+        record.refresh_from_db()
+        self.member.refresh_from_db()
+        self.assertEqual((record.status, self.member.outstanding_balance), ('ISSUED', Decimal('0.00')))
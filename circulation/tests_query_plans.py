@@ -0,0 +1,72 @@
+import re
+from datetime import timedelta
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from books.models import Book, Author
+from circulation.models import BorrowRecord, Reservation
+from core.models import Notification
+from core.utils import day_range
+
+User = get_user_model()
+
+# "SCAN <table>" with no "USING ... INDEX" reads every row of the table
+FULL_SCAN_RE = re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)')
+
+
+@skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class HotQueryPlanTests(TestCase):
+    """Every query on the circulation hot paths must be answered from an index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = User.objects.create_user(username='member', password='password')
+        author = Author.objects.create(name="Test Author")
+        # No ANALYZE: without statistics SQLite plans as if tables were large,
+        # which is the case these tests guard.
+        cls.book = Book.objects.create(title="Dune", isbn="9780441013593", author=author, publication_date="1965-08-01")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        scans = FULL_SCAN_RE.findall(plan)
+        self.assertFalse(scans, f"Full table scan of {', '.join(scans)}:\n{queryset.query}\n{plan}")
+
+    def test_desk_daily_counts(self):
+        start, end = day_range(timezone.localdate())
+        self.assertUsesIndex(BorrowRecord.objects.filter(issued_date__gte=start, issued_date__lt=end))
+        self.assertUsesIndex(BorrowRecord.objects.filter(return_date__gte=start, return_date__lt=end))
+
+    def test_overdue_loans(self):
+        now = timezone.now()
+        self.assertUsesIndex(BorrowRecord.objects.filter(status='ISSUED', due_date__lt=now).order_by('due_date'))
+        self.assertUsesIndex(BorrowRecord.objects.filter(status='ISSUED', due_date__lt=now + timedelta(days=1)))
+
+    def test_member_active_loans(self):
+        self.assertUsesIndex(BorrowRecord.objects.filter(user=self.member, status='ISSUED'))
+        self.assertUsesIndex(BorrowRecord.objects.filter(user=self.member).order_by('-issued_date'))
+
+    def test_status_lists(self):
+        self.assertUsesIndex(BorrowRecord.objects.filter(status='LOST').order_by('-issued_date')[:5])
+        self.assertUsesIndex(BorrowRecord.objects.filter(status='RETURNED').order_by('-return_date')[:5])
+
+    def test_reservation_queue(self):
+        self.assertUsesIndex(Reservation.objects.filter(book=self.book, status='PENDING').order_by('queue_position')[:1])
+        self.assertUsesIndex(Reservation.objects.filter(book=self.book, status='PENDING', queue_position__gt=2))
+        self.assertUsesIndex(Reservation.objects.filter(status='PENDING').order_by('reserved_date'))
+        self.assertUsesIndex(Reservation.objects.filter(status='PENDING', ready_date__lt=timezone.now()))
+
+    def test_notifications(self):
+        self.assertUsesIndex(Notification.objects.filter(user=self.member, is_read=False))
+        self.assertUsesIndex(Notification.objects.filter(user=self.member).order_by('-created_at')[:20])
+        # Clearing a loan's alerts on return or renewal
+        self.assertUsesIndex(Notification.objects.filter(borrow_record_id=1, kind__in=['OVERDUE', 'DUE_SOON']))
+
+    def test_catalog_listing(self):
+        self.assertUsesIndex(Book.objects.filter(status='AVAILABLE').order_by('-publication_date')[:12])
+        self.assertUsesIndex(Book.objects.exclude(status='LOST').order_by('-publication_date', '-pk')[:12])
+
+    def test_full_scan_is_detected(self):
+        # Guard against the regex silently matching nothing
+        self.assertTrue(FULL_SCAN_RE.search(Notification.objects.filter(message__icontains='overdue').explain()))
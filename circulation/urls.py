@@ -4,8 +4,13 @@ from . import views
 urlpatterns = [
     path('issue/', views.IssueBookView.as_view(), name='issue_book'),
     path('return/', views.ReturnBookView.as_view(), name='return_book'),
+    path('desk/', views.DeskSessionView.as_view(), name='desk_session'),
+    path('api/', views.CirculationApiView.as_view(), name='circulation_api'),
     path('my-books/', views.MemberBorrowListView.as_view(), name='my_books'),
     path('renew/<int:pk>/', views.RenewBookView.as_view(), name='renew_book'),
     path('reserve/<int:pk>/', views.ReserveBookView.as_view(), name='reserve_book'),
+    path('reservations/<int:pk>/cancel/', views.CancelReservationView.as_view(), name='cancel_reservation'),
     path('reservations/', views.ReservationListView.as_view(), name='reservation_list'),
+    path('lookup/members/', views.MemberLookupView.as_view(), name='member_lookup'),
+    path('lookup/books/', views.BookLookupView.as_view(), name='book_lookup'),
 ]
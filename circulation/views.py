@@ -1,16 +1,24 @@
+import json
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import FormView, ListView, View
 from django.urls import reverse_lazy, reverse
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.http import JsonResponse
 from django.utils import timezone
-from datetime import timedelta
-from decimal import Decimal
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import ensure_csrf_cookie
+from decimal import Decimal, InvalidOperation
 from .forms import IssueBookForm
 from .models import BorrowRecord, Reservation
+from . import api, reservations, services
+from accounts import tiers
 from books.models import Book
-from core.models import LibraryConfiguration, Notification
+from core.utils import day_range
 
 User = get_user_model()
 
@@ -25,113 +33,30 @@ class IssueBookView(LoginRequiredMixin, LibrarianRequiredMixin, FormView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        today = timezone.now().date()
-        context['issued_today_count'] = BorrowRecord.objects.filter(issued_date__date=today).count()
+        start, end = day_range(timezone.localdate())
+        context['issued_today_count'] = BorrowRecord.objects.filter(issued_date__gte=start, issued_date__lt=end).count()
         context['recent_issues'] = BorrowRecord.objects.select_related('user', 'book').order_by('-issued_date')[:5]
-        context['members'] = User.objects.all().values('username', 'first_name', 'last_name', 'email', 'role', 'membership_tier__name')
-        context['books'] = Book.objects.all().values('title', 'isbn')
         return context
 
     def form_valid(self, form):
-        # Additional validation logic
-        username = form.cleaned_data['username']
-        isbn = form.cleaned_data['book_isbn']
-        
-        try:
-            user = User.objects.get(username=username)
-        except User.DoesNotExist:
-            form.add_error('username', 'User not found.')
-            return self.form_invalid(form)
-
         try:
-            book = Book.objects.get(isbn=isbn)
-        except Book.DoesNotExist:
-            form.add_error('book_isbn', 'Book not found.')
+            services.issue_book(form.member, form.book)
+        except services.CirculationError as e:
+            form.add_error(e.field, e.message)
             return self.form_invalid(form)
 
-        # Check availability and reservations
-        reservation = Reservation.objects.filter(book=book, status='PENDING').order_by('reserved_date').first()
-        
-        # If reserved for SOMEONE ELSE
-        if reservation and reservation.user != user:
-             form.add_error('book_isbn', f"This book is reserved for {reservation.user.username}.")
-             return self.form_invalid(form)
-
-        if book.available_copies < 1:
-            # Allow if reserved for THIS user
-            if reservation and reservation.user == user:
-                pass # Allow issue
-            else:
-                form.add_error('book_isbn', 'Book is currently unavailable.')
-                return self.form_invalid(form)
-            
-        # Check active borrow limit
-        active_borrows = BorrowRecord.objects.filter(user=user, status='ISSUED').count()
-        limit = user.membership_tier.max_books if user.membership_tier else 0
-        if active_borrows >= limit:
-             form.add_error(None, f"User has reached their borrow limit of {limit} books.")
-             return self.form_invalid(form)
-
-        # Create Borrow Record
-        BorrowRecord.objects.create(user=user, book=book)
-        
-        # Handle Stock and Reservation
-        if reservation and reservation.user == user:
-             reservation.status = 'FULFILLED'
-             reservation.save()
-             # Stock was already 0 (or effectively reserved), so we don't decrement if it was 0.
-             # If it was > 0 but reserved, we decrement.
-             if book.available_copies > 0:
-                 book.available_copies -= 1
-             
-             # Reset status to standard logic (OUT_OF_STOCK if 0)
-             book.status = 'OUT_OF_STOCK' if book.available_copies == 0 else 'AVAILABLE'
-             book.save()
-        else:
-            book.available_copies -= 1
-            book.save()
-        
-        # Send Notification
-        Notification.objects.create(
-            user=user,
-            message=f"You have successfully borrowed '{book.title}'. Due date: {BorrowRecord.objects.filter(user=user, book=book).last().due_date.strftime('%b %d, %Y')}."
-        )
-
-        messages.success(self.request, f"Issued '{book.title}' to {user.username}.")
+        messages.success(self.request, f"Issued '{form.book.title}' to {form.member.username}.")
         return super().form_valid(form)
 
 class RenewBookView(LoginRequiredMixin, View):
     def post(self, request, pk):
-        record = get_object_or_404(BorrowRecord, pk=pk, user=request.user, status='ISSUED')
-        
-        # Logic Check
-        # 1. Check if book is reserved by someone else
-        if Reservation.objects.filter(book=record.book, status='PENDING').exists():
-            messages.error(request, f"Cannot renew '{record.book.title}'. It has been reserved by another member.")
-            return redirect('my_books')
-        
-        # 2. Check renewal limit
-        max_renewals = request.user.membership_tier.max_renewals if request.user.membership_tier else 1
-        if record.renewal_count >= max_renewals:
-            messages.error(request, f"Maximum renewal limit ({max_renewals}) reached for '{record.book.title}'.")
+        record = get_object_or_404(BorrowRecord.objects.select_related('book', 'user'), pk=pk, user=request.user, status='ISSUED')
+        try:
+            services.renew_loan(record)
+        except services.CirculationError as e:
+            messages.error(request, e.message)
             return redirect('my_books')
 
-        # 3. Process Renewal
-        days_to_add = 14
-        if request.user.membership_tier:
-            days_to_add = request.user.membership_tier.borrow_duration_days
-            
-        record.due_date += timedelta(days=days_to_add)
-        record.renewal_count += 1
-        record.save()
-        
-        # Clear related overdue notifications
-        # Fix: Delete overdue notifications so they don't persist
-        Notification.objects.filter(
-            user=request.user,
-            message__icontains=record.book.title
-        ).filter(message__icontains='overdue').delete()
-        
         messages.success(request, f"'{record.book.title}' renewed successfully. New due date: {record.due_date.strftime('%B %d, %Y')}")
         return redirect('my_books')
 
@@ -148,19 +73,27 @@ class ReserveBookView(LoginRequiredMixin, View):
             messages.warning(request, "You already have a pending reservation for this book.")
             return redirect('book_detail', pk=pk)
 
-        Reservation.objects.create(user=request.user, book=book)
-        messages.success(request, f"You have successfully reserved '{book.title}'. We will notify you when it returns.")
+        reservation = reservations.enqueue(request.user, book)
+        messages.success(request, f"You have successfully reserved '{book.title}' (#{reservation.queue_position} in line). We will notify you when it returns.")
         return redirect('book_detail', pk=pk)
 
+class CancelReservationView(LoginRequiredMixin, View):
+    def post(self, request, pk):
+        reservation = get_object_or_404(Reservation.objects.select_related('book'), pk=pk, user=request.user)
+        if reservations.cancel(reservation):
+            messages.success(request, f"Your reservation for '{reservation.book.title}' has been cancelled.")
+        else:
+            messages.warning(request, "This reservation is no longer pending.")
+        return redirect('my_books')
+
 class ReturnBookView(LoginRequiredMixin, LibrarianRequiredMixin, View):
     template_name = 'circulation/return_book.html'
 
     def get_context_data(self):
-        today = timezone.now().date()
+        start, end = day_range(timezone.localdate())
         context = {
-            'returned_today_count': BorrowRecord.objects.filter(return_date__date=today).count(),
+            'returned_today_count': BorrowRecord.objects.filter(return_date__gte=start, return_date__lt=end).count(),
             'recent_returns': BorrowRecord.objects.filter(status='RETURNED').select_related('user', 'book').order_by('-return_date')[:5],
-            'members': User.objects.all().values('username', 'first_name', 'last_name', 'email', 'role', 'membership_tier__name')
         }
         return context
 
@@ -185,7 +118,7 @@ class ReturnBookView(LoginRequiredMixin, LibrarianRequiredMixin, View):
             messages.error(request, "Invalid Request")
             return redirect('return_book')
 
-        record = get_object_or_404(BorrowRecord, id=record_id, status='ISSUED')
+        record = get_object_or_404(BorrowRecord.objects.select_related('user', 'book'), id=record_id, status='ISSUED')
         
         # --- Mark as Lost Workflow ---
         if action == 'mark_lost':
@@ -194,51 +127,39 @@ class ReturnBookView(LoginRequiredMixin, LibrarianRequiredMixin, View):
                 'book_price': record.book.price
             })
 
-        elif action == 'confirm_lost_pay_now':
+        elif action in ('confirm_lost_pay_now', 'confirm_lost_pay_later'):
             fine_val = request.POST.get('fine_amount', '0.00')
             try:
                 fine = Decimal(fine_val)
-            except:
-                fine = Decimal('0.00')
-            
-            record.status = 'LOST'
-            record.fine_amount = Decimal('0.00') # Paid immediately
-            record.save()
-            
-            record.book.status = 'LOST'
-            record.book.save()
-            
-            messages.success(request, f"'{record.book.title}' marked as LOST. Replacement fee of ₹{fine} PAID.")
-            return redirect(f"{reverse('return_book')}?username={record.user.username}")
+            except InvalidOperation:
+                fine = None
+            # NaN and Infinity parse, and a negative fee would credit the member
+            if fine is None or not fine.is_finite() or fine < 0:
+                messages.error(request, "Enter a replacement fee of zero or more.")
+                return render(request, 'circulation/lost_confirmation.html', {
+                    'record': record,
+                    'book_price': record.book.price
+                })
 
-        elif action == 'confirm_lost_pay_later':
-            fine_val = request.POST.get('fine_amount', '0.00')
+            pay_now = action == 'confirm_lost_pay_now'
             try:
-                fine = Decimal(fine_val)
-            except:
-                fine = Decimal('0.00')
-
-            record.status = 'LOST'
-            record.fine_amount = fine # Added to account
-            record.save()
-            
-            record.book.status = 'LOST'
-            record.book.save()
-            
-            messages.warning(request, f"'{record.book.title}' marked as LOST. Replacement fee of ₹{fine} added to account.")
+                # Paid immediately, or added to account
+                services.mark_lost(
+                    record, Decimal('0.00') if pay_now else fine, paid=fine if pay_now else Decimal('0.00'), by=request.user
+                )
+            except services.CirculationError as e:
+                messages.error(request, e.message)
+                return redirect(f"{reverse('return_book')}?username={record.user.username}")
+
+            if pay_now:
+                messages.success(request, f"'{record.book.title}' marked as LOST. Replacement fee of ₹{fine} PAID.")
+            else:
+                messages.warning(request, f"'{record.book.title}' marked as LOST. Replacement fee of ₹{fine} added to account.")
             return redirect(f"{reverse('return_book')}?username={record.user.username}")
 
         # --- Return Workflow ---
         # Check for Fine logic
-        now = timezone.now()
-        fine_amount = Decimal('0.00')
-        overdue_days = 0
-        
-        if now > record.due_date:
-            overdue_days = (now - record.due_date).days
-            if overdue_days > 0:
-                config = LibraryConfiguration.load()
-                fine_amount = overdue_days * config.fine_per_day
+        fine_amount, overdue_days = services.calculate_fine(record)
 
         # 1. Initial Click (Action is 'return') -> Show Confirmation if fine exists
         if action == 'return':
@@ -255,55 +176,28 @@ class ReturnBookView(LoginRequiredMixin, LibrarianRequiredMixin, View):
         # 2. Pay Now Clicked
         elif action == 'return_pay_now':
             final_fine = Decimal('0.00') # Cleared immediately
-            messages.success(request, f"Returned '{record.book.title}'. Fine of ₹{fine_amount} PAID.")
 
         # 3. Pay Later Clicked
         elif action == 'return_pay_later':
             final_fine = fine_amount # Added to account
-            messages.warning(request, f"Returned '{record.book.title}'. Fine of ₹{final_fine} added to account.")
         
         else:
             return redirect('return_book')
 
-        # Process Return (Common Logic)
-        record.return_date = now
-        record.status = 'RETURNED'
-        record.fine_amount = final_fine
-        record.save()
-        
-        # Clear related overdue notifications (Member and Staff alerts)
-        # Fix: Delete overdue notifications so they don't persist in the list as "Active Alerts"
-        Notification.objects.filter(
-            user=record.user,
-            message__icontains=record.book.title
-        ).filter(message__icontains='overdue').delete()
-        
-        Notification.objects.filter(
-            message__icontains=record.book.title
-        ).filter(message__icontains=record.user.username).filter(message__icontains='overdue').delete()
-        
-        # Reservation Check
-        res = Reservation.objects.filter(book=record.book, status='PENDING').order_by('reserved_date').first()
-        if res:
-            messages.info(request, f"HOLD ALERT: This copy of '{record.book.title}' is reserved for {res.user.username}. Please set it aside.")
-            record.book.status = 'RESERVED'
-            record.book.save()
-            
-            # Notify Reserver
-            Notification.objects.create(
-                user=res.user,
-                message=f"Good news! '{record.book.title}' is now available for you to pick up."
-            )
-        else:
-            # Increment Stock
-            record.book.available_copies += 1
-            record.book.save()
+        try:
+            paid = fine_amount if action == 'return_pay_now' else Decimal('0.00')
+            reservation = services.return_book(record, final_fine, paid=paid, by=request.user)
+        except services.CirculationError as e:
+            messages.error(request, e.message)
+            return redirect(f"{reverse('return_book')}?username={record.user.username}")
+
+        if action == 'return_pay_now':
+            messages.success(request, f"Returned '{record.book.title}'. Fine of ₹{fine_amount} PAID.")
+        elif action == 'return_pay_later':
+            messages.warning(request, f"Returned '{record.book.title}'. Fine of ₹{final_fine} added to account.")
 
-        # Notify Borrower
-        Notification.objects.create(
-            user=record.user,
-            message=f"You have returned '{record.book.title}'. Thank you!"
-        )
+        if reservation:
+            messages.info(request, f"HOLD ALERT: This copy of '{record.book.title}' is reserved for {reservation.user.username}. Please set it aside.")
 
         # Standard success message if no fine was involved (to avoid double messaging)
         if fine_amount == 0:
@@ -311,11 +205,218 @@ class ReturnBookView(LoginRequiredMixin, LibrarianRequiredMixin, View):
         
         return redirect(f"{reverse('return_book')}?username={record.user.username}")
 
+# --- Batch Desk Sessions ---
+
+class DeskSessionView(LoginRequiredMixin, LibrarianRequiredMixin, View):
+    """
+    Scanner station mode: open a session for one member, scan any number of
+    books, then issue (or check in) the whole basket in one transaction.
+    The basket lives in the librarian's session until it is committed.
+    """
+    template_name = 'circulation/desk_session.html'
+    session_key = 'desk_session'
+
+    def get_desk(self):
+        return self.request.session.get(self.session_key)
+
+    def save_desk(self, desk):
+        if desk is None:
+            self.request.session.pop(self.session_key, None)
+        else:
+            self.request.session[self.session_key] = desk
+
+    def get_items(self, desk):
+        """The scanned books (issue) or loans (return), in scan order."""
+        if desk['mode'] == 'issue':
+            items = Book.objects.in_bulk(desk['items'])
+        else:
+            items = BorrowRecord.objects.select_related('user', 'book').in_bulk(desk['items'])
+        return [items[pk] for pk in desk['items'] if pk in items]
+
+    def get(self, request):
+        desk = self.get_desk()
+        context = {'desk': desk}
+        if desk:
+            items = self.get_items(desk)
+            context['items'] = items
+            if desk['mode'] == 'return':
+                now = timezone.now()
+                fines = [services.calculate_fine(record, now)[0] for record in items]
+                context['items'] = list(zip(items, fines))
+                context['total_fine'] = sum(fines, Decimal('0.00'))
+            else:
+                context['active_loans'] = BorrowRecord.objects.filter(user_id=desk['member_id'], status='ISSUED').count()
+        return render(request, self.template_name, context)
+
+    def post(self, request):
+        action = request.POST.get('action')
+        desk = self.get_desk()
+        if action == 'open':
+            self.open(request)
+        elif not desk:
+            messages.error(request, "Open a session for a member first.")
+        elif action == 'scan':
+            self.scan(request, desk)
+        elif action == 'remove':
+            try:
+                desk['items'].remove(int(request.POST.get('item_id', '')))
+            except ValueError:
+                pass
+            self.save_desk(desk)
+        elif action == 'commit':
+            if self.commit(request, desk):
+                self.save_desk(None)
+        elif action == 'cancel':
+            self.save_desk(None)
+            messages.info(request, "Session closed; nothing was changed.")
+        return redirect('desk_session')
+
+    def open(self, request):
+        mode = request.POST.get('mode')
+        username = request.POST.get('username', '').strip()
+        member = User.objects.filter(username=username).first()
+        if mode not in ('issue', 'return'):
+            messages.error(request, "Choose whether to issue or return books.")
+        elif not member:
+            messages.error(request, "User does not exist.")
+        else:
+            self.save_desk({'mode': mode, 'member_id': member.pk, 'username': member.username, 'items': []})
+
+    def scan(self, request, desk):
+        isbn = request.POST.get('isbn', '').strip()
+        book = Book.objects.filter(isbn=isbn).only('pk', 'title').first()
+        if not book:
+            messages.error(request, f"No book with ISBN {isbn}.")
+            return
+
+        if desk['mode'] == 'issue':
+            item_id = book.pk
+        else:
+            record = BorrowRecord.objects.filter(user_id=desk['member_id'], book=book, status='ISSUED').exclude(
+                pk__in=desk['items']
+            ).only('pk').first()
+            if not record:
+                messages.error(request, f"{desk['username']} has no open loan of '{book.title}'.")
+                return
+            item_id = record.pk
+
+        if item_id in desk['items']:
+            messages.warning(request, f"'{book.title}' is already in this session.")
+            return
+        desk['items'].append(item_id)
+        self.save_desk(desk)
+
+    def commit(self, request, desk):
+        items = self.get_items(desk)
+        if not items:
+            messages.error(request, "No books have been scanned.")
+            return False
+
+        try:
+            if desk['mode'] == 'issue':
+                member = get_object_or_404(User, pk=desk['member_id'])
+                services.issue_books(member, items)
+            else:
+                pay_now = request.POST.get('payment') == 'now'
+                holds = services.return_books(items, pay_now=pay_now, by=request.user)
+        except services.CirculationError as e:
+            messages.error(request, e.message)
+            return False
+
+        if desk['mode'] == 'issue':
+            messages.success(request, f"Issued {len(items)} books to {desk['username']}.")
+        else:
+            fine = sum((record.fine_amount for record in items), Decimal('0.00'))
+            messages.success(request, f"Returned {len(items)} books from {desk['username']}.")
+            if fine:
+                messages.warning(request, f"Fines of ₹{fine} added to account.")
+            for book_id, reservation in holds.items():
+                title = next(record.book.title for record in items if record.book_id == book_id)
+                messages.info(request, f"HOLD ALERT: One copy of '{title}' is reserved for {reservation.user.username}. Please set it aside.")
+        return True
+
+# --- Desk Typeahead Lookups ---
+
+def prefix_q(field, prefix):
+    # Range comparison instead of LIKE so SQLite can walk the (lowercased) column index
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '\U0010ffff'})
+
+class LookupView(LoginRequiredMixin, LibrarianRequiredMixin, View):
+    """Paginated prefix-search JSON endpoint used by the issue/return desk inputs."""
+    default_limit = 10
+    max_limit = 50
+    # Typeahead users refine the prefix long before this; it also keeps OFFSET within an SQL integer
+    max_offset = 10_000
+    cache_max_age = 30
+
+    def get_queryset(self, prefix):
+        raise NotImplementedError
+
+    def get(self, request):
+        prefix = request.GET.get('q', '').strip().lower()
+        try:
+            limit = min(max(int(request.GET.get('limit', self.default_limit)), 1), self.max_limit)
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            return JsonResponse({'error': 'limit and page must be integers'}, status=400)
+
+        offset = (page - 1) * limit
+        if offset > self.max_offset:
+            return JsonResponse({'error': 'page is too large'}, status=400)
+
+        # Fetch one extra row to know whether there is a next page without a COUNT(*)
+        rows = list(self.get_queryset(prefix)[offset:offset + limit + 1])
+
+        response = JsonResponse({
+            'results': rows[:limit],
+            'page': page,
+            'has_next': len(rows) > limit,
+        })
+        patch_cache_control(response, private=True, max_age=self.cache_max_age)
+        return response
+
+class MemberLookupView(LookupView):
+    def get_queryset(self, prefix):
+        queryset = User.objects.order_by('username')
+
+        role = self.request.GET.get('role')
+        if role in User.Role.values:
+            queryset = queryset.filter(role=role)
+
+        if prefix:
+            queryset = queryset.alias(
+                username_lower=Lower('username'),
+                first_name_lower=Lower('first_name'),
+                last_name_lower=Lower('last_name'),
+                email_lower=Lower('email'),
+            ).filter(
+                prefix_q('username_lower', prefix) |
+                prefix_q('first_name_lower', prefix) |
+                prefix_q('last_name_lower', prefix) |
+                prefix_q('email_lower', prefix)
+            )
+
+        return queryset.values('username', 'first_name', 'last_name', 'email', 'role', 'membership_tier__name')
+
+class BookLookupView(LookupView):
+    def get_queryset(self, prefix):
+        queryset = Book.objects.alias(title_lower=Lower('title')).order_by('title_lower')
+
+        if prefix:
+            queryset = queryset.filter(prefix_q('isbn', prefix) | prefix_q('title_lower', prefix))
+
+        return queryset.values('title', 'isbn', 'available_copies', 'status')
+
 class ReservationListView(LoginRequiredMixin, LibrarianRequiredMixin, ListView):
     model = Reservation
     template_name = 'circulation/reservation_list.html'
     context_object_name = 'reservations'
-    queryset = Reservation.objects.filter(status='PENDING').order_by('reserved_date')
+    queryset = Reservation.objects.filter(status='PENDING').select_related('user', 'book').order_by('reserved_date')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['reservations'] = reservations.annotate_waits(context['reservations'])
+        return context
 
 class MemberBorrowListView(LoginRequiredMixin, ListView):
     model = BorrowRecord
@@ -335,4 +436,39 @@ class MemberBorrowListView(LoginRequiredMixin, ListView):
         elif filter_status == 'overdue':
             queryset = queryset.filter(status='ISSUED', due_date__lt=timezone.now())
             
-        return queryset
\ No newline at end of file
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        pending = Reservation.objects.filter(user=self.request.user, status='PENDING').select_related('book')
+        context['reservations'] = reservations.annotate_waits(pending.order_by('reserved_date'))
+        policy = tiers.policy(self.request.user.membership_tier_id)
+        context['max_renewals'] = policy.max_renewals if policy else 1
+        return context
+
+# --- JSON API for kiosks and scanners ---
+
+@method_decorator(ensure_csrf_cookie, name='get')
+class CirculationApiView(LoginRequiredMixin, LibrarianRequiredMixin, View):
+    """
+    GET ?member=<username> returns that member's loan state and sets the CSRF
+    cookie; clients send the token back in the X-CSRFToken header when they
+    POST operations (see circulation.api).
+    """
+    raise_exception = True
+
+    def get(self, request):
+        member_id = User.objects.filter(username=request.GET.get('member', '')).values_list('pk', flat=True).first()
+        if member_id is None:
+            return JsonResponse({'error': 'Unknown member.'}, status=404)
+        return JsonResponse({'members': api.member_state([member_id])})
+
+    def post(self, request):
+        try:
+            payload = json.loads(request.body)
+        except ValueError:
+            return JsonResponse({'error': 'The request body must be JSON.'}, status=400)
+        try:
+            return JsonResponse(api.handle(payload, request.user))
+        except api.OperationError as e:
+            return JsonResponse({'error': e.message}, status=e.status)
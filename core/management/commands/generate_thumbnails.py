@@ -0,0 +1,46 @@
+import time
+from django.core.management.base import BaseCommand
+from books.models import Book
+from accounts.models import User
+from core import thumbnails
+
+TARGETS = {
+    'books': (Book, 'cover_image', ['list', 'detail']),
+    'users': (User, 'profile_image', ['avatar']),
+}
+
+
+class Command(BaseCommand):
+    help = "Generate missing cover and avatar thumbnails for existing media."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=TARGETS.keys(), help="Limit to book covers or user avatars.")
+        parser.add_argument('--force', action='store_true', help="Regenerate even if a manifest already exists.")
+
+    def handle(self, *args, **options):
+        targets = [options['only']] if options['only'] else list(TARGETS)
+        started = time.monotonic()
+        generated = skipped = failed = 0
+
+        for target in targets:
+            model, field_name, sizes = TARGETS[target]
+            names = (
+                model.objects.exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list(field_name, flat=True).iterator(chunk_size=500)
+            )
+            for name in names:
+                try:
+                    manifest = thumbnails.generate(name, sizes, force=options['force'])
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f"Failed {name}: {exc}")
+                    continue
+                if manifest is None:
+                    skipped += 1
+                else:
+                    generated += 1
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated thumbnails for {generated} images ({skipped} already done, {failed} failed) in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_notification_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="dedupe_key",
+            field=models.CharField(blank=True, max_length=100, null=True, unique=True),
+        ),
+    ]
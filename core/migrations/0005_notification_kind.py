@@ -0,0 +1,77 @@
+# Generated by Django 6.0.1 on 2026-10-18 21:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0008_hot_path_indexes"),
+        ("circulation", "0005_reservation_ready_date"),
+        ("core", "0004_notification_dedupe_key"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="book",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notifications",
+                to="books.book",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="borrow_record",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notifications",
+                to="circulation.borrowrecord",
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("MESSAGE", "Message"),
+                    ("BORROWED", "Borrowed"),
+                    ("RETURNED", "Returned"),
+                    ("OVERDUE", "Overdue"),
+                    ("DUE_SOON", "Due soon"),
+                    ("HOLD_READY", "Hold ready"),
+                    ("HOLD_EXPIRED", "Hold expired"),
+                    ("OVERDUE_SUMMARY", "Overdue summary"),
+                ],
+                default="MESSAGE",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="params",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name="notification",
+            name="reservation",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="notifications",
+                to="circulation.reservation",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="notification",
+            name="message",
+            field=models.TextField(blank=True),
+        ),
+    ]
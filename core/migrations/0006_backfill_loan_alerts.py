@@ -0,0 +1,59 @@
+import re
+
+from django.db import migrations
+from django.utils import timezone
+
+# Overdue and due-soon alerts written as free text before notifications had a
+# kind; services.clear_loan_alerts() only finds alerts linked to their loan.
+LEGACY_ALERTS = [
+    ("OVERDUE", re.compile(r"^(?:Warning|OVERDUE ALERT): '(?P<title>.+)' is overdue")),
+    ("DUE_SOON", re.compile(r"^Reminder: '(?P<title>.+)' is due on ")),
+]
+# Keys the overdue sweep gave its alerts: "overdue:<loan>:<date>", "due-soon:<loan>:<date>"
+LEGACY_KEY = re.compile(r"^(?:overdue|due-soon):(?P<loan>\d+):")
+
+
+def link_loan_alerts(apps, schema_editor):
+    """Give legacy alerts their kind and loan, and drop those whose loan is settled."""
+    Notification = apps.get_model("core", "Notification")
+    BorrowRecord = apps.get_model("circulation", "BorrowRecord")
+    legacy = Notification.objects.filter(kind="MESSAGE", borrow_record__isnull=True)
+    stale = []
+    for notification in legacy.iterator():
+        for kind, pattern in LEGACY_ALERTS:
+            match = pattern.match(notification.message)
+            if match:
+                break
+        else:
+            continue
+
+        key = LEGACY_KEY.match(notification.dedupe_key or "")
+        loans = BorrowRecord.objects.filter(user_id=notification.user_id)
+        if key:
+            loans = loans.filter(pk=key["loan"])
+        else:
+            loans = loans.filter(book__title=match["title"]).order_by("-issued_date")
+        # The open loan the alert is about; without one the alert is already settled
+        loan = loans.filter(status="ISSUED").first()
+        if loan is None:
+            stale.append(notification.pk)
+            continue
+        notification.kind = kind
+        notification.borrow_record_id = loan.pk
+        notification.book_id = loan.book_id
+        notification.params = {"due": timezone.localdate(loan.due_date).isoformat()}
+        notification.save(update_fields=["kind", "borrow_record", "book", "params"])
+    for start in range(0, len(stale), 500):
+        Notification.objects.filter(pk__in=stale[start : start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("circulation", "0008_circulation_events"),
+        ("core", "0005_notification_kind"),
+    ]
+
+    operations = [
+        migrations.RunPython(link_loan_alerts, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,4 @@
+import datetime
 from django.db import models
 from django.core.cache import cache
 from django.conf import settings
@@ -33,13 +34,66 @@ class LibraryConfiguration(SingletonModel):
         return "Library Configuration"
 
 class Notification(models.Model):
+    class Kind(models.TextChoices):
+        MESSAGE = 'MESSAGE', 'Message'
+        BORROWED = 'BORROWED', 'Borrowed'
+        RETURNED = 'RETURNED', 'Returned'
+        OVERDUE = 'OVERDUE', 'Overdue'
+        DUE_SOON = 'DUE_SOON', 'Due soon'
+        HOLD_READY = 'HOLD_READY', 'Hold ready'
+        HOLD_EXPIRED = 'HOLD_EXPIRED', 'Hold expired'
+        OVERDUE_SUMMARY = 'OVERDUE_SUMMARY', 'Overdue summary'
+
+    # Text for each structured kind; {title} comes from `book`, the rest from `params`
+    TEMPLATES = {
+        Kind.BORROWED: "You have successfully borrowed '{title}'. Due date: {due}.",
+        Kind.RETURNED: "You have returned '{title}'. Thank you!",
+        Kind.OVERDUE: "Warning: '{title}' is overdue since {due}. Please return it to avoid fines.",
+        Kind.DUE_SOON: "Reminder: '{title}' is due on {due}.",
+        Kind.HOLD_READY: "Good news! '{title}' is now available for you to pick up.",
+        Kind.HOLD_EXPIRED: "Your hold on '{title}' has expired and the copy has been released.",
+        Kind.OVERDUE_SUMMARY: "{count} loans are overdue as of {date}.",
+    }
+    DATE_PARAMS = ('due', 'date')
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
-    message = models.TextField()
+    kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.MESSAGE)
+    # Free text, only for MESSAGE notifications; other kinds are rendered from TEMPLATES
+    message = models.TextField(blank=True)
+    params = models.JSONField(default=dict, blank=True)
+    borrow_record = models.ForeignKey('circulation.BorrowRecord', on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    reservation = models.ForeignKey('circulation.Reservation', on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    book = models.ForeignKey('books.Book', on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set by scheduled jobs so a rerun can't send the same alert twice (e.g. "overdue:<loan>:<date>")
+    dedupe_key = models.CharField(max_length=100, null=True, blank=True, unique=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Unread badge count and unread-first lists
+            models.Index(fields=['user', 'is_read', 'created_at'], name='notification_unread_idx'),
+            # A member's notification list, newest first
+            models.Index(fields=['user', 'created_at'], name='notification_user_date_idx'),
+        ]
+
+    @property
+    def text(self):
+        """The message as shown to the user; render lists with select_related('book')."""
+        template = self.TEMPLATES.get(self.kind)
+        if template is None:
+            return self.message
+        params = dict(self.params)
+        for name in self.DATE_PARAMS:
+            if name in params:
+                params[name] = datetime.date.fromisoformat(params[name]).strftime('%b %d, %Y')
+        if self.book_id:
+            params['title'] = self.book.title
+        try:
+            return template.format(**params)
+        except KeyError:
+            return self.message
 
     def __str__(self):
-        return f"Notification for {self.user.username}: {self.message[:20]}..."
\ No newline at end of file
+        return f"Notification for {self.user.username}: {self.text[:20]}..."
@@ -0,0 +1,214 @@
+"""
+Keyset (cursor) pagination for list views.
+
+OFFSET pagination reads and discards every row before the requested page
+and runs a COUNT(*) per request, so deep pages get slower as tables grow.
+Keyset pagination instead remembers the sort key of the last row shown and
+asks for rows strictly after it, which walks the index from that point and
+costs the same on page 1000 as on page 1.
+"""
+import base64
+import datetime
+import hashlib
+import json
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'), default=_json_default)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, model=None, ordering=None):
+    """
+    (values, reverse) from a cursor token. Given the `model` and `ordering`
+    it pages, each value is also checked and converted by its field, so a
+    tampered or stale cursor raises InvalidCursor rather than a database error.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, reverse = payload['v'], bool(payload.get('r'))
+        if model is not None:
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise InvalidCursor(token)
+            values = [_to_python(model, f, value) for f, value in zip(ordering, values)]
+        return values, reverse
+    except (ValueError, KeyError, TypeError, ValidationError, FieldDoesNotExist):
+        raise InvalidCursor(token)
+
+
+def _to_python(model, ordering_field, value):
+    name = _field_name(ordering_field)
+    field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+    value = field.to_python(value)
+    # keyset_filter() can't compare against NULL
+    if value is None:
+        raise ValueError(ordering_field)
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def _field_name(ordering):
+    return ordering.lstrip('-')
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """
+    Build the WHERE clause selecting rows after `values` in `ordering`:
+    (a > x) OR (a = x AND b > y) OR ... with < for descending fields.
+    """
+    condition = Q()
+    equal_so_far = Q()
+    for ordering_field, value in zip(ordering, values):
+        name = _field_name(ordering_field)
+        descending = ordering_field.startswith('-')
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def approximate_count(queryset, timeout=300):
+    """COUNT(*) cached per distinct query, so repeated page loads don't recount."""
+    sql, params = queryset.query.sql_with_params()
+    key = 'approx-count:' + hashlib.md5(f"{sql}|{params}".encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout)
+    return count
+
+
+class CursorPage:
+    def __init__(self, object_list, ordering, page_size, has_next, has_previous, query_params, count=None):
+        self.object_list = object_list
+        self.ordering = ordering
+        self.page_size = page_size
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.query_params = query_params
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        # An empty page reached through a stale cursor is still a cursor page
+        return True
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _key(self, obj):
+        return [getattr(obj, _field_name(f)) for f in self.ordering]
+
+    def _query(self, token):
+        params = self.query_params.copy()
+        params.pop('page', None)
+        params['cursor'] = token
+        return params.urlencode()
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self._key(self.object_list[-1]))
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self._key(self.object_list[0]), reverse=True)
+        return None
+
+    @property
+    def next_query(self):
+        return self._query(self.next_cursor) if self.next_cursor else ''
+
+    @property
+    def previous_query(self):
+        return self._query(self.previous_cursor) if self.previous_cursor else ''
+
+
+class CursorPaginationMixin:
+    """
+    Opt-in keyset pagination for ListView.
+
+    Views declare `cursor_ordering`, the sort order of the list ending in a
+    unique tie-breaker (usually the pk). Requests that carry a `cursor`
+    parameter (empty for the first page) are paginated by key instead of by
+    OFFSET and skip the COUNT(*), unless `cursor_approximate_count` is set,
+    in which case a cached count is exposed as `cursor_page.count`.
+    """
+    cursor_ordering = None
+    cursor_param = 'cursor'
+    cursor_approximate_count = False
+    cursor_count_timeout = 300
+
+    def use_cursor_pagination(self):
+        return bool(self.cursor_ordering) and self.cursor_param in self.request.GET
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+
+        ordering = list(self.cursor_ordering)
+        token = self.request.GET.get(self.cursor_param)
+        values, reverse = [], False
+        if token:
+            try:
+                values, reverse = decode_cursor(token, queryset.model, ordering)
+            except InvalidCursor:
+                values, reverse = [], False
+
+        count = None
+        if self.cursor_approximate_count:
+            count = approximate_count(queryset, self.cursor_count_timeout)
+
+        if reverse:
+            ordering_sql = [f[1:] if f.startswith('-') else f'-{f}' for f in ordering]
+        else:
+            ordering_sql = ordering
+        page_queryset = queryset.order_by(*ordering_sql)
+        if values:
+            page_queryset = page_queryset.filter(keyset_filter(ordering, values, reverse))
+
+        # One extra row tells us whether another page exists in this direction
+        rows = list(page_queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(values)
+
+        page = CursorPage(rows, ordering, page_size, has_next, has_previous, self.request.GET, count)
+        return (None, page, rows, page.has_other_pages())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        context['cursor_page'] = page if isinstance(page, CursorPage) else None
+        return context
@@ -0,0 +1,16 @@
+from django import template
+from core import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(image, size, ext='jpeg', scale=1):
+    """{% thumbnail_url book.cover_image 'list' %} -> derivative URL (original if not generated yet)."""
+    return thumbnails.derivative_url(image, size, ext, scale)
+
+
+@register.simple_tag
+def thumbnail_srcset(image, size, ext='jpeg'):
+    """{% thumbnail_srcset book.cover_image 'list' 'webp' %} -> 'url 300w, url 600w'."""
+    return thumbnails.srcset(image, size, ext)
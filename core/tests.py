@@ -1,3 +1,210 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from importlib import import_module
+from unittest import mock
+from datetime import timedelta
+from io import BytesIO
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from books.models import Book, Author
+from circulation import services
+from circulation.models import BorrowRecord
+from core.models import Notification
+from core import thumbnails
+from core.pagination import encode_cursor
+from PIL import Image
 
-# Create your tests here.
+User = get_user_model()
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.member = User.objects.create_user(username='member', password='password', role='MEMBER')
+        self.client.login(username='member', password='password')
+
+        # 45 notifications; the last five share a timestamp to exercise the pk tie-breaker
+        now = timezone.now()
+        for i in range(45):
+            n = Notification.objects.create(user=self.member, message=f"Notice {i}")
+            Notification.objects.filter(pk=n.pk).update(created_at=now - timedelta(minutes=min(i, 40)))
+
+    def get_page(self, **params):
+        response = self.client.get(reverse('notifications'), params)
+        return response.context['cursor_page']
+
+    def test_forward_and_backward_walk_is_stable(self):
+        expected = list(Notification.objects.filter(user=self.member).order_by('-created_at', '-pk'))
+
+        first = self.get_page(cursor='')
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+        second = self.get_page(cursor=first.next_cursor)
+        third = self.get_page(cursor=second.next_cursor)
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(first) + list(second) + list(third), expected)
+
+        back = self.get_page(cursor=third.previous_cursor)
+        self.assertEqual(list(back), list(second))
+        self.assertTrue(back.has_previous())
+
+    def test_offset_pagination_is_still_the_default(self):
+        response = self.client.get(reverse('notifications'), {'page': 2})
+        self.assertIsNone(response.context['cursor_page'])
+        self.assertEqual(response.context['page_obj'].number, 2)
+
+    def test_book_list_approximate_count(self):
+        author = Author.objects.create(name="Test Author")
+        for i in range(15):
+            Book.objects.create(title=f"Book {i}", isbn=f"isbn-{i}", author=author, publication_date="2020-01-01")
+
+        response = self.client.get(reverse('book_list'), {'cursor': ''})
+        page = response.context['cursor_page']
+        self.assertEqual(page.count, 15)
+        self.assertEqual(len(page), 12)
+
+        response = self.client.get(reverse('book_list'), {'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['cursor_page']), 3)
+
+
+    def test_malformed_cursor_falls_back_to_the_first_page(self):
+        author = Author.objects.create(name="Test Author")
+        for i in range(3):
+            Book.objects.create(title=f"Book {i}", isbn=f"isbn-{i}", author=author, publication_date="2020-01-01")
+        first = list(self.get_page(cursor=''))
+        for values in (5, ["x", "y"], [None, 1], ["notadate", 1], ["2020-01-01"], ["2020-01-01", 1, 2]):
+            token = encode_cursor(values)
+            self.assertEqual(list(self.get_page(cursor=token)), first, values)
+            response = self.client.get(reverse('book_list'), {'cursor': token})
+            self.assertEqual(len(response.context['cursor_page']), 3, values)
+
+
+def make_image(size=(800, 1200), fmt='PNG', mode='RGBA'):
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, THUMBNAIL_ASYNC=False)
+        self.settings_override.enable()
+        cache.clear()
+        self.author = Author.objects.create(name="Frank Herbert")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        cache.clear()
+
+    def create_book(self, **kwargs):
+        return Book.objects.create(
+            title="Dune", isbn="9780441013593", author=self.author, publication_date="1965-08-01", **kwargs
+        )
+
+    def test_cover_upload_generates_derivatives_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self.create_book(cover_image=SimpleUploadedFile('dune.png', make_image(), 'image/png'))
+
+        manifest = thumbnails.get_manifest(book.cover_image)
+        self.assertEqual(set(manifest['derivatives']), {'list', 'detail'})
+        variant = manifest['derivatives']['list']['webp']['2']
+        self.assertTrue(variant['name'].endswith('.list-2x.webp'))
+        with default_storage.open(variant['name']) as f, Image.open(f) as image:
+            self.assertEqual(image.size, (600, 900))
+            self.assertEqual(image.format, 'WEBP')
+
+        srcset = thumbnails.srcset(book.cover_image, 'list')
+        self.assertIn('.list-1x.jpeg 300w', srcset)
+        self.assertIn('.list-2x.jpeg 600w', srcset)
+
+    def test_saves_without_a_new_image_queue_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self.create_book(cover_image=SimpleUploadedFile('dune.png', make_image(), 'image/png'))
+
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            book.title = "Dune Messiah"
+            book.save()
+            Book.objects.get(pk=book.pk).save()
+            Book.objects.only('pk', 'title').get(pk=book.pk).save(update_fields=['title'])
+        schedule.assert_not_called()
+
+    def test_book_list_falls_back_to_original_until_generated(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            book = self.create_book(cover_image=SimpleUploadedFile('dune.png', make_image(), 'image/png'))
+
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, f'src="{book.cover_image.url}"')
+
+        thumbnails.generate(book.cover_image.name, ['list', 'detail'])
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, '.list-1x.jpeg"')
+        self.assertContains(response, '.list-2x.webp 600w')
+
+    def test_avatar_generated_for_profile_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = User.objects.create_user(
+                username='reader', password='password',
+                profile_image=SimpleUploadedFile('me.jpg', make_image((500, 400), 'JPEG', 'RGB'), 'image/jpeg'),
+            )
+        self.assertTrue(thumbnails.derivative_url(user.profile_image, 'avatar').endswith('.avatar-1x.jpeg'))
+
+
+class NotificationTextTests(TestCase):
+    def setUp(self):
+        self.member = User.objects.create_user(username='member', password='password')
+        author = Author.objects.create(name="Test Author")
+        self.book = Book.objects.create(title="Dune", isbn="9780441013593", author=author, publication_date="1965-08-01")
+
+    def test_structured_kinds_render_at_display_time(self):
+        notification = Notification.objects.create(
+            user=self.member, kind=Notification.Kind.OVERDUE, book=self.book, params={'due': '2026-03-05'}
+        )
+        self.assertEqual(notification.text, "Warning: 'Dune' is overdue since Mar 05, 2026. Please return it to avoid fines.")
+
+        Book.objects.filter(pk=self.book.pk).update(title="Dune (Deluxe)")
+        self.assertIn("'Dune (Deluxe)'", Notification.objects.get(pk=notification.pk).text)
+
+    def test_free_text_messages_are_shown_as_is(self):
+        notification = Notification.objects.create(user=self.member, message="Welcome to the library!")
+        self.assertEqual(notification.text, "Welcome to the library!")
+
+    def test_list_renders_without_a_query_per_row(self):
+        for i in range(5):
+            Notification.objects.create(user=self.member, kind=Notification.Kind.HOLD_READY, book=self.book)
+        self.client.login(username='member', password='password')
+
+        with self.assertNumQueries(5):  # session, user, paginator count, unread badge, page with books
+            response = self.client.get(reverse('notifications'))
+        self.assertContains(response, "Good news! &#x27;Dune&#x27; is now available", count=5)
+
+    def test_legacy_alerts_are_linked_or_dropped(self):
+        backfill = import_module('core.migrations.0006_backfill_loan_alerts')
+        open_loan = BorrowRecord.objects.create(user=self.member, book=self.book)
+        other = Book.objects.create(title="Emma", isbn="9780141439587", author=self.book.author, publication_date="1815-12-23")
+        settled = BorrowRecord.objects.create(user=self.member, book=other, status='RETURNED')
+        overdue = Notification.objects.create(
+            user=self.member, message="Warning: 'Dune' is overdue since Mar 05, 2026. Please return it to avoid fines."
+        )
+        keyed = Notification.objects.create(
+            user=self.member, message="Reminder: 'Dune' is due on Mar 05, 2026.", dedupe_key=f'due-soon:{open_loan.pk}:2026-03-04'
+        )
+        Notification.objects.create(user=self.member, message="OVERDUE ALERT: 'Emma' is overdue.", dedupe_key=f'overdue:{settled.pk}:x')
+        welcome = Notification.objects.create(user=self.member, message="Welcome to the library!")
+
+        backfill.link_loan_alerts(django_apps, None)
+
+        self.assertEqual(
+            set(Notification.objects.values_list('pk', 'kind', 'borrow_record_id')),
+            {(overdue.pk, 'OVERDUE', open_loan.pk), (keyed.pk, 'DUE_SOON', open_loan.pk), (welcome.pk, 'MESSAGE', None)},
+        )
+        services.clear_loan_alerts(open_loan)
+        self.assertEqual(list(Notification.objects.values_list('pk', flat=True)), [welcome.pk])
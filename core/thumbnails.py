@@ -0,0 +1,205 @@
+"""
+Resized WebP/JPEG derivatives for uploaded covers and avatars.
+
+When an image is saved, fixed-size derivatives are rendered with Pillow on a
+background thread after the transaction commits. They are stored next to the
+original under content-hashed names, e.g.
+
+    books/covers/dune.3f2a9c1b0d.list-2x.webp
+
+and listed in a small manifest (`dune.jpg.thumbs.json`) that the template
+tags in core/templatetags/thumbnails.py read (through the cache) to build
+`src`/`srcset` attributes. Images without a manifest fall back to the
+original upload.
+"""
+import hashlib
+import json
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_init, post_save
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height) at 1x; every size is also rendered at 2x
+SIZES = {
+    'list': (300, 450),
+    'detail': (600, 900),
+    'avatar': (96, 96),
+}
+SCALES = (1, 2)
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+MANIFEST_SUFFIX = '.thumbs.json'
+CACHE_TIMEOUT = 60 * 60
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def manifest_name(name):
+    return name + MANIFEST_SUFFIX
+
+
+def _cache_key(name):
+    return 'thumbs:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def _flatten(image):
+    # JPEG has no alpha channel; composite transparent uploads onto white
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def generate(name, sizes, storage=None, force=False):
+    """Render every size/scale/format for the image stored at `name` and write its manifest."""
+    storage = storage or default_storage
+    if not force and storage.exists(manifest_name(name)):
+        return None
+
+    with storage.open(name, 'rb') as original:
+        data = original.read()
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    with Image.open(BytesIO(data)) as opened:
+        image = _flatten(opened)
+
+    directory, filename = posixpath.split(name)
+    stem = filename.rsplit('.', 1)[0]
+    derivatives = {}
+    for size in sizes:
+        width, height = SIZES[size]
+        for scale in SCALES:
+            resized = ImageOps.fit(image, (width * scale, height * scale), Image.LANCZOS)
+            for ext, (pil_format, options) in FORMATS.items():
+                target = posixpath.join(directory, f"{stem}.{digest}.{size}-{scale}x.{ext}")
+                if not storage.exists(target):
+                    buffer = BytesIO()
+                    resized.save(buffer, pil_format, **options)
+                    target = storage.save(target, ContentFile(buffer.getvalue()))
+                derivatives.setdefault(size, {}).setdefault(ext, {})[str(scale)] = {
+                    'name': target,
+                    'width': width * scale,
+                }
+
+    manifest = {'source': name, 'hash': digest, 'derivatives': derivatives}
+    if storage.exists(manifest_name(name)):
+        storage.delete(manifest_name(name))
+    storage.save(manifest_name(name), ContentFile(json.dumps(manifest).encode()))
+    cache.set(_cache_key(name), manifest, CACHE_TIMEOUT)
+    return manifest
+
+
+def _generate_safely(name, sizes):
+    try:
+        generate(name, sizes)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+
+
+def schedule(fieldfile, sizes):
+    """Queue derivative generation for an image once the current transaction commits."""
+    if not fieldfile:
+        return
+    name = fieldfile.name
+
+    def run():
+        if getattr(settings, 'THUMBNAIL_ASYNC', True):
+            _get_executor().submit(_generate_safely, name, sizes)
+        else:
+            generate(name, sizes)
+
+    transaction.on_commit(run)
+
+
+def register(model, field_name, sizes):
+    """
+    Generate derivatives whenever `model.field_name` receives a new image.
+    The stored name is remembered at load time so ordinary saves of the
+    model (stock updates, profile edits) don't queue any work.
+    """
+    attr = f'_thumbnail_source_{field_name}'
+
+    def remember_source(sender, instance, **kwargs):
+        # Read the raw value so deferred fields are not loaded
+        value = instance.__dict__.get(field_name)
+        setattr(instance, attr, getattr(value, 'name', value))
+
+    def queue_on_change(sender, instance, raw=False, update_fields=None, **kwargs):
+        if raw or (update_fields is not None and field_name not in update_fields):
+            return
+        if field_name not in instance.__dict__:
+            return
+        fieldfile = getattr(instance, field_name)
+        if fieldfile and fieldfile.name != getattr(instance, attr, None):
+            schedule(fieldfile, sizes)
+        setattr(instance, attr, fieldfile.name if fieldfile else None)
+
+    uid = f'thumbnails:{model._meta.label}.{field_name}'
+    post_init.connect(remember_source, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(queue_on_change, sender=model, weak=False, dispatch_uid=uid)
+
+
+def get_manifest(fieldfile, storage=None):
+    if not fieldfile:
+        return None
+    name = fieldfile.name
+    manifest = cache.get(_cache_key(name))
+    if manifest is None:
+        storage = storage or default_storage
+        try:
+            with storage.open(manifest_name(name), 'rb') as f:
+                manifest = json.loads(f.read())
+        except (FileNotFoundError, OSError, ValueError):
+            manifest = {}
+        # Cache misses too, so pages listing un-thumbnailed images don't stat on every render
+        cache.set(_cache_key(name), manifest, CACHE_TIMEOUT if manifest else 60)
+    return manifest or None
+
+
+def derivative_url(fieldfile, size, ext='jpeg', scale=1, storage=None):
+    """URL of one derivative, or the original upload if it has not been generated yet."""
+    if not fieldfile:
+        return ''
+    storage = storage or default_storage
+    manifest = get_manifest(fieldfile, storage)
+    try:
+        return storage.url(manifest['derivatives'][size][ext][str(scale)]['name'])
+    except (TypeError, KeyError):
+        return fieldfile.url
+
+
+def srcset(fieldfile, size, ext='jpeg', storage=None):
+    """'url 300w, url 600w' for a derivative size, or '' if not generated yet."""
+    storage = storage or default_storage
+    manifest = get_manifest(fieldfile, storage)
+    try:
+        variants = manifest['derivatives'][size][ext]
+    except (TypeError, KeyError):
+        return ''
+    return ', '.join(
+        f"{storage.url(variant['name'])} {variant['width']}w"
+        for scale, variant in sorted(variants.items())
+    )
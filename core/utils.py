@@ -0,0 +1,17 @@
+import datetime
+from django.utils import timezone
+
+
+def day_range(start, end=None):
+    """
+    Aware [start, end) datetimes covering the local calendar days `start`..`end`.
+
+    Filtering with `field__gte`/`field__lt` on these bounds lets the database
+    use an index on the column; `field__date=...` wraps it in a function and
+    forces a full scan.
+    """
+    end = end or start
+    return (
+        timezone.make_aware(datetime.datetime.combine(start, datetime.time.min)),
+        timezone.make_aware(datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min)),
+    )
@@ -6,6 +6,7 @@ from django.http import JsonResponse
 from .models import Notification, LibraryConfiguration
 from accounts.models import MembershipTier
 from .forms import LibraryConfigurationForm, MembershipTierForm
+from .pagination import CursorPaginationMixin
 
 class AdminRequiredMixin(UserPassesTestMixin):
     def test_func(self):
@@ -62,14 +63,16 @@ class MembershipTierUpdateView(LoginRequiredMixin, AdminRequiredMixin, UpdateVie
 
 # --- Notification Views ---
 
-class NotificationListView(LoginRequiredMixin, ListView):
+class NotificationListView(LoginRequiredMixin, CursorPaginationMixin, ListView):
     model = Notification
     template_name = 'core/notifications.html'
     context_object_name = 'notifications'
     paginate_by = 20
+    cursor_ordering = ('-created_at', '-pk')
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        # The book supplies {title} when a notification's text is rendered
+        return Notification.objects.filter(user=self.request.user).select_related('book')
 
 class MarkNotificationReadView(LoginRequiredMixin, View):
     def post(self, request, pk):
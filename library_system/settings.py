@@ -79,6 +79,16 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            # Take the write lock when a transaction starts, so concurrent
+            # circulation transactions queue (up to `timeout` seconds)
+            # instead of failing when a read lock is upgraded mid-transaction.
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+        },
+        # File-backed test database so tests can open parallel connections
+        # (circulation/tests_concurrency.py); in-memory SQLite can't.
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -121,3 +131,12 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # Media Files (for profile images etc)
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+
+# Cover/avatar derivatives (core/thumbnails.py) are rendered on a background
+# thread pool after commit; set THUMBNAIL_ASYNC = False to render inline.
+THUMBNAIL_ASYNC = True
+THUMBNAIL_WORKERS = 2
+
+# Columnar circulation snapshot (analytics/snapshot.py), refreshed by the
+# snapshot_circulation command and read memory-mapped by analytics/queries.py.
+ANALYTICS_SNAPSHOT_DIR = BASE_DIR / "analytics_snapshot"
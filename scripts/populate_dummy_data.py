@@ -164,7 +164,11 @@ def create_notifications(users):
     librarian, john, jane, bob = users
     
     Notification.objects.create(user=john, message="Welcome to the library! You have borrowed your first book.")
-    Notification.objects.create(user=bob, message="Warning: '1984' is overdue. Please return it to avoid fines.")
+    overdue = BorrowRecord.objects.filter(user=bob, status='ISSUED').first()
+    Notification.objects.create(
+        user=bob, kind=Notification.Kind.OVERDUE, borrow_record=overdue, book=overdue.book,
+        params={'due': timezone.localdate(overdue.due_date).isoformat()},
+    )
     Notification.objects.create(user=jane, message="Your review for 'Foundation' has been posted.")
 
 if __name__ == '__main__':
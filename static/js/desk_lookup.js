@@ -0,0 +1,147 @@
+// Circulation desk lookups: fetch matching members/books on demand from the
+// typeahead endpoints instead of embedding every row in the page.
+
+function debounce(fn, wait) {
+    let timer = null;
+    return function(...args) {
+        clearTimeout(timer);
+        timer = setTimeout(() => fn.apply(this, args), wait);
+    };
+}
+
+async function fetchLookup(url, params) {
+    const query = new URLSearchParams(params);
+    const response = await fetch(`${url}?${query}`, { headers: { 'Accept': 'application/json' } });
+    if (!response.ok) return { results: [], has_next: false };
+    return response.json();
+}
+
+// Searchable dropdown backed by a lookup endpoint.
+// options: { inputId, dropdownId, noResultsId, url, value(row), label(row) }
+function setupLookupSelect(options) {
+    const input = document.getElementById(options.inputId);
+    const dropdown = document.getElementById(options.dropdownId);
+    const noResults = document.getElementById(options.noResultsId);
+    if (!input || !dropdown) return;
+
+    let latestRequest = 0;
+
+    const render = (rows) => {
+        dropdown.querySelectorAll('.lookup-option').forEach(el => el.remove());
+        rows.forEach(row => {
+            const option = document.createElement('div');
+            option.className = 'lookup-option px-4 py-2 hover:bg-gray-100 dark:hover:bg-slate-700 cursor-pointer text-gray-900 dark:text-slate-200';
+            option.textContent = options.label(row);
+            option.addEventListener('click', () => {
+                input.value = options.value(row);
+                dropdown.classList.add('hidden');
+            });
+            dropdown.insertBefore(option, noResults);
+        });
+        noResults.classList.toggle('hidden', rows.length > 0);
+        dropdown.classList.remove('hidden');
+    };
+
+    const search = debounce(async () => {
+        const requestId = ++latestRequest;
+        const data = await fetchLookup(options.url, { q: input.value.trim() });
+        // Drop responses that arrive after a newer keystroke's response
+        if (requestId === latestRequest) render(data.results);
+    }, 150);
+
+    input.addEventListener('input', search);
+    // Show the first page of matches on focus if empty
+    input.addEventListener('focus', () => {
+        if (input.value.length === 0) search();
+    });
+
+    // Hide dropdown on click outside
+    document.addEventListener('click', function(e) {
+        if (!input.contains(e.target) && !dropdown.contains(e.target)) {
+            dropdown.classList.add('hidden');
+        }
+    });
+}
+
+// "Browse Members" table filled page by page from the member lookup endpoint.
+// options: { url, tableBodyId, searchId, roleFilterId, noResultsId, loadMoreId, onSelect(username) }
+function setupMemberBrowser(options) {
+    const body = document.getElementById(options.tableBodyId);
+    const search = document.getElementById(options.searchId);
+    const roleFilter = document.getElementById(options.roleFilterId);
+    const noResults = document.getElementById(options.noResultsId);
+    const loadMore = document.getElementById(options.loadMoreId);
+    if (!body) return;
+
+    const roleBadge = {
+        LIBRARIAN: 'bg-purple-100 text-purple-800 dark:bg-purple-900/30 dark:text-purple-300',
+        ADMIN: 'bg-red-100 text-red-800 dark:bg-red-900/30 dark:text-red-300',
+        MEMBER: 'bg-blue-100 text-blue-800 dark:bg-blue-900/30 dark:text-blue-300',
+    };
+
+    let page = 1;
+    let latestRequest = 0;
+
+    const buildRow = (member) => {
+        const row = document.createElement('tr');
+        row.className = 'hover:bg-gray-50 dark:hover:bg-slate-700/50 transition cursor-pointer member-row';
+
+        const nameCell = document.createElement('td');
+        nameCell.className = 'px-6 py-3 whitespace-nowrap';
+        const fullName = document.createElement('div');
+        fullName.className = 'text-sm font-medium text-gray-900 dark:text-white';
+        fullName.textContent = `${member.first_name} ${member.last_name}`;
+        const handle = document.createElement('div');
+        handle.className = 'text-xs text-gray-500 dark:text-slate-400';
+        handle.textContent = `@${member.username}`;
+        nameCell.append(fullName, handle);
+
+        const roleCell = document.createElement('td');
+        roleCell.className = 'px-6 py-3 whitespace-nowrap';
+        const badge = document.createElement('span');
+        badge.className = `px-2 py-0.5 text-xs font-semibold rounded-full ${roleBadge[member.role] || roleBadge.MEMBER}`;
+        badge.textContent = member.role.charAt(0) + member.role.slice(1).toLowerCase();
+        roleCell.append(badge);
+
+        const emailCell = document.createElement('td');
+        emailCell.className = 'px-6 py-3 whitespace-nowrap text-sm text-gray-500 dark:text-slate-400';
+        emailCell.textContent = member.email;
+
+        const actionCell = document.createElement('td');
+        actionCell.className = 'px-6 py-3 whitespace-nowrap text-right';
+        const button = document.createElement('button');
+        button.type = 'button';
+        button.className = 'text-primary hover:text-[#142f29] dark:text-emerald-400 dark:hover:text-emerald-300 font-medium text-sm';
+        button.textContent = 'Select';
+        actionCell.append(button);
+
+        row.append(nameCell, roleCell, emailCell, actionCell);
+        row.addEventListener('click', () => options.onSelect(member.username));
+        return row;
+    };
+
+    const load = async (reset) => {
+        const requestId = ++latestRequest;
+        page = reset ? 1 : page + 1;
+        const data = await fetchLookup(options.url, {
+            q: search ? search.value.trim() : '',
+            role: roleFilter ? roleFilter.value : '',
+            page: page,
+            limit: 20,
+        });
+        if (requestId !== latestRequest) return;
+
+        if (reset) body.querySelectorAll('.member-row').forEach(el => el.remove());
+        data.results.forEach(member => body.insertBefore(buildRow(member), noResults));
+
+        const empty = body.querySelectorAll('.member-row').length === 0;
+        noResults.classList.toggle('hidden', !empty);
+        if (loadMore) loadMore.classList.toggle('hidden', !data.has_next);
+    };
+
+    if (search) search.addEventListener('input', debounce(() => load(true), 200));
+    if (roleFilter) roleFilter.addEventListener('change', () => load(true));
+    if (loadMore) loadMore.addEventListener('click', () => load(false));
+
+    load(true);
+}